@@ -217,7 +217,14 @@ class EpicsChannel(ChannelObject):
         except Exception:
             self.polling = None
         else:
-            self.command.poll(self.polling, self.command.arg_list, self.value_changed)
+            self.command.poll(
+                self.polling,
+                self.command.arg_list,
+                self.value_changed,
+                compare=Poller.get_comparison(
+                    kwargs.get("comparison"), kwargs.get("deadband")
+                ),
+            )
 
     def value_changed(self, value):
         self.emit("update", value)
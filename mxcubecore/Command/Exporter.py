@@ -22,8 +22,11 @@
 
 # from warnings import warn
 import logging
+import time
+from functools import partial
 
 import gevent
+import numpy
 from gevent.queue import Queue
 
 from mxcubecore.CommandContainer import (
@@ -40,17 +43,91 @@ __license__ = "LGPLv3+"
 EXPORTER_CLIENTS = {}
 
 
-def start_exporter(address, port, timeout=3, retries=1):
-    """Start the exporter"""
+def start_exporter(address, port, timeout=3, retries=1, pipelined=False):
+    """Start the exporter. The exporter clients are shared by address and
+    port: the first call decides if the client is pipelined."""
     global EXPORTER_CLIENTS
     if (address, port) not in EXPORTER_CLIENTS:
-        client = Exporter(address, port, timeout)
+        client = Exporter(address, port, timeout, pipelined=pipelined)
         EXPORTER_CLIENTS[(address, port)] = client
         client.start()
         return client
     return EXPORTER_CLIENTS[(address, port)]
 
 
+def _to_bool(value):
+    """Strict conversion of an exporter boolean"""
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    raise ValueError("Not a boolean: %r" % value)
+
+
+def _to_array(value, item_type=None, as_numpy=False):
+    """Convert an exporter array.
+    Args:
+        value (str): String from the exporter
+        item_type (type): Type of the items, None to keep strings
+        as_numpy (bool): Return a numpy array instead of a list
+    """
+    if not value.startswith(ExporterClient.ARRAY_SEPARATOR):
+        raise ValueError("Not an array: %r" % value)
+    value = value.strip(ExporterClient.ARRAY_SEPARATOR)
+    items = value.split(ExporterClient.ARRAY_SEPARATOR) if value else []
+    if item_type is None:
+        return items
+    if as_numpy:
+        return numpy.array(items, dtype=item_type)
+    return list(map(item_type, items))
+
+
+def _is_int(value):
+    """Check if an exporter value has no decimal point nor exponent"""
+    return value.lstrip("+-").isdigit()
+
+
+def _to_number(value):
+    """Convert an exporter number, int unless it has a decimal point or an
+    exponent (as when the value type is not known).
+    """
+    return int(value) if _is_int(value) else float(value)
+
+
+def _to_numbers(value):
+    """Convert an exporter array of numbers, a list of int unless an item
+    has a decimal point or an exponent (as when the value type is not known).
+    """
+    items = _to_array(value)
+    item_type = int if all(map(_is_int, items)) else float
+    return list(map(item_type, items))
+
+
+# Decoders of the exporter value types. The "int_array" and "float_array"
+# types are decoded to numpy arrays, the other array types to lists.
+VALUE_DECODERS = {
+    "bool": _to_bool,
+    "int": int,
+    "float": float,
+    "str": str,
+    "array": _to_array,
+    "int_list": partial(_to_array, item_type=int),
+    "float_list": partial(_to_array, item_type=float),
+    "int_array": partial(_to_array, item_type=int, as_numpy=True),
+    "float_array": partial(_to_array, item_type=float, as_numpy=True),
+}
+# Decoders of the value types learnt from a first value: the others accept
+# any value. A learnt float (list) still gives int for values without decimal
+# point, as the decoding without learnt type.
+LEARNT_VALUE_DECODERS = {
+    "bool": _to_bool,
+    "int": int,
+    "float": _to_number,
+    "int_list": partial(_to_array, item_type=int),
+    "float_list": _to_numbers,
+}
+
+
 class Exporter(ExporterClient.ExporterClient, object):
     """Exporter class"""
 
@@ -75,13 +152,22 @@ class Exporter(ExporterClient.ExporterClient, object):
     STATE_FAULT = "Fault"
     STATE_UNKNOWN = "Unknown"
 
-    def __init__(self, address, port, timeout=3, retries=1):
-        super(Exporter, self).__init__(address, port, PROTOCOL.STREAM, timeout, retries)
+    def __init__(self, address, port, timeout=3, retries=1, pipelined=False):
+        super(Exporter, self).__init__(
+            address, port, PROTOCOL.STREAM, timeout, retries, pipelined
+        )
 
         self.started = False
         self.callbacks = {}
         self.events_queue = Queue()
         self.events_processing_task = None
+        self.value_types = {}
+        self.last_events = {}
+        self.skipped_events = 0
+        self.coalesced_events = {}
+        self.latest_events = {}
+        self.last_dispatch_times = {}
+        self.merged_events = 0
 
     def start(self):
         """Start"""
@@ -99,10 +185,30 @@ class Exporter(ExporterClient.ExporterClient, object):
         """Read the state"""
         return self.execute("getState")
 
-    def read_property(self, *args, **kwargs):
+    def read_property(self, prop, *args, **kwargs):
         """Read a property"""
-        ret = ExporterClient.ExporterClient.read_property(self, *args, **kwargs)
-        return self._to_python_value(ret)
+        ret = ExporterClient.ExporterClient.read_property(self, prop, *args, **kwargs)
+        return self._to_python_value(ret, prop)
+
+    def read_properties(self, props, *args, **kwargs):
+        """Read several properties at once"""
+        ret = ExporterClient.ExporterClient.read_properties(
+            self, props, *args, **kwargs
+        )
+        return [self._to_python_value(value, prop) for value, prop in zip(ret, props)]
+
+    def set_value_type(self, name, value_type):
+        """Declare the type of the values of a property/event, instead of
+        learning it from the first value.
+        Args:
+            name (str): Property (event) name
+            value_type (str): One of VALUE_DECODERS
+        Raises:
+            ValueError: Unknown type
+        """
+        if value_type not in VALUE_DECODERS:
+            raise ValueError("Unknown exporter value type %r" % value_type)
+        self.value_types[name] = (value_type, True)
 
     def reconnect(self):
         """Reconnect"""
@@ -118,21 +224,64 @@ class Exporter(ExporterClient.ExporterClient, object):
         if not self.events_processing_task:
             self.events_processing_task = gevent.spawn(self.process_events_from_queue)
 
-    def _to_python_value(self, value):
-        """Convert exporter value to python one
+    def set_event_coalescing(self, name, coalesce=True, max_rate=None):
+        """Only dispatch the latest value of an event (latest value wins):
+        the values received while the event waits to be dispatched are
+        merged, instead of being queued.
+        Args:
+            name (str): Event name
+            coalesce (bool): Coalesce the event or not
+            max_rate (float): Maximum dispatch rate [Hz], None for no limit
+        """
+        if coalesce:
+            self.coalesced_events[name] = max_rate
+        else:
+            self.coalesced_events.pop(name, None)
+
+    def get_events_statistics(self):
+        """Get the events processing counters
+        Returns:
+            (dict): Number of queued, skipped (unchanged value) and merged
+                    (coalesced) events.
+        """
+        return {
+            "queued": self.events_queue.qsize(),
+            "skipped": self.skipped_events,
+            "merged": self.merged_events,
+        }
+
+    def _to_python_value(self, value, name=None):
+        """Convert exporter value to python one.
+
+        When the name of the property/event is given, its value type is
+        learnt from the first value (unless declared with set_value_type),
+        and used to decode the next values directly.
         Args:
             value (str): String from the exporter
+            name (str): Property or event name
         """
         if value is None:
             return value
 
+        if name is not None and name in self.value_types:
+            value_type, declared = self.value_types[name]
+            decoders = VALUE_DECODERS if declared else LEARNT_VALUE_DECODERS
+            try:
+                return decoders[value_type](value)
+            except (TypeError, ValueError):
+                if declared:
+                    raise
+
         if "\x1f" in value:
             value = self.parse_array(value)
+            value_type = "array"
             try:
                 value = list(map(int, value))
+                value_type = "int_list"
             except (TypeError, ValueError):
                 try:
                     value = list(map(float, value))
+                    value_type = "float_list"
                 except (TypeError, ValueError):
                     pass
         else:
@@ -148,17 +297,58 @@ class Exporter(ExporterClient.ExporterClient, object):
                         value = float(value)
                     except (TypeError, ValueError):
                         pass
+            value_type = type(value).__name__
+
+        # "str" and "array" decode any value: not learnt, as a later value
+        # may be a number (e.g. a property first read as an empty string)
+        if name is not None:
+            if value_type in LEARNT_VALUE_DECODERS:
+                self.value_types[name] = (value_type, False)
+            else:
+                self.value_types.pop(name, None)
         return value
 
     def on_event(self, name, value, timestamp):
-        """Put the event in the queue
+        """Put the event in the queue, unless the value did not change
         Args:
             name: Name
             value: Value
             timestamp: Timestamp
         """
+        if self.last_events.get(name) == value:
+            self.skipped_events += 1
+            return
+        self.last_events[name] = value
+
+        if name in self.coalesced_events:
+            if name in self.latest_events:
+                # already waiting to be dispatched
+                self.merged_events += 1
+                self.latest_events[name] = value
+                return
+            self.latest_events[name] = value
+            self.events_queue.put((name, None))
+            return
+
         self.events_queue.put((name, value))
 
+    def _pop_coalesced_event(self, name):
+        """Get the latest value of a coalesced event, if it can be dispatched.
+        Args:
+            name (str): Event name
+        Returns:
+            (str): The value, None if the dispatch is delayed (max rate)
+        """
+        max_rate = self.coalesced_events.get(name)
+        if max_rate:
+            now = time.monotonic()
+            delay = self.last_dispatch_times.get(name, 0) + 1.0 / max_rate - now
+            if delay > 0:
+                gevent.spawn_later(delay, self.events_queue.put, (name, None))
+                return None
+            self.last_dispatch_times[name] = now
+        return self.latest_events.pop(name, None)
+
     def process_events_from_queue(self):
         """Process events from the queue"""
         while True:
@@ -167,9 +357,27 @@ class Exporter(ExporterClient.ExporterClient, object):
             except Exception:
                 return
 
-            for cb in self.callbacks.get(name, []):
+            if value is None:
+                value = self._pop_coalesced_event(name)
+                if value is None:
+                    continue
+
+            callbacks = self.callbacks.get(name)
+            if not callbacks:
+                continue
+
+            try:
+                value = self._to_python_value(value, name)
+            except Exception:
+                msg = "Exception while decoding value {!r} of event {}".format(
+                    value, name
+                )
+                logging.exception(msg)
+                continue
+
+            for cb in callbacks:
                 try:
-                    cb(self._to_python_value(value))
+                    cb(value)
                 except Exception:
                     msg = "Exception while executing callback {} for event {}".format(
                         cb, name
@@ -186,7 +394,9 @@ class ExporterCommand(CommandObject):
     ):
         CommandObject.__init__(self, name, username, **kwargs)
         self.command = command
-        self.__exporter = start_exporter(address, port, timeout)
+        self.__exporter = start_exporter(
+            address, port, timeout, pipelined=kwargs.get("pipelined", False)
+        )
         msg = "Attaching Exporter command: {} {}".format(address, name)
         logging.getLogger("HWR").debug(msg)
 
@@ -235,10 +445,19 @@ class ExporterChannel(ChannelObject):
     ):
         ChannelObject.__init__(self, name, username, **kwargs)
 
-        self.__exporter = start_exporter(address, port, timeout)
+        self.__exporter = start_exporter(
+            address, port, timeout, pipelined=kwargs.get("pipelined", False)
+        )
         self.attribute_name = attribute_name
         self.value = None
 
+        value_type = kwargs.get("value_type")
+        if value_type is not None:
+            self.__exporter.set_value_type(attribute_name, value_type)
+        if kwargs.get("coalesce", False):
+            self.__exporter.set_event_coalescing(
+                attribute_name, max_rate=kwargs.get("max_rate")
+            )
         self.__exporter.register(attribute_name, self.update)
 
         msg = "Attaching Exporter channel: {} {} ".format(address, name)
@@ -248,7 +467,8 @@ class ExporterChannel(ChannelObject):
 
     def update(self, value=None):
         """Emit signal update when value changed"""
-        value = value or self.get_value()
+        if value is None:
+            value = self.get_value()
         if isinstance(value, tuple):
             value = list(value)
 
@@ -19,6 +19,8 @@
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import time
+import weakref
 
 import gevent
 import gevent.event
@@ -54,6 +56,222 @@ __license__ = "LGPLv3+"
 
 log = logging.getLogger("HWR")
 
+# Device proxies shared by the channels and commands, by (device name,
+# timeout, polling)
+_device_proxies = {}
+
+# Lower case attribute names, by device name
+_attribute_names = {}
+
+
+def get_device_proxy(device_name, timeout=None, polling=False):
+    """Get the proxy of a Tango device, shared by the channels and commands
+    of the device. The proxy is created, and pinged, at the first call.
+
+    Args:
+        device_name (str): Tango device name
+        timeout (int): Proxy timeout [ms], None for the PyTango default
+        polling (bool): Proxy reading the polled attributes from the poller
+                        threads, kept apart from the other proxies
+
+    Returns:
+        (DeviceProxy): Device proxy
+
+    Raises:
+        PyTango.DevFailed: the proxy could not be created
+        PyTango.ConnectionFailed: the device does not answer
+    """
+    key = (device_name.lower(), timeout, polling)
+    device = _device_proxies.get(key)
+    if device is None:
+        device = DeviceProxy(device_name)
+        if not polling:
+            device.ping()
+        if timeout is not None:
+            device.set_timeout_millis(timeout)
+        _device_proxies[key] = device
+    return device
+
+
+def get_attribute_names(device_name, device):
+    """Get the attribute names of a Tango device, queried once per device
+
+    Args:
+        device_name (str): Tango device name
+        device (DeviceProxy): Proxy of the device
+
+    Returns:
+        (set): Lower case attribute names
+    """
+    key = device_name.lower()
+    names = _attribute_names.get(key)
+    if names is None:
+        names = {attr.name.lower() for attr in device.attribute_list_query()}
+        _attribute_names[key] = names
+    return names
+
+
+def clear_device_proxies():
+    """Forget the shared proxies and attribute names, e.g. to reconnect to
+    restarted devices"""
+    _device_proxies.clear()
+    _attribute_names.clear()
+
+
+class _DevicePoller:
+    """Polls the attributes of the channels of a device polled with the same
+    period, with one read_attributes call per polling period. The values
+    are compared with the previous ones of each channel in the poller
+    thread, and the channels with a new value are updated.
+    """
+
+    # device pollers, by (device name, polling period, read_as_str)
+    _device_pollers = {}
+
+    def __init__(self, device_name, polling_period, read_as_str):
+        self.key = (device_name.lower(), polling_period, read_as_str)
+        self.device_name = device_name
+        self.read_as_str = read_as_str
+        self.device = get_device_proxy(device_name, polling=True)
+        # (attribute name, channel weak reference)
+        self._channels = []
+        self.poller = Poller.poll(
+            self.read,
+            polling_period=polling_period,
+            value_changed_callback=self.update,
+            error_callback=self.failed,
+            compare=lambda changes, _: changes == [],
+        )
+
+    @classmethod
+    def add_channel(cls, channel):
+        """Poll a channel, with the other channels of its device polled with
+        the same period
+
+        Args:
+            channel (TangoChannel): Channel
+        """
+        key = (channel.device_name.lower(), channel.polling, channel.read_as_str)
+        device_poller = cls._device_pollers.get(key)
+        if device_poller is None:
+            device_poller = cls(
+                channel.device_name, channel.polling, channel.read_as_str
+            )
+            cls._device_pollers[key] = device_poller
+        device_poller._channels = device_poller._channels + [
+            (channel.attribute_name, weakref.ref(channel))
+        ]
+        return device_poller
+
+    def _remove_channels(self, channels):
+        self._channels = [
+            (name, channel_ref)
+            for name, channel_ref in self._channels
+            if channel_ref() is not None and channel_ref() not in channels
+        ]
+        if not self._channels:
+            self.poller.stop()
+            self._forget()
+
+    def _forget(self):
+        if self._device_pollers.get(self.key) is self:
+            del self._device_pollers[self.key]
+
+    def _read_attributes(self, names):
+        while True:
+            try:  # in case of tango communication errors, retry reading the attributes
+                if self.read_as_str:
+                    return self.device.read_attributes(
+                        names, PyTango.DeviceAttribute.ExtractAs.String
+                    )
+                return self.device.read_attributes(names)
+            except PyTango.CommunicationFailed:
+                log.warning(
+                    f"error polling {self.device_name} {names} attributes, retrying.",
+                    exc_info=True,
+                )
+
+    def _read_attribute(self, name):
+        """Read one attribute, returning the DevFailed error if it fails"""
+        try:
+            return self._read_attributes([name])[0]
+        except PyTango.ConnectionFailed:
+            raise
+        except PyTango.DevFailed as error:
+            return error
+
+    def read(self):
+        """Read the attributes of all the channels (in the poller thread)
+
+        Returns:
+            (list): (channel weak reference, value, error) of the channels
+                    with a new value or a read error, None if no channel is
+                    left. The poller keeps the last result: the channels are
+                    not referenced, to be garbage collected.
+        """
+        channels = [
+            (name.lower(), channel_ref, channel_ref())
+            for name, channel_ref in self._channels
+            if channel_ref() is not None
+        ]
+        names = list(dict.fromkeys(name for name, _, _ in channels))
+        if not names:
+            # the channels were deleted: the poller is stopped by update
+            return None
+        try:
+            attributes = dict(zip(names, self._read_attributes(names)))
+        except PyTango.ConnectionFailed:
+            raise
+        except PyTango.DevFailed:
+            if len(names) == 1:
+                raise
+            # e.g. an attribute removed from the device: only the channels
+            # of the failing attributes fail
+            attributes = {name: self._read_attribute(name) for name in names}
+
+        changes = []
+        now = time.monotonic()
+        for name, channel_ref, channel in channels:
+            attribute = attributes[name]
+            if isinstance(attribute, PyTango.DevFailed):
+                changes.append((channel_ref, None, attribute))
+            elif attribute.has_failed:
+                changes.append(
+                    (channel_ref, None, PyTango.DevFailed(*attribute.get_err_stack()))
+                )
+            elif channel.polled_value_changed(attribute.value):
+                changes.append((channel_ref, attribute.value, None))
+            else:
+                # the last value is still the current one
+                channel.value_time = now
+        return changes
+
+    def update(self, changes):
+        if changes is None:
+            self._remove_channels(())
+            return
+        failed = []
+        for channel_ref, value, error in changes:
+            channel = channel_ref()
+            if channel is None:
+                continue
+            if error is None:
+                channel.update(value)
+            else:
+                # the channel is no more polled, as a failed poller
+                failed.append(channel)
+                channel.poll_failed(error, self.poller.get_id())
+        if failed:
+            self._remove_channels(failed)
+
+    def failed(self, error, poller_id):
+        # the poller is stopped
+        self._forget()
+        for _, channel_ref in self._channels:
+            channel = channel_ref()
+            if channel is not None:
+                channel.poll_failed(error, poller_id)
+
 
 class TangoCommand(CommandObject):
     def __init__(self, name, command, tangoname=None, username=None, **kwargs):
@@ -63,21 +281,18 @@ class TangoCommand(CommandObject):
         self.device_name = tangoname
         self.device = None
 
-    def init_device(self):
+    def init_device(self, timeout=None):
         try:
-            self.device = DeviceProxy(self.device_name)
+            self.device = get_device_proxy(self.device_name, timeout)
+        except PyTango.ConnectionFailed:
+            self.device = None
+            raise ConnectionError
         except PyTango.DevFailed as traceback:
             last_error = traceback[-1]
             logging.getLogger("HWR").error(
                 "%s: %s", str(self.name()), last_error["desc"]
             )
             self.device = None
-        else:
-            try:
-                self.device.ping()
-            except PyTango.ConnectionFailed:
-                self.device = None
-                raise ConnectionError
 
     def __call__(self, *args, **kwargs):
         self.emit("commandBeginWaitReply", (str(self.name()),))
@@ -111,9 +326,8 @@ class TangoCommand(CommandObject):
         pass
 
     def set_device_timeout(self, timeout):
-        if self.device is None:
-            self.init_device()
-        self.device.set_timeout_millis(timeout)
+        # the proxies are shared: using the proxy with this timeout
+        self.init_device(timeout)
 
     def is_connected(self):
         return self.device is not None
@@ -173,6 +387,23 @@ class TangoChannel(ChannelObject):
         self.polling_events = False
         self.timeout = int(timeout)
         self.read_as_str = kwargs.get("read_as_str", False)
+        self.compare = Poller.get_comparison(
+            kwargs.get("comparison"), kwargs.get("deadband")
+        )
+        self._polled_value = Poller.NotInitializedValue
+        # arrays are emitted as numpy arrays, unless lists are asked for
+        self.as_list = kwargs.get("as_list", False)
+        # time of the last value, and how long [ms] it is used by get_value:
+        # twice the polling period for polled channels, 1 s with events
+        self.value_time = None
+        self.max_age = kwargs.get("max_age")
+        if self.max_age is None:
+            if isinstance(polling, int):
+                self.max_age = 2 * polling
+            elif polling == "events":
+                self.max_age = 1000
+            else:
+                self.max_age = 0
         self._device_initialized = gevent.event.Event()
         self.init_device()
         self.continue_init(None)
@@ -198,14 +429,13 @@ class TangoChannel(ChannelObject):
         # self.init_poller.stop()
 
         if isinstance(self.polling, int):
-            self.raw_device = DeviceProxy(self.device_name)
-
-            Poller.poll(
-                self.poll,
-                polling_period=self.polling,
-                value_changed_callback=self.update,
-                error_callback=self.poll_failed,
-            )
+            if self.device is None:
+                # no such attribute: not polled, not to fail the other
+                # channels of the device
+                return
+            # polled with the other channels of the device, see _DevicePoller
+            device_poller = _DevicePoller.add_channel(self)
+            self.raw_device = device_poller.device
         else:
             if self.polling == "events":
                 # try to register event
@@ -227,7 +457,11 @@ class TangoChannel(ChannelObject):
 
     def init_device(self):
         try:
-            self.device = DeviceProxy(self.device_name)
+            self.device = get_device_proxy(self.device_name, self.timeout)
+        except PyTango.ConnectionFailed:
+            self.imported = True
+            self.device = None
+            raise ConnectionError
         except PyTango.DevFailed as traceback:
             self.imported = False
             last_error = traceback[-1]
@@ -236,24 +470,15 @@ class TangoChannel(ChannelObject):
             )
         else:
             self.imported = True
-            try:
-                self.device.ping()
-            except PyTango.ConnectionFailed:
+            # check that the attribute exists (to avoid Abort in PyTango grrr)
+            attribute_names = get_attribute_names(self.device_name, self.device)
+            if self.attribute_name.lower() not in attribute_names:
+                logging.getLogger("HWR").error(
+                    "no attribute %s in Tango device %s",
+                    self.attribute_name,
+                    self.device_name,
+                )
                 self.device = None
-                raise ConnectionError
-            else:
-                self.device.set_timeout_millis(self.timeout)
-
-                # check that the attribute exists (to avoid Abort in PyTango grrr)
-                if not self.attribute_name.lower() in [
-                    attr.name.lower() for attr in self.device.attribute_list_query()
-                ]:
-                    logging.getLogger("HWR").error(
-                        "no attribute %s in Tango device %s",
-                        self.attribute_name,
-                        self.device_name,
-                    )
-                    self.device = None
 
     def push_event(self, event):
         # logging.getLogger("HWR").debug("%s | attr_value=%s, event.errors=%s, quality=%s", self.name(), event.attr_value, event.errors,event.attr_value is None and "N/A" or event.attr_value.quality)
@@ -272,25 +497,25 @@ class TangoChannel(ChannelObject):
         TangoChannel._tangoEventsQueue.put(ev)
         TangoChannel._tangoEventsProcessingTimer.send()
 
-    def poll(self):
-        def read_attr():
-            if self.read_as_str:
-                value = self.raw_device.read_attribute(
-                    self.attribute_name, PyTango.DeviceAttribute.ExtractAs.String
-                ).value
-            else:
-                value = self.raw_device.read_attribute(self.attribute_name).value
+    def polled_value_changed(self, value):
+        """Compare a polled value with the previous one, as a poller would
 
-            return value
+        Args:
+            value: Polled value
 
-        while True:
-            try:  # in case of tango communication errors, retry reading the attribute
-                return read_attr()
-            except PyTango.CommunicationFailed:
-                log.warning(
-                    f"error polling {self.raw_device} {self.attribute_name} attribute, retrying.",
-                    exc_info=True,
-                )
+        Returns:
+            (bool): True if the value changed
+        """
+        if not self.compare:
+            is_equal = False
+        elif callable(self.compare):
+            is_equal = self.compare(value, self._polled_value)
+        else:
+            is_equal = Poller.values_equal(value, self._polled_value)
+
+        if not is_equal:
+            self._polled_value = value
+        return not is_equal
 
     def poll_failed(self, e, poller_id):
         self.emit("update", None)
@@ -324,38 +549,76 @@ class TangoChannel(ChannelObject):
         self._device_initialized.wait(timeout=3)
         return self.device.get_attribute_config(self.attribute_name)
 
-    def update(self, value=Poller.NotInitializedValue):
-
-        # start with checking if we have a numpy array, as comparing
-        # numpy.ndarray to Poller.NotInitializedValue raises a ValueError exception
+    def convert_value(self, value):
+        """Convert a value read from the device to the emitted one: numpy
+        arrays are kept, or converted to lists with the as_list option, and
+        tuples are converted to lists.
+        """
         if isinstance(value, numpy.ndarray):
-            value = value.tolist()
-        elif value == Poller.NotInitializedValue:
-            value = self.get_value()
-        elif isinstance(value, tuple):
-            value = list(value)
+            return value.tolist() if self.as_list else value
+        if isinstance(value, tuple):
+            return list(value)
+        return value
+
+    def update(self, value=Poller.NotInitializedValue):
+        # check the type first, as comparing a numpy.ndarray to
+        # Poller.NotInitializedValue raises a ValueError exception
+        if isinstance(value, type(Poller.NotInitializedValue)):
+            value = self.read_value()
 
+        value = self.convert_value(value)
         self.value = value
+        self.value_time = time.monotonic()
         self.emit("update", value)
 
-    def get_value(self):
+    def read_value(self):
+        """
+        Returns:
+            Value read from the device, not converted
+        """
         if self.read_as_str:
-            value = self.device.read_attribute(
+            return self.device.read_attribute(
                 self.attribute_name, PyTango.DeviceAttribute.ExtractAs.String
             ).value
-        else:
-            value = self.device.read_attribute(self.attribute_name).value
+        return self.device.read_attribute(self.attribute_name).value
 
-        if isinstance(value, numpy.ndarray):
-            if not numpy.array_equal(value, self.value):
+    def get_value(self, force=False, as_list=False):
+        """Get the channel value: the last polled or event value if it is
+        more recent than max_age, else the value read from the device.
+
+        Args:
+            force (bool): Read the value from the device
+            as_list (bool): Convert a numpy array to a list
+
+        Returns:
+            Value
+        """
+        if (
+            force
+            or self.value_time is None
+            or (time.monotonic() - self.value_time) * 1000 > self.max_age
+        ):
+            value = self.convert_value(self.read_value())
+            if isinstance(value, numpy.ndarray) or isinstance(
+                self.value, numpy.ndarray
+            ):
+                changed = not numpy.array_equal(value, self.value)
+            else:
+                changed = value != self.value
+            if changed:
                 self.update(value)
-        elif value != self.value:
-            self.update(value)
+            else:
+                self.value_time = time.monotonic()
 
+        value = self.value
+        if as_list and isinstance(value, numpy.ndarray):
+            return value.tolist()
         return value
 
     def set_value(self, new_value):
         self.device.write_attribute(self.attribute_name, new_value)
+        # the last value is no more the current one
+        self.value_time = None
 
     def is_connected(self):
         return self.device is not None
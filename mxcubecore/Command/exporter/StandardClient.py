@@ -21,8 +21,10 @@
 """ ProtocolError and StandardClient implementation"""
 import socket
 import sys
+from collections import deque
 
 import gevent
+import gevent.event
 import gevent.lock
 
 __copyright__ = """ Copyright © 2019 by the MXCuBE collaboration """
@@ -66,6 +68,10 @@ else:
     encode = str
 
 MAX_SIZE_STREAM_MSG = 500000
+RECV_SIZE = 65536
+
+STX_BYTE = _bytes([STX])
+ETX_BYTE = _bytes([ETX])
 
 
 class PROTOCOL:
@@ -75,10 +81,83 @@ class PROTOCOL:
     STREAM = 2
 
 
+class FrameParser:
+    """Extract the STX ... ETX framed messages from a stream.
+
+    The received chunks are scanned with bytes.find, the content of an
+    incomplete frame is kept in a bytearray until its ETX arrives. Bytes
+    outside frames are ignored, an STX inside a frame restarts the frame and
+    frames longer than max_size are dropped.
+    """
+
+    def __init__(self, max_size=MAX_SIZE_STREAM_MSG):
+        self.max_size = max_size
+        self.buffer = bytearray()
+        self.in_frame = False
+
+    def feed(self, data):
+        """Parse a received chunk.
+        Args:
+            data(bytes): The chunk
+        Returns:
+            (list): The frames (bytes) completed by the chunk
+        """
+        frames = []
+        view = memoryview(data)
+        size = len(data)
+        pos = 0
+        next_stx = data.find(STX_BYTE)
+
+        while pos < size:
+            if next_stx != -1 and next_stx < pos:
+                next_stx = data.find(STX_BYTE, pos)
+
+            if not self.in_frame:
+                if next_stx == -1:
+                    break
+                self.in_frame = True
+                pos = next_stx + 1
+                continue
+
+            etx = data.find(ETX_BYTE, pos)
+            if next_stx != -1 and (etx == -1 or next_stx < etx):
+                # frame restarted before being completed
+                self.buffer.clear()
+                pos = next_stx + 1
+                continue
+
+            if etx == -1:
+                self.buffer += view[pos:]
+                break
+
+            if self.buffer:
+                self.buffer += view[pos:etx]
+                frames.append(bytes(self.buffer))
+                self.buffer.clear()
+            else:
+                frames.append(data[pos:etx])
+            self.in_frame = False
+            pos = etx + 1
+
+        if len(self.buffer) > self.max_size:
+            self.buffer.clear()
+            self.in_frame = False
+
+        return frames
+
+
 class StandardClient:
-    """Standard JLib client"""
+    """Standard JLib client
 
-    def __init__(self, server_ip, server_port, protocol, timeout, retries):
+    In pipelined mode (stream protocol only), several requests can be in
+    flight on the socket at the same time. The server replies in the order
+    of the requests, so the replies are matched to the pending requests in
+    FIFO order.
+    """
+
+    def __init__(
+        self, server_ip, server_port, protocol, timeout, retries, pipelined=False
+    ):
         self.server_ip = server_ip
         self.server_port = server_port
         self.timeout = timeout
@@ -90,6 +169,8 @@ class StandardClient:
         self.receiving_greenlet = None
         self.msg_received_event = gevent.event.Event()
         self._lock = gevent.lock.Semaphore()
+        self.pipelined = pipelined and protocol == PROTOCOL.STREAM
+        self._pending_replies = deque()
         self.__msg_index__ = -1
         self.__sock = None
         self.__constant_local_port = True
@@ -112,6 +193,14 @@ class StandardClient:
         self._is_connected = False
         self.__sock = None
         self.received_msg = None
+        self.__abort_pending_replies()
+
+    def __abort_pending_replies(self):
+        """Fail all the requests still waiting for a reply (pipelined mode)"""
+        while self._pending_replies:
+            self._pending_replies.popleft().set_exception(
+                SocketError("Socket error: %s" % (self.error or "Disconnected"))
+            )
 
     def connect(self):
         """Socket connect"""
@@ -240,6 +329,10 @@ class StandardClient:
         Args:
             msg(str): Message
         """
+        if self.pipelined:
+            if self._pending_replies:
+                self._pending_replies.popleft().set(msg)
+            return
         self.received_msg = msg
         self.msg_received_event.set()
 
@@ -249,41 +342,22 @@ class StandardClient:
             self.on_connected()
         except Exception:
             pass
-        buffer = empty_buffer()
-        mReceivedSTX = False
+        parser = FrameParser()
         while True:
-            ret = self.__sock.recv(4096)
+            ret = self.__sock.recv(RECV_SIZE)
             if not ret:
                 # connection reset by peer
                 self.error = "Disconnected"
                 self.__close_socket()
                 break
-            for b in ret:
-                if b == STX:
-                    buffer = empty_buffer()
-                    mReceivedSTX = True
-                elif b == ETX:
-                    if mReceivedSTX:
-                        try:
-                            # Unicode decoding exception catching,
-                            # consider errors='ignore'
-                            buffer_utf8 = buffer.decode()
-                        except UnicodeDecodeError as e:
-                            # Syntax not allowed in Python 2
-                            # raise ProtocolError from e
-                            raise ProtocolError(
-                                "UnicodeDecodeError: %s" % (sys.exc_info(),)
-                            )
-                        self.on_message_received(buffer_utf8)
-                        mReceivedSTX = False
-                        buffer = empty_buffer()
-                else:
-                    if mReceivedSTX:
-                        buffer += _bytes([b])
-
-            if len(buffer) > MAX_SIZE_STREAM_MSG:
-                mReceivedSTX = False
-                buffer = empty_buffer()
+            for frame in parser.feed(ret):
+                try:
+                    # Unicode decoding exception catching,
+                    # consider errors='ignore'
+                    msg = frame.decode()
+                except UnicodeDecodeError:
+                    raise ProtocolError("UnicodeDecodeError: %s" % (sys.exc_info(),))
+                self.on_message_received(msg)
         try:
             self.on_disconnected()
         except Exception:
@@ -297,7 +371,7 @@ class StandardClient:
         if not self.is_connected():
             self.connect()
         try:
-            pack = _bytes([STX]) + encode(cmd) + _bytes([ETX])
+            pack = STX_BYTE + encode(cmd) + ETX_BYTE
             self.__sock.send(pack)
         except SocketError:
             self.disconnect()
@@ -323,6 +397,61 @@ class StandardClient:
                 self.msg_received_event.wait()
             return self.received_msg
 
+    def __send_pipelined(self, cmds):
+        """Send commands without waiting for the replies of the previous ones.
+        Args:
+            cmds(list): commands
+        Returns:
+            (list): AsyncResult of the reply of each command
+        """
+        replies = []
+        with self._lock:
+            if not self.is_connected():
+                self.connect()
+            for cmd in cmds:
+                reply = gevent.event.AsyncResult()
+                # queued before sending: the reply may arrive during the send
+                self._pending_replies.append(reply)
+                replies.append(reply)
+                try:
+                    self.__send_stream(cmd)
+                except BaseException:
+                    # e.g. killed during the send: the replies can no more be
+                    # matched to the requests, all the pending requests fail
+                    self.disconnect()
+                    raise
+        return replies
+
+    def __wait_replies(self, replies, timeout=-1):
+        """Wait for the replies of pipelined commands.
+
+        Replies arriving after the timeout are discarded when received.
+        Args:
+            replies(list): AsyncResult of the reply of each command
+            timeout(float): Timeout [s], -1 for the default timeout
+        Returns:
+            (list): replies from the socket
+        Raises:
+            TimeoutError, SocketError
+        """
+        if timeout is not None and timeout < 0:
+            timeout = self.default_timeout
+        with gevent.Timeout(timeout, TimeoutError):
+            return [reply.get() for reply in replies]
+
+    def send_receive_many(self, cmds, timeout=-1):
+        """Send/receive several commands. The commands are pipelined in
+        pipelined mode, sent one after the other otherwise.
+        Args:
+            cmds(list): commands
+            timeout(float): Timeout [s] for all the replies
+        Returns:
+            (list): replies from the socket
+        """
+        if self.pipelined:
+            return self.__wait_replies(self.__send_pipelined(cmds), timeout)
+        return [self.send_receive(cmd, timeout) for cmd in cmds]
+
     def send_receive(self, cmd, timeout=-1):
         """Send/receive command, locking the socket.
         Args:
@@ -330,6 +459,9 @@ class StandardClient:
         Returns:
             (str): reply form the socket
         """
+        if self.pipelined:
+            return self.__wait_replies(self.__send_pipelined([cmd]), timeout)[0]
+
         self._lock.acquire()
         try:
             if (timeout is None) or (timeout >= 0):
@@ -357,7 +489,8 @@ class StandardClient:
             raise ProtocolError(
                 "Protocol error: send command not support in datagram clients"
             )
-        return self.__send_stream(cmd)
+        with self._lock:
+            return self.__send_stream(cmd)
 
     def on_connected(self):
         """On connect"""
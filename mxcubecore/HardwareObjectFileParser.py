@@ -27,6 +27,7 @@ import xml.sax
 from xml.sax.handler import ContentHandler
 
 from mxcubecore import BaseHardwareObjects
+from mxcubecore.utils import config_cache
 
 CURRENT_XML = None
 
@@ -74,7 +75,12 @@ def parse_string(xml_hardware_object, name):
     global CURRENT_XML
     CURRENT_XML = xml_hardware_object
     cur_handler = HardwareObjectHandler(name)
-    xml.sax.parseString(str.encode(xml_hardware_object), cur_handler)
+    if config_cache.get_cache_directory():
+        config_cache.replay_xml_events(
+            config_cache.load_xml_events(xml_hardware_object, name), cur_handler
+        )
+    else:
+        xml.sax.parseString(str.encode(xml_hardware_object), cur_handler)
     return cur_handler.get_hardware_object()
 
 
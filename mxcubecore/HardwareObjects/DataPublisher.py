@@ -18,12 +18,15 @@
 #  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
 import json
 import logging
+import struct
+import time
 from enum import (
     Enum,
     unique,
 )
 
 import gevent
+import numpy
 import redis
 
 from mxcubecore.BaseHardwareObjects import HardwareObject
@@ -65,6 +68,61 @@ class FrameType(Enum):
     STOP = "stop"
 
 
+# Binary frame of a data block: magic, header length, json header (dtype and
+# shape of the (axes, points) array) padded to 8 bytes, then the array data
+BLOCK_MAGIC = b"HWRB"
+BLOCK_HEADER_LENGTH = struct.Struct("<I")
+
+
+def encode_block(xs, ys, zs=None):
+    """
+    Encodes a block of points as a binary frame
+
+    Args:
+        xs (array_like): x values
+        ys (array_like): y values
+        zs (array_like): z values, None for one dimensional data
+
+    Returns:
+        (bytes): The frame
+    """
+    axes = [xs, ys] if zs is None else [xs, ys, zs]
+    block = numpy.ascontiguousarray(numpy.vstack([numpy.ravel(a) for a in axes]))
+
+    header = json.dumps({"dtype": block.dtype.str, "shape": block.shape}).encode()
+    offset = len(BLOCK_MAGIC) + BLOCK_HEADER_LENGTH.size
+    header += b" " * (-(offset + len(header)) % 8)
+
+    return b"".join(
+        (BLOCK_MAGIC, BLOCK_HEADER_LENGTH.pack(len(header)), header, block.tobytes())
+    )
+
+
+def decode_block(frame):
+    """
+    Decodes a binary frame, without copying the data
+
+    Args:
+        frame (bytes): The frame
+
+    Returns:
+        (numpy.ndarray): (axes, points) array, read only, sharing the frame
+                         memory
+    """
+    if frame[: len(BLOCK_MAGIC)] != BLOCK_MAGIC:
+        raise ValueError("Not a data block frame")
+
+    offset = len(BLOCK_MAGIC)
+    (header_length,) = BLOCK_HEADER_LENGTH.unpack_from(frame, offset)
+    offset += BLOCK_HEADER_LENGTH.size
+    header = json.loads(frame[offset : offset + header_length])
+    offset += header_length
+
+    return numpy.frombuffer(
+        frame, dtype=numpy.dtype(header["dtype"]), offset=offset
+    ).reshape(header["shape"])
+
+
 def one_d_data(x, y):
     """
     Convenience function for creating x, y data
@@ -87,8 +145,24 @@ class DataPublisher(HardwareObject):
     def __init__(self, name):
         super(DataPublisher, self).__init__(name)
         self._r = None
+        # Connection without response decoding, for the binary frames
+        self._r_raw = None
         self._subsribe_task = None
 
+        # The descriptions of active sources for fast access
+        # while publishing data
+        self._active_source_desc = {}
+        # Local cache of the source descriptions
+        self._descriptions = {}
+
+        # Data points waiting to be written, by source id and axis
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_since = None
+        # Maximum number of pending points, and time [ms] they are kept
+        self._write_batch_size = 500
+        self._write_interval = 100
+
     def init(self):
         """
         FWK2 Init method
@@ -98,10 +172,13 @@ class DataPublisher(HardwareObject):
         rhost = self.get_property("host", "localhost")
         rport = self.get_property("port", 6379)
         rdb = self.get_property("db", 11)
+        self._write_batch_size = self.get_property("write_batch_size", 500)
+        self._write_interval = self.get_property("write_interval", 100)
 
         self._r = redis.Redis(
             host=rhost, port=rport, db=rdb, charset="utf-8", decode_responses=True
         )
+        self._r_raw = redis.Redis(host=rhost, port=rport, db=rdb)
 
         if not self._subsribe_task:
             self._subsribe_task = gevent.spawn(self._handle_messages)
@@ -110,64 +187,98 @@ class DataPublisher(HardwareObject):
         """
         Listens for published data and handles the data.
         """
-        pubsub = self._r.pubsub(ignore_subscribe_messages=True)
-        pubsub.psubscribe("HWR_DP_NEW_DATA_POINT_*")
+        # Binary data blocks and json frames, decoded by _handle_message
+        pubsub = self._r_raw.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe("HWR_DP_NEW_DATA_POINT_*", "HWR_DP_NEW_DATA_BLOCK_*")
 
-        _data = {}
+        while True:
+            # Wakes up at least every write interval to write the pending data
+            message = pubsub.get_message(timeout=self._write_interval / 1000.0)
 
-        # The descriptions of active sources for fast access
-        # while publishing data
-        active_source_desc = {}
-
-        for message in pubsub.listen():
             if message:
-                try:
-                    redis_channel = message["channel"]
-                    _id = redis_channel.split("_")[-1]
-
-                    data = json.loads(message["data"])
-
-                    if data["type"] == FrameType.START.value:
-                        _data[redis_channel] = {"x": [], "y": []}
-
-                        self._update_description(_id, {"running": True})
-
-                        # Clear previous data so that we are not acumelating
-                        # with previously published data
-                        self._clear_data(_id)
-
-                        self.emit(
-                            "start", self.get_description(_id, include_data=True)[0]
-                        )
-
-                        active_source_desc[redis_channel] = self._get_description(_id)
-
-                    elif data["type"] == FrameType.STOP.value:
-                        self._update_description(_id, {"running": False})
-                        self.emit(
-                            "end", self.get_description(_id, include_data=True)[0]
-                        )
-                        active_source_desc.pop(redis_channel)
-                    elif data["type"] == FrameType.DATA.value:
-                        _data[redis_channel] = {
-                            "x": _data[redis_channel]["x"] + [data["data"]["x"]],
-                            "y": _data[redis_channel]["y"] + [data["data"]["y"]],
-                        }
-
-                        self.emit(
-                            "data",
-                            {"id": _id, "data": data["data"]},
-                        )
-
-                        self._append_data(
-                            _id, data["data"], active_source_desc[redis_channel]
-                        )
-                    else:
-                        msg = "Unknown frame type %s" % message
-                        logging.getLogger("HWR").error(msg)
-                except Exception:
-                    msg = "Could not parse data in %s" % message
-                    logging.getLogger("HWR").exception(msg)
+                self._handle_message(message)
+
+            try:
+                self._flush_data(self._write_interval)
+            except Exception:
+                # the data is kept pending, written again at the next flush
+                logging.getLogger("HWR").exception("Could not write the published data")
+
+    def _handle_message(self, message):
+        """
+        Handles a published data frame
+
+        Args:
+            message (dict): Redis pub/sub message
+        """
+        try:
+            redis_channel = message["channel"]
+
+            if isinstance(redis_channel, bytes):
+                redis_channel = redis_channel.decode()
+
+            _id = redis_channel.split("_")[-1]
+
+            if redis_channel.startswith("HWR_DP_NEW_DATA_BLOCK_"):
+                self._handle_block(_id, decode_block(message["data"]))
+                return
+
+            data = json.loads(message["data"])
+
+            if data["type"] == FrameType.START.value:
+                # Data of a previous run still to be written
+                self._flush_data()
+
+                # The source may have been registered again, by another
+                # process: reading its description once per run
+                self._descriptions.pop(_id, None)
+                self._update_description(_id, {"running": True})
+
+                # Clear previous data so that we are not acumelating
+                # with previously published data
+                self._clear_data(_id)
+
+                desc = self._get_description(_id)
+                desc["values"] = self._empty_data(desc)
+                self.emit("start", desc)
+
+                self._active_source_desc[redis_channel] = self._get_description(_id)
+
+            elif data["type"] == FrameType.STOP.value:
+                self._flush_data()
+                self._update_description(_id, {"running": False})
+                self.emit("end", self.get_description(_id, include_data=True)[0])
+                self._active_source_desc.pop(redis_channel)
+            elif data["type"] == FrameType.DATA.value:
+                self.emit(
+                    "data",
+                    {"id": _id, "data": data["data"]},
+                )
+
+                self._append_data(
+                    _id, data["data"], self._active_source_desc[redis_channel]
+                )
+            else:
+                msg = "Unknown frame type %s" % message
+                logging.getLogger("HWR").error(msg)
+        except Exception:
+            msg = "Could not parse data in %s" % message
+            logging.getLogger("HWR").exception(msg)
+
+    def _handle_block(self, _id, block):
+        """
+        Handles a block of data points
+
+        Args:
+            _id (str): The id of the source
+            block (numpy.ndarray): (axes, points) array
+        """
+        redis_channel = "HWR_DP_NEW_DATA_POINT_%s" % _id
+        data = dict(zip(("x", "y", "z"), block))
+
+        self.emit("data_block", {"id": _id, "data": data})
+
+        self._append_block(_id, data, self._active_source_desc[redis_channel])
 
     def _remove_available(self, _id):
         """
@@ -225,6 +336,7 @@ class DataPublisher(HardwareObject):
                          "running": boolean,
         """
         self._r.set("HWR_DP_%s_DESCRIPTION" % _id, json.dumps(desc))
+        self._descriptions[_id] = desc
 
     def _get_description(self, _id):
         """
@@ -243,7 +355,14 @@ class DataPublisher(HardwareObject):
                      "meta": str
                      "running": boolean,
         """
-        return json.loads(self._r.get("HWR_DP_%s_DESCRIPTION" % _id))
+        desc = self._descriptions.get(_id)
+
+        if desc is None:
+            desc = json.loads(self._r.get("HWR_DP_%s_DESCRIPTION" % _id))
+            self._descriptions[_id] = desc
+
+        # a copy: the callers add the values or update it
+        return dict(desc)
 
     def _update_description(self, _id, data):
         """
@@ -258,18 +377,89 @@ class DataPublisher(HardwareObject):
 
     def _append_data(self, _id, data, desc):
         """
-        Append data to source with _id
+        Append data to source with _id, the data being written by
+        _flush_data
 
         Args:
             _id (str): The id of the source to remove
             desc (dict): Publisher description
             data: x, y, (z) data to append
         """
-        self._r.rpush("HWR_DP_%s_DATA_X" % _id, data.get("x", float("nan")))
-        self._r.rpush("HWR_DP_%s_DATA_Y" % _id, data.get("y", float("nan")))
+        pending = self._pending.get(_id)
+
+        if pending is None:
+            pending = self._pending[_id] = {"X": [], "Y": [], "Z": []}
+
+        pending["X"].append(data.get("x", float("nan")))
+        pending["Y"].append(data.get("y", float("nan")))
 
         if desc["data_dim"] > 1:
-            self._r.rpush("HWR_DP_%s_DATA_Z" % _id, data.get("z", float("nan")))
+            pending["Z"].append(data.get("z", float("nan")))
+
+        if not self._pending_count:
+            self._pending_since = time.monotonic()
+
+        self._pending_count += 1
+
+        if self._pending_count >= self._write_batch_size:
+            self._flush_data()
+
+    def _append_block(self, _id, data, desc):
+        """
+        Append a block of data to source with _id, written with one rpush
+        per axis
+
+        Args:
+            _id (str): The id of the source
+            data (dict): x, y, (z) arrays
+            desc (dict): Publisher description
+        """
+        pending = self._pending.get(_id)
+
+        if pending is None:
+            pending = self._pending[_id] = {"X": [], "Y": [], "Z": []}
+
+        size = len(data["x"])
+        axes = ("x", "y", "z") if desc["data_dim"] > 1 else ("x", "y")
+
+        for axis in axes:
+            values = data.get(axis)
+            pending[axis.upper()].extend(
+                [float("nan")] * size if values is None else values.tolist()
+            )
+
+        if not self._pending_count:
+            self._pending_since = time.monotonic()
+
+        self._pending_count += size
+        self._flush_data()
+
+    def _flush_data(self, min_age=0):
+        """
+        Write the pending data, with one rpush per source and axis sent in
+        a pipeline
+
+        Args:
+            min_age (float): Only write if the first pending point is older
+                             than min_age [ms]
+        """
+        if not self._pending_count:
+            return
+
+        if (time.monotonic() - self._pending_since) * 1000 < min_age:
+            return
+
+        pipe = self._r.pipeline(transaction=False)
+
+        for _id, pending in self._pending.items():
+            for axis, values in pending.items():
+                if values:
+                    pipe.rpush("HWR_DP_%s_DATA_%s" % (_id, axis), *values)
+
+        pipe.execute()
+        self._pending = {}
+        self._pending_count = 0
+        self._pending_since = None
 
     def _clear_data(self, _id):
         """
@@ -293,6 +483,18 @@ class DataPublisher(HardwareObject):
         """
         self._r.publish("HWR_DP_NEW_DATA_POINT_%s" % _id, json.dumps(data))
 
+    def _empty_data(self, desc):
+        """
+        Returns:
+            (dict): The data of a source without data
+        """
+        data = {"x": [], "y": []}
+
+        if desc["data_dim"] > 1:
+            data["z"] = []
+
+        return data
+
     def register(
         self,
         _id,
@@ -331,6 +533,18 @@ class DataPublisher(HardwareObject):
     def pub(self, _id, data):
         self._publish(_id, {"type": FrameType.DATA.value, "data": data})
 
+    def pub_block(self, _id, xs, ys, zs=None):
+        """
+        Publish a block of points as one binary frame
+
+        Args:
+            _id (str): The id of the source
+            xs (array_like): x values
+            ys (array_like): y values
+            zs (array_like): z values, for two dimensional data
+        """
+        self._r.publish("HWR_DP_NEW_DATA_BLOCK_%s" % _id, encode_block(xs, ys, zs))
+
     def start(self, _id):
         self._publish(_id, {"type": FrameType.START.value, "data": {}})
 
@@ -363,6 +577,8 @@ class DataPublisher(HardwareObject):
         return desc
 
     def get_data(self, _id):
+        # include the data not written yet
+        self._flush_data()
         desc = self._get_description(_id)
         data = {
             "x": self._r.lrange("HWR_DP_%s_DATA_X" % _id, 0, -1),
@@ -0,0 +1,260 @@
+#
+#  Project: MXCuBE
+#  https://github.com/mxcube
+#
+#  This file is part of MXCuBE software.
+#
+#  MXCuBE is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  MXCuBE is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU General Lesser Public License
+#  along with MXCuBE. If not, see <http://www.gnu.org/licenses/>.
+
+"""Shares the frames of a video device between several consumers.
+
+The broker is the only one reading the camera: it keeps the last frames in
+a ring buffer and sends them to the subscribed consumers, each one with its
+own maximum rate, scale and encoding. The conversions are memoised per
+frame (see mxcubecore.utils.video_frame), so consumers asking for the same
+conversion of a frame share it.
+
+The camera is either a video device providing get_frame (VideoFrame), as
+TangoLimaVideo, or any device providing get_last_image (data, width, height).
+
+The broker is used by the video consumers in place of the camera: it
+provides get_frame (loop detection, see sample_centring), get_last_image
+(snapshots, see SampleView), get_width, get_height, and emits the
+imageReceived signal (video display) while it is connected.
+
+Example configuration:
+----------------------
+<object class="FrameBroker">
+  <object href="/camera" role="camera"/>
+  <!-- polling interval [ms] -->
+  <interval>40</interval>
+  <!-- number of frames kept -->
+  <ring_size>8</ring_size>
+</object>
+
+and, in the sample view configuration:
+  <object href="/frame-broker" role="camera"/>
+"""
+
+import itertools
+import logging
+import time
+from collections import deque
+
+import gevent
+
+from mxcubecore.BaseHardwareObjects import HardwareObject
+from mxcubecore.utils.video_frame import VideoFrame
+
+__copyright__ = """ Copyright © 2010 - 2024 by MXCuBE Collaboration """
+__license__ = "LGPLv3+"
+
+
+class _Subscription:
+    def __init__(self, callback, max_fps, scale, encoding, quality):
+        self.callback = callback
+        self.period = 1.0 / max_fps if max_fps else 0
+        self.scale = scale
+        self.encoding = encoding
+        self.quality = quality
+        self.last_sent = None
+        self.last_frame_number = None
+
+
+class FrameBroker(HardwareObject):
+    """Frame broker"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._camera = None
+        self._interval = 0.04
+        self._frames = deque(maxlen=8)
+        self._subscriptions = {}
+        self._subscription_ids = itertools.count(1)
+        self._polling = None
+        self._frame_numbers = itertools.count()
+        self._last_image = None
+        self._image_subscription = None
+
+    def init(self):
+        super().init()
+        self._camera = self.get_object_by_role("camera")
+        self._interval = self.get_property("interval", 40) / 1000.0
+        self._frames = deque(maxlen=self.get_property("ring_size", 8))
+
+    @property
+    def camera(self):
+        """Video device the frames come from"""
+        return self._camera
+
+    def _read_frame(self):
+        if hasattr(self._camera, "get_frame"):
+            return self._camera.get_frame()
+
+        image = self._camera.get_last_image()
+        if self._last_image is not None and image[0] is self._last_image[0]:
+            # same image object, not a new frame
+            return self._frames[-1]
+        self._last_image = image
+        data, width, height = image[:3]
+        return VideoFrame.from_image(next(self._frame_numbers), data, width, height)
+
+    def grab(self):
+        """Read the camera, keeping the frame if it is a new one
+
+        Returns:
+            (VideoFrame): Last frame
+        """
+        frame = self._read_frame()
+        if not self._frames or frame is not self._frames[-1]:
+            if frame.timestamp is None:
+                frame.timestamp = time.time()
+            self._frames.append(frame)
+        return frame
+
+    def get_frames(self):
+        """
+        Returns:
+            (list): Frames of the ring buffer, the oldest first
+        """
+        return list(self._frames)
+
+    def get_frame(self, encoding=None, scale=1.0, quality=80):
+        """Get the last frame, optionally converted. The camera is read
+        unless the broker is polling it for its subscribers.
+
+        Args:
+            encoding (str): Conversion (see VideoFrame.convert), None for
+                            the VideoFrame
+            scale (float): Scale factor
+            quality (int): JPEG quality
+
+        Returns:
+            (VideoFrame, bytes or numpy.ndarray): Frame or converted frame
+        """
+        if self._polling is None or not self._frames:
+            frame = self.grab()
+        else:
+            frame = self._frames[-1]
+        if encoding is None:
+            return frame
+        return frame.convert(encoding, scale, quality)
+
+    def get_last_image(self):
+        """Get the last frame, as done by the cameras
+
+        Returns:
+            (tuple): RGB image data (bytes), width and height
+        """
+        frame = self.get_frame()
+        return self._image_data(frame), frame.width, frame.height
+
+    @staticmethod
+    def _image_data(frame):
+        if frame.mode is None:
+            # no known conversion: the camera data, as sent by the camera
+            return frame.tobytes()
+        return frame.convert("rgb")
+
+    def get_width(self):
+        return self._camera.get_width()
+
+    def get_height(self):
+        return self._camera.get_height()
+
+    def connect_notify(self, signal):
+        if signal == "imageReceived" and self._image_subscription is None:
+            self._image_subscription = self.subscribe(
+                self._image_received, encoding=None
+            )
+
+    def disconnect_notify(self, signal):
+        if signal == "imageReceived" and self._image_subscription is not None:
+            self.unsubscribe(self._image_subscription)
+            self._image_subscription = None
+
+    def _image_received(self, frame, _):
+        self.emit(
+            "imageReceived", self._image_data(frame), frame.width, frame.height, False
+        )
+
+    def subscribe(self, callback, max_fps=None, scale=1.0, encoding="jpeg", quality=80):
+        """Receive the new frames. The camera is polled as long as there are
+        subscribers.
+
+        Args:
+            callback (callable): Called with the converted frame and the
+                                 VideoFrame
+            max_fps (float): Maximum rate, None for all the frames
+            scale (float): Scale factor
+            encoding (str): Conversion (see VideoFrame.convert), None for
+                            the VideoFrame
+            quality (int): JPEG quality
+
+        Returns:
+            (int): Subscription id
+        """
+        subscription_id = next(self._subscription_ids)
+        self._subscriptions[subscription_id] = _Subscription(
+            callback, max_fps, scale, encoding, quality
+        )
+        if self._polling is None:
+            self._polling = gevent.spawn(self._do_polling)
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        """Stop receiving frames
+
+        Args:
+            subscription_id (int): Subscription id, as returned by subscribe
+        """
+        self._subscriptions.pop(subscription_id, None)
+        if not self._subscriptions and self._polling is not None:
+            self._polling.kill()
+            self._polling = None
+
+    def _dispatch(self, frame):
+        now = time.time()
+        for subscription in list(self._subscriptions.values()):
+            if subscription.last_frame_number == frame.frame_number:
+                continue
+            if (
+                subscription.last_sent is not None
+                and now - subscription.last_sent < subscription.period
+            ):
+                continue
+            subscription.last_sent = now
+            subscription.last_frame_number = frame.frame_number
+            try:
+                if subscription.encoding is None:
+                    data = frame
+                else:
+                    data = frame.convert(
+                        subscription.encoding, subscription.scale, subscription.quality
+                    )
+                subscription.callback(data, frame)
+            except Exception:
+                logging.getLogger("HWR").exception(
+                    "%s: error sending frame %d", self.name(), frame.frame_number
+                )
+
+    def _do_polling(self):
+        while True:
+            try:
+                self._dispatch(self.grab())
+            except Exception:
+                logging.getLogger("HWR").exception(
+                    "%s: error reading the camera", self.name()
+                )
+            gevent.sleep(self._interval)
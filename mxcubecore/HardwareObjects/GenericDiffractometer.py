@@ -1045,45 +1045,79 @@ class GenericDiffractometer(HardwareObject):
     def motor_positions_to_screen(self, centred_positions_dict):
         """ """
         if self.use_sample_centring:
-            self.update_zoom_calibration()
-            if None in (self.pixels_per_mm_x, self.pixels_per_mm_y):
-                return 0, 0
-            phi_angle = math.radians(
-                self.centring_phi.direction * self.centring_phi.get_value()
-            )
-            sampx = self.centring_sampx.direction * (
-                centred_positions_dict["sampx"] - self.centring_sampx.get_value()
-            )
-            sampy = self.centring_sampy.direction * (
-                centred_positions_dict["sampy"] - self.centring_sampy.get_value()
-            )
-            phiy = self.centring_phiy.direction * (
-                centred_positions_dict["phiy"] - self.centring_phiy.get_value()
-            )
-            phiz = self.centring_phiz.direction * (
-                centred_positions_dict["phiz"] - self.centring_phiz.get_value()
-            )
-            rot_matrix = numpy.matrix(
+            x, y = self._motor_positions_to_screen([centred_positions_dict])[0]
+            return x, y
+        else:
+            raise NotImplementedError
+
+    def motor_positions_list_to_screen(self, centred_positions_list):
+        """Get the screen positions of a list of centred positions, in one
+        go: the motor positions and the rotation are read once for all of
+        them.
+
+        Args:
+            centred_positions_list (list): Centred positions (dict motor
+                                           name: position)
+
+        Returns:
+            (numpy.ndarray): (N, 2) array of screen positions [pixel]
+        """
+        centred_positions_list = list(centred_positions_list)
+        if (
+            type(self).motor_positions_to_screen
+            is GenericDiffractometer.motor_positions_to_screen
+            and self.use_sample_centring
+        ):
+            return self._motor_positions_to_screen(centred_positions_list)
+
+        # specific projection, one position at a time
+        return numpy.array(
+            [
+                self.motor_positions_to_screen(centred_positions_dict)
+                for centred_positions_dict in centred_positions_list
+            ],
+            dtype=float,
+        ).reshape(-1, 2)
+
+    def _motor_positions_to_screen(self, centred_positions_list):
+        self.update_zoom_calibration()
+        if None in (self.pixels_per_mm_x, self.pixels_per_mm_y):
+            return numpy.zeros((len(centred_positions_list), 2))
+
+        motors = (
+            self.centring_sampx,
+            self.centring_sampy,
+            self.centring_phiy,
+            self.centring_phiz,
+        )
+        positions = numpy.array(
+            [
                 [
-                    math.cos(phi_angle),
-                    -math.sin(phi_angle),
-                    math.sin(phi_angle),
-                    math.cos(phi_angle),
+                    centred_positions_dict[name]
+                    for name in ("sampx", "sampy", "phiy", "phiz")
                 ]
-            )
-            rot_matrix.shape = (2, 2)
-            inv_rot_matrix = numpy.array(rot_matrix.I)
-            dx, dy = (
-                numpy.dot(numpy.array([sampx, sampy]), inv_rot_matrix)
-                * self.pixels_per_mm_x
-            )
+                for centred_positions_dict in centred_positions_list
+            ],
+            dtype=float,
+        ).reshape(-1, 4)
+        current_positions = numpy.array(
+            [motor.get_value() for motor in motors], dtype=float
+        )
+        directions = numpy.array([motor.direction for motor in motors], dtype=float)
+        sampx, sampy, phiy, phiz = ((positions - current_positions) * directions).T
 
-            x = (phiy * self.pixels_per_mm_x) + self.beam_position[0]
-            y = dy + (phiz * self.pixels_per_mm_y) + self.beam_position[1]
+        phi_angle = math.radians(
+            self.centring_phi.direction * self.centring_phi.get_value()
+        )
+        # vertical component of [sampx, sampy] rotated by -phi
+        dy = (
+            sampx * math.sin(phi_angle) + sampy * math.cos(phi_angle)
+        ) * self.pixels_per_mm_x
 
-            return x, y
-        else:
-            raise NotImplementedError
+        x = (phiy * self.pixels_per_mm_x) + self.beam_position[0]
+        y = dy + (phiz * self.pixels_per_mm_y) + self.beam_position[1]
+
+        return numpy.column_stack((x, y))
 
     def move_to_centred_position(self, centred_position):
         """ """
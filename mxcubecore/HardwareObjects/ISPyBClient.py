@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+import atexit
 import itertools
 import json
 import os
@@ -20,12 +21,20 @@ except Exception:
     from urllib.error import URLError
 
 from suds import WebFault
-from suds.client import Client
 from suds.sudsobject import asdict
+from suds.transport import TransportError
 
 from mxcubecore import HardwareRepository as HWR
 from mxcubecore.BaseHardwareObjects import HardwareObject
+from mxcubecore.utils import config_cache
+from mxcubecore.utils.batch_uploader import BatchUploader
 from mxcubecore.utils.conversion import string_types
+from mxcubecore.utils.soap_client import (
+    ClientRegistry,
+    PooledTransport,
+    WebServiceTimings,
+    get_wsdl_cache,
+)
 
 """
 A client for ISPyB Webservices.
@@ -59,6 +68,9 @@ _WS_AUTOPROC_URL = _WSDL_ROOT + "ToolsForAutoprocessingWebService?wsdl"
 _WS_USERNAME = None
 _WS_PASSWORD = None
 
+# Web service clients, shared by ISPyBClient and ISPyBValueFactory
+_WS_CLIENTS = ClientRegistry()
+
 _CONNECTION_ERROR_MSG = (
     "Could not connect to ISPyB, please verify that "
     + "the server is running and that your "
@@ -72,6 +84,79 @@ SampleReference = namedtuple(
 )
 
 
+class SampleReferenceIndex:
+    """
+    The samples of the sample changer (SampleReference), indexed by
+    datamatrix code and by location, so that the ISPyB samples are matched
+    in constant time. The matched samples are removed from the index.
+    """
+
+    def __init__(self, sample_refs):
+        self._sample_refs = list(sample_refs)
+        self._removed = set()
+        self._positions = {}
+        self._by_code = {}
+        self._by_location = {}
+
+        for position, sample_ref in enumerate(self._sample_refs):
+            self._positions[id(sample_ref)] = position
+            self._by_code.setdefault(sample_ref.code, []).append(position)
+            self._by_location.setdefault(
+                (sample_ref.container_reference, sample_ref.sample_reference), []
+            ).append(position)
+
+    def find(self, code=None, location=None):
+        """
+        Returns the first remaining sample with the matching "search criteria"
+        <code> and/or <location>, as a linear search of the sample list would.
+
+        :param code: The vial datamatrix code (or bar code)
+        :param type: str
+
+        :param location: A tuple (<basket>, <vial>) to search for.
+        :type location: tuple
+
+        :returns: The matching sample_ref, None if there is none
+        """
+        if location:
+            positions = self._by_location.get((location[0], location[1]), ())
+        elif code:
+            positions = self._by_code.get(code, ())
+        else:
+            return None
+
+        for position in positions:
+            sample_ref = self._sample_refs[position]
+            if position not in self._removed and (
+                not (code and location) or sample_ref.code == code
+            ):
+                return sample_ref
+
+        return None
+
+    def remove(self, sample_ref):
+        """
+        Removes a sample found with find, raises ValueError (as list.remove)
+        if it is not in the index.
+        """
+        position = self._positions.get(id(sample_ref))
+        if (
+            position is None
+            or position in self._removed
+            or self._sample_refs[position] is not sample_ref
+        ):
+            raise ValueError("%r not in index" % (sample_ref,))
+        self._removed.add(position)
+
+    def __iter__(self):
+        for position, sample_ref in enumerate(self._sample_refs):
+            if position not in self._removed:
+                yield sample_ref
+
+    def __len__(self):
+        return len(self._sample_refs) - len(self._removed)
+
+
 def trace(fun):
     def _trace(*args):
         log_msg = "lims client " + fun.__name__ + " called with: "
@@ -183,6 +268,8 @@ class ISPyBClient(HardwareObject):
         self.group_id = None
 
         self.login_ok = False
+        self.ws_timings = WebServiceTimings()
+        self.quality_indicators_uploader = None
 
     def init(self):
         """
@@ -238,72 +325,35 @@ class ISPyBClient(HardwareObject):
                 _WS_COLLECTION_URL = _WSDL_ROOT + "ToolsForCollectionWebService?wsdl"
                 _WS_AUTOPROC_URL = _WSDL_ROOT + "ToolsForAutoprocessingWebService?wsdl"
 
-                if self.ws_root.strip().startswith("https://"):
-                    from suds.transport.https import HttpAuthenticated
-                else:
-                    from suds.transport.http import HttpAuthenticated
-
-                t1 = HttpAuthenticated(
-                    username=self.ws_username,
-                    password=self.ws_password,
-                    proxy=self.proxy,
-                )
-
-                t2 = HttpAuthenticated(
-                    username=self.ws_username,
-                    password=self.ws_password,
-                    proxy=self.proxy,
-                )
-
-                t3 = HttpAuthenticated(
-                    username=self.ws_username,
-                    password=self.ws_password,
-                    proxy=self.proxy,
-                )
-
-                t4 = HttpAuthenticated(
+                # One transport for all the clients, sharing its connections
+                transport = PooledTransport(
+                    timings=self.ws_timings,
                     username=self.ws_username,
                     password=self.ws_password,
                     proxy=self.proxy,
                 )
+                _WS_CLIENTS.options = {
+                    "timeout": 3,
+                    "transport": transport,
+                    "cache": get_wsdl_cache(
+                        self.get_wsdl_cache_directory(),
+                        _WSDL_ROOT,
+                        self.get_property("wsdl_cache_days", 7),
+                    ),
+                    "proxy": self.proxy,
+                }
+                _WS_CLIENTS.clear()
 
                 try:
-                    self._shipping = Client(
-                        _WS_SHIPPING_URL,
-                        timeout=3,
-                        transport=t1,
-                        cache=None,
-                        proxy=self.proxy,
-                    )
-                    self._collection = Client(
-                        _WS_COLLECTION_URL,
-                        timeout=3,
-                        transport=t2,
-                        cache=None,
-                        proxy=self.proxy,
-                    )
-                    self._tools_ws = Client(
-                        _WS_BL_SAMPLE_URL,
-                        timeout=3,
-                        transport=t3,
-                        cache=None,
-                        proxy=self.proxy,
-                    )
-                    self._autoproc_ws = Client(
-                        _WS_AUTOPROC_URL,
-                        timeout=3,
-                        transport=t4,
-                        cache=None,
-                        proxy=self.proxy,
-                    )
-
-                    # ensure that suds do not create those files in tmp
-                    self._shipping.set_options(cache=None, location=_WS_SHIPPING_URL)
-                    self._collection.set_options(
-                        cache=None, location=_WS_COLLECTION_URL
-                    )
-                    self._tools_ws.set_options(cache=None, location=_WS_BL_SAMPLE_URL)
-                    self._autoproc_ws.set_options(cache=None, location=_WS_AUTOPROC_URL)
+                    self._shipping = _WS_CLIENTS.get(_WS_SHIPPING_URL)
+                    self._collection = _WS_CLIENTS.get(_WS_COLLECTION_URL)
+                    self._tools_ws = _WS_CLIENTS.get(_WS_BL_SAMPLE_URL)
+                    self._autoproc_ws = _WS_CLIENTS.get(_WS_AUTOPROC_URL)
+
+                    self._shipping.set_options(location=_WS_SHIPPING_URL)
+                    self._collection.set_options(location=_WS_COLLECTION_URL)
+                    self._tools_ws.set_options(location=_WS_BL_SAMPLE_URL)
+                    self._autoproc_ws.set_options(location=_WS_AUTOPROC_URL)
                 except URLError:
                     logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
                     return
@@ -311,6 +361,29 @@ class ISPyBClient(HardwareObject):
             logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
             return
 
+        # Image quality indicators sent in the background, in batches, when
+        # they can be spooled to disk during a LIMS outage
+        batch_size = self.get_property("quality_indicators_batch_size", 100)
+        spool_directory = self.get_property("quality_indicators_spool_directory")
+        if spool_directory is None and config_cache.get_cache_directory():
+            spool_directory = os.path.join(
+                config_cache.get_cache_directory(), "ispyb_spool"
+            )
+        if batch_size and self._autoproc_ws and spool_directory:
+            self.quality_indicators_uploader = BatchUploader(
+                self._send_image_quality_indicators,
+                batch_size=batch_size,
+                flush_interval=self.get_property("quality_indicators_flush_interval", 2.0),
+                spool_directory=spool_directory,
+                name="image_quality_indicators",
+                # the SOAP faults (WebFault) are not retried
+                transient_errors=(TransportError, OSError),
+            )
+            # send the indicators spooled before a restart
+            self.quality_indicators_uploader.start()
+            # the indicators not sent at exit are spooled
+            atexit.register(self.quality_indicators_uploader.stop, 5)
+
         # Add the porposal codes defined in the configuration xml file
         # to a directory. Used by translate()
         if hasattr(HWR.beamline.session, "proposals"):
@@ -334,6 +407,24 @@ class ISPyBClient(HardwareObject):
     def loginType(self):
         return self.get_property("loginType", LOGIN_TYPE_FALLBACK)
 
+    def get_wsdl_cache_directory(self):
+        """Directory of the persistent WSDL cache: the wsdl_cache_directory
+        property, or the wsdl directory of the configuration cache. None if
+        neither is set, the WSDL being then downloaded by each client.
+        """
+        directory = self.get_property("wsdl_cache_directory")
+        if directory is None and config_cache.get_cache_directory():
+            directory = os.path.join(config_cache.get_cache_directory(), "wsdl")
+        return directory
+
+    def get_ws_timings(self):
+        """
+        Returns:
+            (dict): Web service method: (number of calls, total time [s],
+                    longest call [s])
+        """
+        return self.ws_timings.get()
+
     def get_login_type(self):
         warnings.warn(
             "Deprecated method `get_login_type`. Use `loginType` property instead.",
@@ -1084,43 +1175,6 @@ class ISPyBClient(HardwareObject):
                 "Error in store_image: could not connect to server"
             )
 
-    def __find_sample(self, sample_ref_list, code=None, location=None):
-        """
-        Returns the sample with the matching "search criteria" <code> and/or
-        <location> with-in the list sample_ref_list.
-
-        The sample_ref object is defined in the head of the file.
-
-        :param sample_ref_list: The list of sample_refs to search.
-        :type sample_ref: list
-
-        :param code: The vial datamatrix code (or bar code)
-        :param type: str
-
-        :param location: A tuple (<basket>, <vial>) to search for.
-        :type location: tuple
-        """
-        for sample_ref in sample_ref_list:
-
-            if code and location:
-                if (
-                    sample_ref.code == code
-                    and sample_ref.container_reference == location[0]
-                    and sample_ref.sample_reference == location[1]
-                ):
-                    return sample_ref
-            elif code:
-                if sample_ref.code == code:
-                    return sample_ref
-            elif location:
-                if (
-                    sample_ref.container_reference == location[0]
-                    and sample_ref.sample_reference == location[1]
-                ):
-                    return sample_ref
-
-        return None
-
     @trace
     def get_samples(self, proposal_id, session_id):
         response_samples = None
@@ -1173,13 +1227,13 @@ class ISPyBClient(HardwareObject):
         :rtype: list
         """
         if self._tools_ws:
-            sample_references = []
             session = self.get_session(session_id)
             response_samples = []
 
-            for sample_ref in sample_refs:
-                sample_reference = SampleReference(*sample_ref)
-                sample_references.append(sample_reference)
+            # Indexed once, each ISPyB sample being then matched in constant time
+            sample_references = SampleReferenceIndex(
+                SampleReference(*sample_ref) for sample_ref in sample_refs
+            )
 
             try:
                 response_samples = (
@@ -1213,15 +1267,13 @@ class ISPyBClient(HardwareObject):
                     # Sample location and code was found in ISPyB and they match
                     # with the sample changer.
                     elif sample.code and sample.sampleLocation:
-                        sc_sample = self.__find_sample(
-                            sample_references, code=sample.code, location=loc
+                        sc_sample = sample_references.find(
+                            code=sample.code, location=loc
                         )
 
                         # The sample codes dose not match
                         if not sc_sample:
-                            sc_sample = self.__find_sample(
-                                sample_references, location=loc
-                            )
+                            sc_sample = sample_references.find(location=loc)
 
                             if sc_sample.code != "":
                                 sample.code = sc_sample.code
@@ -1231,7 +1283,7 @@ class ISPyBClient(HardwareObject):
                     # Only location was found, update with the code
                     # from sample changer if it exists.
                     elif sample.sampleLocation:
-                        sc_sample = self.__find_sample(sample_references, location=loc)
+                        sc_sample = sample_references.find(location=loc)
                         if sc_sample:
                             sample.sampleCode = sc_sample.code
                             sample_references.remove(sc_sample)
@@ -1252,7 +1304,7 @@ class ISPyBClient(HardwareObject):
                             int(sample.sampleLocation),
                         )
 
-                        sc_sample = self.__find_sample(sample_references, location=loc)
+                        sc_sample = sample_references.find(location=loc)
                         if sc_sample:
                             sample.code = sc_sample.code
                             sample_references.remove(sc_sample)
@@ -1925,8 +1977,17 @@ class ISPyBClient(HardwareObject):
         return workflow_step_id
 
     def store_image_quality_indicators(self, image_dict):
-        """Stores image quality indicators"""
-        quality_ind_id = -1
+        """Stores image quality indicators
+
+        The indicators are queued, and sent in batches in the background
+        (see mxcubecore.utils.batch_uploader), unless the
+        quality_indicators_batch_size property is 0 or there is no spool
+        directory (quality_indicators_spool_directory property, or the
+        configuration cache directory).
+
+        :returns: The image quality indicators id if sent synchronously,
+                  -1 if queued or not stored
+        """
         quality_ind_dict = {
             "imageId": image_dict["image_id"],
             "autoProcProgramId": image_dict["auto_proc_program"],
@@ -1936,17 +1997,34 @@ class ISPyBClient(HardwareObject):
             "totalIntegratedSignal": image_dict["spots_int_aver"],
             "method1Res": image_dict["spots_resolution"],
         }
+        if self.quality_indicators_uploader is not None:
+            self.quality_indicators_uploader.put(quality_ind_dict)
+            return -1
+
+        quality_ind_id = -1
         try:
-            quality_ind_id = (
-                self._autoproc_ws.service.storeOrUpdateImageQualityIndicators(
-                    quality_ind_dict
-                )
-            )
+            quality_ind_id = self._send_image_quality_indicators(quality_ind_dict)
         except Exception as e:
             msg = "Could not store image quality indicators in lims: " + str(e)
             logging.getLogger("ispyb_client").exception(msg)
         return quality_ind_id
 
+    def _send_image_quality_indicators(self, quality_ind_dict):
+        return self._autoproc_ws.service.storeOrUpdateImageQualityIndicators(
+            quality_ind_dict
+        )
+
+    def get_quality_indicators_metrics(self):
+        """
+        Returns:
+            (dict): Metrics of the image quality indicators uploader (see
+                    BatchUploader.get_metrics), None if they are sent
+                    synchronously
+        """
+        if self.quality_indicators_uploader is None:
+            return None
+        return self.quality_indicators_uploader.get_metrics()
+
     def set_image_quality_indicators_plot(self, collection_id, plot_path, csv_path):
         """Assigns image quality indicators png and csv filenames to collection"""
         try:
@@ -2449,7 +2527,7 @@ class ISPyBValueFactory:
         workflow_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL, cache=None)
+            ws_client = _WS_CLIENTS.get(_WS_COLLECTION_URL)
             workflow_vo = ws_client.factory.create("workflow3VO")
         except Exception:
             raise
@@ -2480,7 +2558,7 @@ class ISPyBValueFactory:
         workflow_mesh_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL, cache=None)
+            ws_client = _WS_CLIENTS.get(_WS_COLLECTION_URL)
             workflow_mesh_vo = ws_client.factory.create("workflowMeshWS3VO")
         except Exception:
             raise
@@ -2514,7 +2592,7 @@ class ISPyBValueFactory:
         workflow_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL, cache=None)
+            ws_client = _WS_CLIENTS.get(_WS_COLLECTION_URL)
             workflow_step_vo = ws_client.factory.create("workflowStep3VO")
         except Exception:
             raise
@@ -2552,7 +2630,7 @@ class ISPyBValueFactory:
         grid_info_vo = None
 
         try:
-            ws_client = Client(_WS_COLLECTION_URL, cache=None)
+            ws_client = _WS_CLIENTS.get(_WS_COLLECTION_URL)
             grid_info_vo = ws_client.factory.create("gridInfoWS3VO")
         except Exception:
             raise
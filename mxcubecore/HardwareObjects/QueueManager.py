@@ -33,6 +33,8 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         self._running = False
         self._disable_collect = False
         self._is_stopped = False
+        # id(data model) to queue entry
+        self._entry_index = {}
 
     def init(self):
         site_entry_path = self.get_property("site_entry_path")
@@ -69,6 +71,39 @@ class QueueManager(HardwareObject, QueueEntryContainer):
 
         queue_entry.set_queue_controller(self)
         super(QueueManager, self).enqueue(queue_entry)
+        self.index_entry(queue_entry)
+
+    def index_entry(self, queue_entry):
+        """
+        Adds <queue_entry> and its child entries to the data model index,
+        called when they are enqueued.
+
+        :param queue_entry: QueueEntry to add
+        :type queue_entry: QueueEntry
+        """
+        entries = [queue_entry]
+        while entries:
+            entry = entries.pop()
+            # child entries enqueued before their parent had a controller
+            entry.set_queue_controller(self)
+            self._entry_index[id(entry.get_data_model())] = entry
+            entries.extend(entry.get_queue_entry_list())
+
+    def unindex_entry(self, queue_entry):
+        """
+        Removes <queue_entry> and its child entries from the data model
+        index, called when they are dequeued.
+
+        :param queue_entry: QueueEntry to remove
+        :type queue_entry: QueueEntry
+        """
+        entries = [queue_entry]
+        while entries:
+            entry = entries.pop()
+            key = id(entry.get_data_model())
+            if self._entry_index.get(key) is entry:
+                del self._entry_index[key]
+            entries.extend(entry.get_queue_entry_list())
 
     def execute(self, entry=None):
         """
@@ -399,11 +434,34 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         if not root_queue_entry:
             root_queue_entry = self
 
+        entry = self._get_indexed_entry(model, root_queue_entry)
+        if entry is None and root_queue_entry is not self:
+            # root_queue_entry not in the queue
+            entry = self._find_entry_with_model(model, root_queue_entry)
+        return entry
+
+    def _get_indexed_entry(self, model, root_queue_entry):
+        """
+        Get the entry with the data model <model> from the index, if it is
+        (still) under <root_queue_entry>
+        """
+        entry = self._entry_index.get(id(model))
+        if entry is not None and entry.get_data_model() is model:
+            container = entry.get_container()
+            while container is not None and container is not root_queue_entry:
+                container = container.get_container()
+            if container is root_queue_entry:
+                return entry
+
+    def _find_entry_with_model(self, model, root_queue_entry):
+        """
+        Depth first search of the entry with the data model <model>
+        """
         for queue_entry in root_queue_entry._queue_entry_list:
             if queue_entry.get_data_model() is model:
                 return queue_entry
             else:
-                result = self.get_entry_with_model(model, queue_entry)
+                result = self._find_entry_with_model(model, queue_entry)
 
                 if result:
                     return result
@@ -437,6 +495,7 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         :rtype: NoneType
         """
         self._queue_entry_list = []
+        self._entry_index = {}
 
     def show_workflow_tab(self):
         self.emit("show_workflow_tab")
@@ -63,6 +63,9 @@ class QueueModel(HardwareObject):
 
         self._selected_model = self._ispyb_model
 
+        # Node id to node, per model root (keyed by id(root))
+        self._node_index = {}
+
     def __getstate__(self):
         d = dict(self.__dict__)
         return d
@@ -118,6 +121,12 @@ class QueueModel(HardwareObject):
             for name in self._models.keys():
                 self._models[name] = queue_model_objects.RootNode()
 
+        roots = set(id(root) for root in self._models.values())
+        roots.add(id(self._selected_model))
+        for key in list(self._node_index):
+            if key not in roots:
+                del self._node_index[key]
+
         HWR.beamline.queue_manager.clear()
 
     def register_model(self, name, root_node):
@@ -165,6 +174,7 @@ class QueueModel(HardwareObject):
             child._parent = parent
             child._node_id = self._selected_model._total_node_count
             parent._children.append(child)
+            self._index_node(child)
             child._set_name(child._name)
             self.emit("child_added", (parent, child))
         else:
@@ -203,15 +213,66 @@ class QueueModel(HardwareObject):
         if parent is None:
             parent = self._selected_model
 
+        node = self._node_index.get(id(self._get_root(parent)), {}).get(_id)
+        if node is not None and node._node_id == _id:
+            # check that the node is (still) under parent
+            ancestor = node._parent
+            while ancestor is not None and ancestor is not parent:
+                ancestor = ancestor._parent
+            if ancestor is parent:
+                return node
+
+        node = self._find_node(_id, parent)
+        if node is not None:
+            self._index_node(node)
+        return node
+
+    def _find_node(self, _id, parent):
+        """
+        Depth first search of the node with the node id <_id> under <parent>
+        """
         for node in parent._children:
             if node._node_id == _id:
                 return node
             else:
-                result = self.get_node(_id, node)
+                result = self._find_node(_id, node)
 
                 if result:
                     return result
 
+    @staticmethod
+    def _get_root(node):
+        while node._parent is not None:
+            node = node._parent
+        return node
+
+    def _index_node(self, node):
+        """
+        Adds <node> and its descendants to the node id index of their model
+        """
+        root = self._get_root(node)
+        if not isinstance(root, queue_model_objects.RootNode):
+            # not in a model yet, indexed when added to it
+            return
+        index = self._node_index.setdefault(id(root), {})
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            index[node._node_id] = node
+            nodes.extend(node._children)
+
+    def _unindex_node(self, root, node):
+        """
+        Removes <node> and its descendants from the node id index of <root>
+        """
+        index = self._node_index.get(id(root), {})
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            if index.get(node._node_id) is node:
+                del index[node._node_id]
+            nodes.extend(node._children)
+
     def del_child(self, parent, child):
         """
         Removes <child>
@@ -224,6 +285,7 @@ class QueueModel(HardwareObject):
         """
         if child in parent._children:
             parent._children.remove(child)
+            self._unindex_node(self._get_root(parent), child)
             self.emit("child_removed", (parent, child))
 
     def _detach_child(self, parent, child):
@@ -236,7 +298,8 @@ class QueueModel(HardwareObject):
         :returns: None
         :rtype: None
         """
-        child = parent._children.pop(child)
+        parent._children.remove(child)
+        self._unindex_node(self._get_root(parent), child)
         return child
 
     def set_parent(self, parent, child):
@@ -249,11 +312,11 @@ class QueueModel(HardwareObject):
         :param child: The child
         :type child: TaskNode Object
         """
-        if child._parent:
-            self._detach_child(parent, child)
-            child.set_parent(parent)
-        else:
-            child._parent = parent
+        if child._parent and child in child._parent._children:
+            self._detach_child(child._parent, child)
+            parent._children.append(child)
+        child._parent = parent
+        self._index_node(child)
 
     def view_created(self, view_item, task_model):
         """
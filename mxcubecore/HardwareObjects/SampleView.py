@@ -22,9 +22,11 @@ __license__ = "LGPLv3+"
 
 import base64
 import copy
+import time
 from functools import reduce
 from io import BytesIO
 
+import gevent
 import numpy as np
 from PIL import Image
 
@@ -32,35 +34,83 @@ from mxcubecore import HardwareRepository as HWR
 from mxcubecore.HardwareObjects.abstract.AbstractSampleView import AbstractSampleView
 from mxcubecore.model import queue_model_objects
 
+# Overlay pixels with all of their R, G and B values at most these ones are
+# transparent (the background of the overlay drawn by the client)
+OVERLAY_THRESHOLD = (200, 60, 140)
 
-def combine_images(img1, img2):
-    if img1.size != img2.size:
-        raise ValueError("Images must be the same size")
 
-    combined_img = Image.new("RGB", img1.size)
+def get_overlay_layer(overlay):
+    """Get the visible pixels of an overlay image, with their colour and
+    opacity.
 
-    pixels1 = img1.load()
-    pixels2 = img2.load()
-    combined_pixels = combined_img.load()
+    Pixels under OVERLAY_THRESHOLD are transparent, the other ones have the
+    opacity of the overlay alpha channel, if any.
 
-    width, height = img1.size
-    for x in range(width):
-        for y in range(height):
-            pixel1 = pixels1[x, y]
-            pixel2 = pixels2[x, y]
+    Args:
+        overlay (Image): Overlay image
 
-            if pixel2[0] <= 200 and pixel2[1] <= 60 and pixel2[2] <= 140:
-                combined_pixels[x, y] = pixel1
-            else:
-                combined_pixels[x, y] = pixel2
+    Returns:
+        (tuple): Image size, flat indices of the visible pixels, their RGB
+                 colours (N, 3) and opacities (N, 1), None if opaque
+    """
+    if overlay.mode in ("RGBA", "LA", "PA") or "transparency" in overlay.info:
+        rgba = np.asarray(overlay.convert("RGBA")).reshape(-1, 4)
+        rgb, alpha = rgba[:, :3], rgba[:, 3]
+    else:
+        rgb, alpha = np.asarray(overlay.convert("RGB")).reshape(-1, 3), None
+
+    red, green, blue = OVERLAY_THRESHOLD
+    visible = np.flatnonzero(
+        (rgb[:, 0] > red) | (rgb[:, 1] > green) | (rgb[:, 2] > blue)
+    )
 
-    return combined_img
+    opacity = None
+    if alpha is not None and np.any(alpha[visible] != 255):
+        opacity = alpha[visible, np.newaxis].astype(np.float32) / 255
+    return overlay.size, visible, rgb[visible], opacity
+
+
+def combine_layer(img, layer):
+    """Lay an overlay layer (see get_overlay_layer) over an image
+
+    Args:
+        img (Image): Image, same size as the overlay
+        layer (tuple): Overlay layer
+
+    Returns:
+        (Image) RGB image
+    """
+    size, visible, colors, opacity = layer
+    if img.size != size:
+        raise ValueError("Images must be the same size")
+
+    combined = np.array(img.convert("RGB"))
+    pixels = combined.reshape(-1, 3)
+    if opacity is None:
+        pixels[visible] = colors
+    else:
+        base = pixels[visible]
+        pixels[visible] = np.rint(base + (colors.astype(np.float32) - base) * opacity)
+    return Image.fromarray(combined, "RGB")
+
+
+def combine_images(img1, img2):
+    if img1.size != img2.size:
+        raise ValueError("Images must be the same size")
+
+    return combine_layer(img1, get_overlay_layer(img2))
 
 
 class SampleView(AbstractSampleView):
     def __init__(self, name):
         AbstractSampleView.__init__(self, name)
         self._shapes = {}
+        # Last overlay data, image size and overlay layer
+        self._overlay_cache = (None, None, None)
+        # Minimum time between two shapesChanged [s]
+        self.shapes_update_interval = 0.1
+        self._shapes_updated_at = 0
+        self._shapes_update = None
 
     def init(self):
         super(SampleView, self).init()
@@ -68,17 +118,58 @@ class SampleView(AbstractSampleView):
         self._last_oav_image = None
 
         self.hide_grid_threshold = self.get_property("hide_grid_threshold", 5)
+        self.shapes_update_interval = (
+            self.get_property("shapes_update_interval", 100) / 1000.0
+        )
         for motor_name, motor_ho in HWR.beamline.diffractometer.get_motors().items():
             if motor_ho:
                 motor_ho.connect("stateChanged", self._update_shape_positions)
 
     def _update_shape_positions(self, *args, **kwargs):
+        """Update the shape positions and emit shapesChanged, at most once
+        per shapes_update_interval. Updates asked for in between are done
+        once, at the end of the interval.
+        """
+        if self._shapes_update is not None:
+            return
 
-        for shape in self.get_shapes():
-            shape.update_position(HWR.beamline.diffractometer.motor_positions_to_screen)
+        delay = self._shapes_updated_at + self.shapes_update_interval - time.time()
+        if delay > 0:
+            self._shapes_update = gevent.spawn_later(delay, self._emit_shapes_changed)
+        else:
+            self._emit_shapes_changed()
 
+    def _emit_shapes_changed(self):
+        self._shapes_update = None
+        self._shapes_updated_at = time.time()
+        self.update_shape_positions()
         self.emit("shapesChanged")
 
+    def update_shape_positions(self):
+        """Update the screen positions of all the shapes, the centred
+        positions being projected in one go.
+        """
+        diffractometer = HWR.beamline.diffractometer
+        shapes = self.get_shapes()
+        if any(isinstance(shape, Grid) for shape in shapes):
+            omega = diffractometer.omega.get_value()
+            shapes = [shape for shape in shapes if shape.update_state(omega)]
+
+        cpos_list = [cpos.as_dict() for shape in shapes for cpos in shape.cp_list]
+        if hasattr(diffractometer, "motor_positions_list_to_screen"):
+            spos_list = diffractometer.motor_positions_list_to_screen(cpos_list)
+        else:
+            spos_list = [
+                diffractometer.motor_positions_to_screen(cpos) for cpos in cpos_list
+            ]
+        spos_list = np.asarray(spos_list, dtype=float).reshape(-1, 2).tolist()
+
+        index = 0
+        for shape in shapes:
+            count = len(shape.cp_list)
+            shape.set_screen_position(spos_list[index : index + count])
+            index += count
+
     @property
     def shapes(self):
         return self._shapes
@@ -153,18 +244,27 @@ class SampleView(AbstractSampleView):
         img = Image.frombytes("RGB", (width, height), data)
 
         if overlay_data:
-            overlay_data = base64.b64decode(overlay_data)
-            overlay_image = Image.open(BytesIO(overlay_data))
-            overlay_image = overlay_image.resize(
-                (width, height), Image.Resampling.LANCZOS
-            )
-            img = combine_images(img, overlay_image.convert("RGB"))
+            img = combine_layer(img, self._get_overlay_layer(overlay_data, img.size))
 
         if bw:
             img.convert("1")
 
         return img
 
+    def _get_overlay_layer(self, overlay_data, size):
+        """
+        Get the overlay layer (see get_overlay_layer) of base64 encoded
+        overlay data, resized to size. The last one is cached, the client
+        sending the same overlay as long as the shapes do not change.
+        """
+        cached_data, cached_size, layer = self._overlay_cache
+        if overlay_data != cached_data or size != cached_size:
+            overlay_image = Image.open(BytesIO(base64.b64decode(overlay_data)))
+            overlay_image = overlay_image.resize(size, Image.Resampling.LANCZOS)
+            layer = get_overlay_layer(overlay_image)
+            self._overlay_cache = (overlay_data, size, layer)
+        return layer
+
     def get_last_image_path(self):
         return self._last_oav_image
 
@@ -486,9 +586,25 @@ class Shape(object):
         return self.selected
 
     def update_position(self, transform):
-        spos_list = [transform(cp.as_dict()) for cp in self.cp_list]
-        spos_list = tuple([pos for l in spos_list for pos in l])
-        self.screen_coord = spos_list
+        self.set_screen_position([transform(cp.as_dict()) for cp in self.cp_list])
+
+    def set_screen_position(self, spos_list):
+        """
+        Args:
+            spos_list (list): Screen positions (x, y) of the centred positions
+        """
+        self.screen_coord = tuple([pos for l in spos_list for pos in l])
+
+    def update_state(self, omega):
+        """Update the state of the shape for the omega position
+
+        Args:
+            omega (float): Omega position [deg]
+
+        Returns:
+            (bool): True if the shape is shown
+        """
+        return True
 
     def add_cp_from_mp(self, mpos_list):
         for mp in mpos_list:
@@ -616,14 +732,18 @@ class Grid(Shape):
         self.set_id(Grid.SHAPE_COUNT)
 
     def update_position(self, transform):
-        phi_pos = HWR.beamline.diffractometer.omega.get_value() % 360
+        if self.update_state(HWR.beamline.diffractometer.omega.get_value()):
+            super(Grid, self).update_position(transform)
+
+    def update_state(self, omega):
+        phi_pos = omega % 360
         _d = abs((self.get_centred_position().phi % 360) - phi_pos)
 
         if min(_d, 360 - _d) > self.shapes_hw_object.hide_grid_threshold:
             self.state = "HIDDEN"
-        else:
-            super(Grid, self).update_position(transform)
-            self.state = "SAVED"
+            return False
+        self.state = "SAVED"
+        return True
 
     def get_centred_position(self):
         return self.cp_list[0]
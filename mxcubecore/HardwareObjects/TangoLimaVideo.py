@@ -13,41 +13,44 @@ Example configuration:
 If video mode is not specified, BAYER_RG16 is used by default.
 """
 
-import io
 import logging
 import struct
 import time
 
 import gevent
 import PyTango
-from PIL import Image
 from PyTango.gevent import DeviceProxy
 
 from mxcubecore import BaseHardwareObjects
+from mxcubecore.utils.video_frame import VideoFrame
 
+# Header of the Lima video images
+HEADER_FORMAT = ">IHHqiiHHHH"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
 
-def poll_image(lima_tango_device, video_mode, FORMATS):
-    img_data = lima_tango_device.video_last_image
 
-    hfmt = ">IHHqiiHHHH"
-    hsize = struct.calcsize(hfmt)
-    _, _, img_mode, frame_number, width, height, _, _, _, _ = struct.unpack(
-        hfmt, img_data[1][:hsize]
-    )
+def decode_frame(img_data, video_mode, FORMATS):
+    """Wrap the Lima video_last_image data in a VideoFrame
 
-    raw_data = img_data[1][hsize:]
-    _from, _to = FORMATS.get(video_mode, (None, None))
+    Args:
+        img_data (tuple): video_last_image attribute value (format, data)
+        video_mode (str): Camera video mode
+        FORMATS (dict): Video mode to (PIL mode, output format)
 
-    if _from and _to:
-        img = Image.frombuffer(_from, (height, width), raw_data, "raw", _from, 0, 1)
+    Returns:
+        (VideoFrame): Frame
+    """
+    data = memoryview(img_data[1])
+    _, _, _, frame_number, width, height, _, _, _, _ = struct.unpack_from(
+        HEADER_FORMAT, data
+    )
+    _from, _to = FORMATS.get(video_mode, (None, None))
+    return VideoFrame(frame_number, width, height, data[HEADER_SIZE:], _from)
 
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format=_to)
-        img = img.tobytes()
-    else:
-        img = raw_data
 
-    return img, width, height
+def poll_image(lima_tango_device, video_mode, FORMATS):
+    frame = decode_frame(lima_tango_device.video_last_image, video_mode, FORMATS)
+    return frame.data, frame.width, frame.height
 
 
 class TangoLimaVideo(BaseHardwareObjects.HardwareObject):
@@ -60,6 +63,11 @@ class TangoLimaVideo(BaseHardwareObjects.HardwareObject):
         self.__polling = None
         self._video_mode = None
         self._last_image = (0, 0, 0)
+        self._last_frame = None
+        # Lima video image counter, available if the device has the attribute
+        self._image_counter_exists = False
+        self._last_image_counter = None
+        self._image_counter_changed = True
 
         # Dictionary containing conversion information for a given
         # video_mode. The camera video mode is the key and the first
@@ -82,6 +90,8 @@ class TangoLimaVideo(BaseHardwareObjects.HardwareObject):
             # try a first call to get an exception if the device
             # is not exported
             self.device.ping()
+            attributes = [name.lower() for name in self.device.get_attribute_list()]
+            self._image_counter_exists = "video_last_image_counter" in attributes
         except PyTango.DevFailed as traceback:
             last_error = traceback[-1]
             logging.getLogger("HWR").error("%s: %s", str(self.name()), last_error.desc)
@@ -108,19 +118,74 @@ class TangoLimaVideo(BaseHardwareObjects.HardwareObject):
 
         self.set_is_ready(True)
 
+    def get_frame(self):
+        """Get the last frame. The image is only read if the Lima video image
+        counter changed, and only decoded if its frame number changed.
+
+        Returns:
+            (VideoFrame): Last frame
+        """
+        frame = self._last_frame
+        image_counter = img_data = None
+        if self._image_counter_exists:
+            # while the image keeps changing, read the counter and the image
+            # in one call, otherwise only the counter
+            try:
+                if self._image_counter_changed:
+                    counter_attr, image_attr = self.device.read_attributes(
+                        ["video_last_image_counter", "video_last_image"]
+                    )
+                    image_counter, img_data = counter_attr.value, image_attr.value
+                else:
+                    image_counter = self.device.video_last_image_counter
+            except Exception:
+                logging.getLogger("HWR").debug(
+                    "Could not read the Lima video image counter", exc_info=True
+                )
+                image_counter = img_data = None
+
+            self._image_counter_changed = image_counter is not None
+            if frame is not None and image_counter == self._last_image_counter:
+                self._image_counter_changed = False
+                return frame
+
+        if img_data is None:
+            img_data = self.device.video_last_image
+        self._last_image_counter = image_counter
+        if frame is not None:
+            frame_number = struct.unpack_from(HEADER_FORMAT, img_data[1])[3]
+            if frame_number == frame.frame_number:
+                return frame
+
+        self._last_frame = decode_frame(img_data, self.video_mode, self._FORMATS)
+        return self._last_frame
+
     def get_last_image(self):
-        return poll_image(self.device, self.video_mode, self._FORMATS)
+        frame = self.get_frame()
+        return frame.tobytes(), frame.width, frame.height
+
+    def get_jpeg(self, quality=80):
+        """Get the last frame JPEG encoded, encoded once per frame
+
+        Args:
+            quality (int): JPEG quality
+
+        Returns:
+            (bytes): JPEG image
+        """
+        return self.get_frame().encode("JPEG", quality=quality)
 
     def _do_polling(self, sleep_time):
-        lima_tango_device = self.device
+        frame_number = None
 
         while True:
-            data, width, height = poll_image(
-                lima_tango_device, self.video_mode, self._FORMATS
-            )
+            frame = self.get_frame()
 
-            self._last_image = data, width, height
-            self.emit("imageReceived", data, width, height, False)
+            if frame.frame_number != frame_number:
+                frame_number = frame.frame_number
+                data = frame.tobytes()
+                self._last_image = data, frame.width, frame.height
+                self.emit("imageReceived", data, frame.width, frame.height, False)
             time.sleep(sleep_time)
 
     def connect_notify(self, signal):
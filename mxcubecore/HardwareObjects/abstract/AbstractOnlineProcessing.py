@@ -25,15 +25,17 @@ import time
 from copy import copy
 
 import gevent
-import matplotlib.pyplot as plt
 import numpy as np
 import SimpleHTML
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from scipy import ndimage
 from scipy.interpolate import UnivariateSpline
 
 from mxcubecore import HardwareRepository as HWR
 from mxcubecore.BaseHardwareObjects import HardwareObject
+from mxcubecore.utils.results_store import ResultsStore
 
 __copyright__ = """ Copyright © 2010-2022 by the MXCuBE collaboration """
 __license__ = "LGPLv3+"
@@ -46,6 +48,85 @@ DEFAULT_RESULT_TYPES = [
     {"key": "is", "descr": "Intensity", "color": (0, 0, 120)},
 ]
 
+# Number of best positions extracted from the results
+NUM_BEST_POSITIONS = 10
+
+
+class ResultsAlignment:
+    """Alignment of the results of a processing run, updated with each
+    processed batch: the (col, row) of each image, the score sums giving the
+    center of mass and the indexes of the best scores.
+    """
+
+    def __init__(self, cols, rows, valid, best_num=NUM_BEST_POSITIONS):
+        """
+        Args:
+            cols (numpy.ndarray): Column of each image
+            rows (numpy.ndarray): Row of each image
+            valid (numpy.ndarray): True for the images inside the grid
+            best_num (int): Number of best positions
+        """
+        self.cols = cols
+        self.rows = rows
+        self.valid = valid
+        self.best_num = best_num
+        # Scores of the aligned images
+        self.scores = np.zeros(cols.size)
+        self.score_sum = 0.0
+        self.col_sum = 0.0
+        self.row_sum = 0.0
+        self.best_indexes = np.zeros(0, dtype=int)
+        self.best_scores = np.zeros(0)
+        # Column, row and motor positions of the best images
+        self.positions = {}
+
+    def update(self, scores, indexes):
+        """Update with the scores of a batch of images
+
+        Args:
+            scores (numpy.ndarray): Scores of all images
+            indexes (numpy.ndarray): Indexes of the images of the batch
+        """
+        new_scores = scores[indexes]
+        delta = (new_scores - self.scores[indexes])[self.valid[indexes]]
+        cells = indexes[self.valid[indexes]]
+        self.scores[indexes] = new_scores
+
+        self.score_sum += delta.sum()
+        self.col_sum += np.dot(delta, self.cols[cells])
+        self.row_sum += np.dot(delta, self.rows[cells])
+
+        if np.any(self.scores[self.best_indexes] < self.best_scores):
+            # a best score went down, any image can replace it
+            candidates = np.arange(self.scores.size)
+        else:
+            candidates = np.union1d(self.best_indexes, indexes)
+        order = np.argsort(-self.scores[candidates], kind="stable")
+        self.best_indexes = candidates[order[: self.best_num]]
+        self.best_scores = self.scores[self.best_indexes]
+
+    def align(self, values, shape):
+        """
+        Args:
+            values (numpy.ndarray): Values of all images
+            shape (tuple): Shape of the grid
+
+        Returns:
+            (numpy.ndarray): Values on the grid, 0 outside of the images
+        """
+        aligned = np.zeros(shape)
+        aligned[self.cols[self.valid], self.rows[self.valid]] = values[self.valid]
+        return aligned
+
+    def center_of_mass(self):
+        """
+        Returns:
+            (tuple): Score weighted mean (col, row), nan if all scores are 0
+        """
+        if not self.score_sum:
+            return np.nan, np.nan
+        return self.col_sum / self.score_sum, self.row_sum / self.score_sum
+
 
 """
 AbstractOnlineProcessing hardware object handles online data processing.
@@ -86,6 +167,9 @@ class AbstractOnlineProcessing(HardwareObject):
 
         self.current_grid_index = None
         self.grid_properties = []
+        self.alignment = None
+        self.results_store = None
+        self.results_files_task = None
 
     def init(self):
         self.done_event = gevent.event.Event()
@@ -256,6 +340,7 @@ class AbstractOnlineProcessing(HardwareObject):
 
         self.results_raw = {}
         self.results_aligned = {}
+        self.alignment = None
 
         # Empty numpy arrays to store raw and aligned results
         for result_type in self.result_types:
@@ -278,6 +363,27 @@ class AbstractOnlineProcessing(HardwareObject):
                     result_type["key"]
                 ].reshape(self.params_dict["steps_x"], self.params_dict["steps_y"])
 
+        # Results per image, stored as they are processed
+        self.results_store = None
+        self.params_dict["results_store_path"] = os.path.join(
+            process_directory, "results"
+        )
+        try:
+            self.results_store = ResultsStore.create(
+                self.params_dict["results_store_path"],
+                [
+                    key
+                    for key, values in self.results_raw.items()
+                    if values.size == self.params_dict["images_num"]
+                ],
+                self.params_dict["images_num"],
+            )
+        except Exception:
+            logging.getLogger("GUI").exception(
+                "Online processing: Could not create results store %s"
+                % self.params_dict["results_store_path"]
+            )
+
         # if not self.data_collection.is_mesh():
         #    self.results_raw["x_array"] = np.linspace(
         #        0, images_num, images_num, dtype=np.int32
@@ -435,10 +541,6 @@ class AbstractOnlineProcessing(HardwareObject):
         self.params_dict["max_dozor_score"] = float(self.results_aligned["score"].max())
         best_positions = self.results_aligned.get("best_positions", [])
 
-        processing_grid_overlay_file = os.path.join(
-            self.params_dict["archive_directory"], "grid_overlay.png"
-        )
-
         # If MeshScan and XrayCentring then info is stored in ISPyB
         if self.params_dict["workflow_type"] in (
             "MeshScan",
@@ -488,41 +590,55 @@ class AbstractOnlineProcessing(HardwareObject):
             self.params_dict["csv_file_path"],
         )
 
-        if self.params_dict["lines_num"] > 1:
-            fig, ax = plt.subplots(nrows=1, ncols=1)
-            current_max = max(fig.get_size_inches())
-            grid_width = self.params_dict["steps_x"] * self.params_dict["xOffset"]
-            grid_height = self.params_dict["steps_y"] * self.params_dict["yOffset"]
+        self.results_files_task = gevent.spawn(
+            self.save_results_files,
+            self.params_dict,
+            self.results_raw,
+            self.results_aligned,
+            self.results_store,
+            self.get_alignment(),
+            self.grid,
+        )
 
-            if grid_width > grid_height:
-                fig.set_size_inches(current_max, current_max * grid_height / grid_width)
-            else:
-                fig.set_size_inches(current_max * grid_width / grid_height, current_max)
+    def save_results_files(
+        self, params_dict, results_raw, results_aligned, results_store, alignment, grid
+    ):
+        """Saves the result plots, the html and json reports and the csv
+        file of a processing run. Called in a greenlet at the end of the run,
+        the plots and the csv file being written from the results store in
+        threads.
 
-            im = ax.imshow(
-                np.transpose(self.results_aligned["score"]),
-                interpolation="none",
-                aspect="auto",
-                extent=[
-                    0,
-                    self.results_aligned["score"].shape[0],
-                    0,
-                    self.results_aligned["score"].shape[1],
-                ],
-            )
-            im.set_cmap("hot")
+        Args:
+            params_dict (dict): Processing parameters
+            results_raw (dict): Results per image
+            results_aligned (dict): Results aligned on the grid
+            results_store (ResultsStore): Results store, None if not stored
+            alignment (ResultsAlignment): Alignment of the results
+            grid: Grid, None for a line scan
+        """
+        log = logging.getLogger("HWR")
+        threadpool = gevent.get_hub().threadpool
+        best_positions = results_aligned.get("best_positions", [])
+        if results_store is None:
+            results_store = ResultsStore(None, results_raw, read_only=True)
+        else:
+            results_store.flush()
 
+        if params_dict["lines_num"] > 1:
+            processing_grid_overlay_file = os.path.join(
+                params_dict["archive_directory"], "grid_overlay.png"
+            )
             try:
-                if not os.path.exists(os.path.dirname(processing_grid_overlay_file)):
-                    os.makedirs(os.path.dirname(processing_grid_overlay_file))
-
-                plt.imsave(
-                    processing_grid_overlay_file,
-                    np.transpose(self.results_aligned["score"]),
-                    format="png",
-                    cmap="hot",
+                threadpool.apply(
+                    self.save_grid_overlay,
+                    (
+                        processing_grid_overlay_file,
+                        alignment.align(
+                            results_store.get("score"), results_aligned["score"].shape
+                        ),
+                    ),
                 )
-                self.grid.set_overlay_pixmap(processing_grid_overlay_file)
+                grid.set_overlay_pixmap(processing_grid_overlay_file)
                 log.info(
                     "Online processing: Grid overlay figure saved %s"
                     % processing_grid_overlay_file
@@ -533,39 +649,162 @@ class AbstractOnlineProcessing(HardwareObject):
                     % processing_grid_overlay_file
                 )
 
+        # ---------------------------------------------------------------------
+        # Stores plot in the processing directory, also used by ISPyB
+        try:
+            threadpool.apply(
+                self.save_results_plot,
+                (
+                    params_dict,
+                    results_store,
+                    alignment,
+                    results_aligned["score"].shape,
+                    best_positions,
+                ),
+            )
+            log.info(
+                "Online processing: Plot saved in %s" % params_dict["cartography_path"]
+            )
+        except Exception:
+            log.exception(
+                "Online processing: Could not save plot in %s"
+                % params_dict["cartography_path"]
+            )
+
+        # ---------------------------------------------------------------------
+        # Generates html and json files
+        try:
+            SimpleHTML.generate_online_processing_report(results_aligned, params_dict)
+            log.info(
+                "Online processing: Html report saved in %s"
+                % params_dict["html_file_path"]
+            )
+            log.info(
+                "Online processing: Json report saved in %s"
+                % params_dict["json_file_path"]
+            )
+        except Exception as ex:
+            log.exception(
+                "Online processing: Could not save results html %s: %s"
+                % (params_dict["html_file_path"], str(ex))
+            )
+            log.exception(
+                "Online processing: Could not save json results in %s : %s"
+                % (params_dict["json_file_path"], str(ex))
+            )
+
+        # ---------------------------------------------------------------------
+        # Writes results in the csv file
+        try:
+            det_pixel_size = HWR.beamline.detector.get_pixel_size()
+            header = "%s,%d,%d,%d,%d,%d,%s,%d,%d" % (
+                params_dict["template"],
+                params_dict["first_image_num"],
+                params_dict["images_num"],
+                params_dict["run_number"],
+                params_dict["run_number"],
+                params_dict["lines_num"],
+                str(params_dict["reversing_rotation"]),
+                det_pixel_size[0],
+                det_pixel_size[1],
+            )
+            threadpool.apply(
+                results_store.write_csv,
+                (
+                    params_dict["csv_file_path"],
+                    ("score", "spots_num", "spots_resolution"),
+                    ("%d", "%f", "%d", "%f"),
+                    header,
+                ),
+            )
+            log.info(
+                "Online processing: Raw data stored in %s"
+                % params_dict["csv_file_path"]
+            )
+        except Exception:
+            log.error(
+                "Online processing: Unable to store raw data in %s"
+                % params_dict["csv_file_path"]
+            )
+        # ---------------------------------------------------------------------
+
+    @staticmethod
+    def save_grid_overlay(path, score):
+        """Saves the grid overlay image. Does not use pyplot, can be called
+        in a thread.
+
+        Args:
+            path (str): Image path
+            score (numpy.ndarray): Score aligned on the grid
+        """
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        imsave(path, np.transpose(score), format="png", cmap="hot")
+
+    @staticmethod
+    def save_results_plot(params_dict, results_store, alignment, shape, best_positions):
+        """Saves the results plot in params_dict["cartography_path"]: the
+        score on the grid for a mesh, the results per image otherwise. Does
+        not use pyplot, can be called in a thread.
+
+        Args:
+            params_dict (dict): Processing parameters
+            results_store (ResultsStore): Results store
+            alignment (ResultsAlignment): Alignment of the results
+            shape (tuple): Shape of the aligned results
+            best_positions (list): Best positions
+        """
+        fig = Figure()
+        if params_dict["lines_num"] > 1:
+            score = alignment.align(results_store.get("score"), shape)
+            ax = fig.subplots(nrows=1, ncols=1)
+            current_max = max(fig.get_size_inches())
+            grid_width = params_dict["steps_x"] * params_dict["xOffset"]
+            grid_height = params_dict["steps_y"] * params_dict["yOffset"]
+
+            if grid_width > grid_height:
+                fig.set_size_inches(current_max, current_max * grid_height / grid_width)
+            else:
+                fig.set_size_inches(current_max * grid_width / grid_height, current_max)
+
+            im = ax.imshow(
+                np.transpose(score),
+                interpolation="none",
+                aspect="auto",
+                extent=[0, score.shape[0], 0, score.shape[1]],
+            )
+            im.set_cmap("hot")
+
             if len(best_positions) > 0:
-                plt.axvline(x=best_positions[0]["col"], linewidth=0.5)
-                plt.axhline(y=best_positions[0]["row"], linewidth=0.5)
+                ax.axvline(x=best_positions[0]["col"], linewidth=0.5)
+                ax.axhline(y=best_positions[0]["row"], linewidth=0.5)
 
                 divider = make_axes_locatable(ax)
                 cax = divider.append_axes("right", size=0.1, pad=0.05)
                 cax.tick_params(axis="x", labelsize=8)
                 cax.tick_params(axis="y", labelsize=8)
-                plt.colorbar(im, cax=cax)
+                fig.colorbar(im, cax=cax)
         else:
-            fig, ax = plt.subplots(nrows=2, ncols=1)
-            max_resolution = self.params_dict["resolution"]
-            min_resolution = self.results_aligned["spots_resolution"].max()
-            max_score = self.results_aligned["score"].max()
+            score = results_store.get("score")
+            spots_num = results_store.get("spots_num")
+            spots_resolution = results_store.get("spots_resolution")
+            ax = fig.subplots(nrows=2, ncols=1)
+            max_score = score.max()
 
             if max_score == 0:
                 max_score = 1
-            max_spots_num = self.results_aligned["spots_num"].max()
+            max_spots_num = spots_num.max()
             if max_spots_num == 0:
                 max_spots_num = 1
 
+            ax[0].plot(score / max_score, ",", label="Score", c="r")
             ax[0].plot(
-                self.results_aligned["score"] / max_score, ",", label="Score", c="r"
-            )
-            ax[0].plot(
-                self.results_aligned["spots_num"] / max_spots_num,
+                spots_num / max_spots_num,
                 ",",
                 label="Number of spots",
                 c="b",
             )
-            ax[0].plot(
-                self.results_aligned["spots_resolution"], ".", label="Resolution", c="y"
-            )
+            ax[0].plot(spots_resolution, ".", label="Resolution", c="y")
 
             ax[0].legend(
                 loc="lower center",
@@ -577,33 +816,27 @@ class AbstractOnlineProcessing(HardwareObject):
                 fontsize=8,
             )
             ax[0].set_ylim(-0.01, 1.1)
-            ax[0].set_xlim(0, self.params_dict["images_num"])
+            ax[0].set_xlim(0, params_dict["images_num"])
 
-            positions = np.linspace(
-                0, self.results_aligned["spots_resolution"].max(), 5
-            )
+            positions = np.linspace(0, spots_resolution.max(), 5)
             labels = ["inf"]
             for item in positions[1:]:
                 labels.append("%.2f" % (1.0 / item))
             ax[0].set_yticks(positions)
             ax[0].set_yticklabels(labels)
-
-            # new_labels = numpy.linspace(min_resolution, max_resolution / 1.2, len(ax.get_yticklabels()))
-            # new_labels = numpy.round(new_labels, 1)
-            # ax.set_yticklabels(new_labels)
             ax[0].set_ylabel("Resolution")
 
             ay1 = ax[0].twinx()
             new_labels = np.linspace(
                 0,
-                self.results_aligned["spots_num"].max(),
+                spots_num.max(),
                 len(ay1.get_yticklabels()),
                 dtype=np.int16,
             )
             ay1.set_yticklabels(new_labels)
             ay1.set_ylabel("Number of spots")
 
-            ax[1].plot(self.results_raw["is"], ",", label="Intensity", c="g")
+            ax[1].plot(results_store.get("is"), ",", label="Intensity", c="g")
             ax[1].set_ylabel("Intensity")
 
             for ax_plot in ax:
@@ -611,135 +844,58 @@ class AbstractOnlineProcessing(HardwareObject):
                 ax_plot.tick_params(axis="y", labelsize=8)
                 ax_plot.grid(True)
 
-        # ---------------------------------------------------------------------
-        # Stores plot in the processing directory
-        try:
-            if not os.path.exists(
-                os.path.dirname(self.params_dict["cartography_path"])
-            ):
-                os.makedirs(os.path.dirname(self.params_dict["cartography_path"]))
-            fig.savefig(
-                self.params_dict["cartography_path"], dpi=100, bbox_inches="tight"
-            )
-            log.info(
-                "Online processing: Plot saved in %s"
-                % self.params_dict["cartography_path"]
-            )
-        except Exception:
-            log.exception(
-                "Online processing: Could not save plot in %s"
-                % self.params_dict["cartography_path"]
-            )
-
-        # ---------------------------------------------------------------------
-        # Stores plot for ISPyB
-        try:
-            if not os.path.exists(
-                os.path.dirname(self.params_dict["cartography_path"])
-            ):
-                os.makedirs(os.path.dirname(self.params_dict["cartography_path"]))
-            fig.savefig(
-                self.params_dict["cartography_path"], dpi=100, bbox_inches="tight"
-            )
-            log.info(
-                "Online processing: Plot for ISPyB saved in %s"
-                % self.params_dict["cartography_path"]
-            )
-        except Exception:
-            log.exception(
-                "Online processing: Could not save plot for ISPyB %s"
-                % self.params_dict["cartography_path"]
-            )
-
-        plt.close(fig)
-
-        # ---------------------------------------------------------------------
-        # Generates html and json files
-        try:
-            SimpleHTML.generate_online_processing_report(
-                self.results_aligned, self.params_dict
-            )
-            log.info(
-                "Online processing: Html report saved in %s"
-                % self.params_dict["html_file_path"]
-            )
-            log.info(
-                "Online processing: Json report saved in %s"
-                % self.params_dict["json_file_path"]
-            )
-        except Exception as ex:
-            log.exception(
-                "Online processing: Could not save results html %s: %s"
-                % (self.params_dict["html_file_path"], str(ex))
-            )
-            log.exception(
-                "Online processing: Could not save json results in %s : %s"
-                % (self.params_dict["json_file_path"], str(ex))
-            )
+        if not os.path.exists(os.path.dirname(params_dict["cartography_path"])):
+            os.makedirs(os.path.dirname(params_dict["cartography_path"]))
+        fig.savefig(params_dict["cartography_path"], dpi=100, bbox_inches="tight")
 
-        # ---------------------------------------------------------------------
-        # Writes results in the csv file
-        try:
-            det_pixel_size = HWR.beamline.detector.get_pixel_size()
-            with open(self.params_dict["csv_file_path"], "w") as processing_csv_file:
-                processing_csv_file.write(
-                    "%s,%d,%d,%d,%d,%d,%s,%d,%d\n"
-                    % (
-                        self.params_dict["template"],
-                        self.params_dict["first_image_num"],
-                        self.params_dict["images_num"],
-                        self.params_dict["run_number"],
-                        self.params_dict["run_number"],
-                        self.params_dict["lines_num"],
-                        str(self.params_dict["reversing_rotation"]),
-                        det_pixel_size[0],
-                        det_pixel_size[1],
+    def get_alignment(self):
+        """Returns the alignment of the current run, created with the
+        (col, row) of each image of the grid at the first call.
+        """
+        images_num = self.results_raw["score"].size
+        if self.alignment is None or self.alignment.scores.size != images_num:
+            if self.grid:
+                first_image_num = self.params_dict["first_image_num"]
+                cols, rows = (
+                    np.array(
+                        [
+                            self.grid.get_col_row_from_image_serial(
+                                index + first_image_num
+                            )
+                            for index in range(images_num)
+                        ],
+                        dtype=int,
                     )
+                    .reshape(-1, 2)
+                    .T
                 )
-                for index in range(self.params_dict["images_num"]):
-                    processing_csv_file.write(
-                        "%d,%f,%d,%f\n"
-                        % (
-                            index,
-                            self.results_raw["score"][index],
-                            self.results_raw["spots_num"][index],
-                            self.results_raw["spots_resolution"][index],
-                        )
-                    )
-            log.info(
-                "Online processing: Raw data stored in %s"
-                % self.params_dict["csv_file_path"]
-            )
-        except Exception:
-            log.error(
-                "Online processing: Unable to store raw data in %s"
-                % self.params_dict["csv_file_path"]
-            )
-        # ---------------------------------------------------------------------
+                shape = self.results_aligned["score"].shape
+                valid = (cols >= 0) & (rows >= 0)
+                if len(shape) == 2:
+                    valid &= (cols < shape[0]) & (rows < shape[1])
+            else:
+                cols = np.arange(images_num)
+                rows = np.zeros(images_num, dtype=int)
+                valid = np.ones(images_num, dtype=bool)
+            self.alignment = ResultsAlignment(cols, rows, valid)
+        return self.alignment
 
     def align_processing_results(self, start_index, end_index):
         """Realigns all results. Each results (one dimensional numpy array)
         is converted to 2d numpy array according to diffractometer geometry.
         Function also extracts 10 (if they exist) best positions
         """
-        # Each result array is realigned
+        alignment = self.get_alignment()
+        images_num = alignment.scores.size
+        indexes = np.arange(max(start_index, 0), min(end_index, images_num - 1) + 1)
+        cells = indexes[alignment.valid[indexes]]
 
+        # Each result array is realigned
         for score_key in self.results_raw:
-            if (
-                self.grid
-                and self.results_raw[score_key].size == self.params_dict["images_num"]
-            ):
-                for cell_index in range(start_index, end_index + 1):
-                    col, row = self.grid.get_col_row_from_image_serial(
-                        cell_index + self.params_dict["first_image_num"]
-                    )
-                    if (
-                        col < self.results_aligned[score_key].shape[0]
-                        and row < self.results_aligned[score_key].shape[1]
-                    ):
-                        self.results_aligned[score_key][col][row] = self.results_raw[
-                            score_key
-                        ][cell_index]
+            if self.grid and self.results_raw[score_key].size == images_num:
+                self.results_aligned[score_key][
+                    alignment.cols[cells], alignment.rows[cells]
+                ] = self.results_raw[score_key][cells]
             else:
                 self.results_aligned[score_key] = self.results_raw[score_key]
                 if self.interpolate_results:
@@ -754,20 +910,20 @@ class AbstractOnlineProcessing(HardwareObject):
                     )
                     self.results_aligned["interp_" + score_key] = spline(x_array)
 
+        alignment.update(self.results_raw["score"], indexes)
+        if self.results_store is not None:
+            self.results_store.write(indexes, self.results_raw)
+
         if self.grid:
             self.grid.set_score(self.results_raw["spots_num"])
-            (center_x, center_y) = ndimage.measurements.center_of_mass(
-                self.results_aligned["score"]
-            )
+            (center_x, center_y) = alignment.center_of_mass()
             self.results_aligned["center_mass"] = self.grid.get_motor_pos_from_col_row(
                 center_x, center_y
             )
         else:
             centred_positions = self.data_collection.get_centred_positions()
             if len(centred_positions) == 2:
-                center_x = ndimage.measurements.center_of_mass(
-                    self.results_aligned["score"]
-                )[0]
+                center_x = alignment.center_of_mass()[0]
                 self.results_aligned["center_mass"] = (
                     HWR.beamline.diffractometer.get_point_from_line(
                         centred_positions[0],
@@ -782,35 +938,31 @@ class AbstractOnlineProcessing(HardwareObject):
         # Best positions are extracted
         best_positions_list = []
 
-        index_arr = (-self.results_raw["score"]).argsort()[:10]
-        if len(index_arr) > 0:
-            for index in index_arr:
-                if self.results_raw["score"][index] > 0:
-                    best_position = {}
-                    best_position["index"] = index
-                    best_position["index_serial"] = (
-                        self.params_dict["first_image_num"] + index
-                    )
-                    best_position["score"] = self.results_raw["score"][index]
-                    best_position["spots_num"] = self.results_raw["spots_num"][index]
-                    best_position["spots_resolution"] = self.results_raw[
-                        "spots_resolution"
-                    ][index]
-                    best_position["filename"] = os.path.basename(
-                        self.params_dict["template"]
-                        % (
-                            self.params_dict["run_number"],
-                            self.params_dict["first_image_num"] + index,
-                        )
+        for index in alignment.best_indexes:
+            if self.results_raw["score"][index] > 0:
+                index = int(index)
+                best_position = {}
+                best_position["index"] = index
+                best_position["index_serial"] = (
+                    self.params_dict["first_image_num"] + index
+                )
+                best_position["score"] = self.results_raw["score"][index]
+                best_position["spots_num"] = self.results_raw["spots_num"][index]
+                best_position["spots_resolution"] = self.results_raw[
+                    "spots_resolution"
+                ][index]
+                best_position["filename"] = os.path.basename(
+                    self.params_dict["template"]
+                    % (
+                        self.params_dict["run_number"],
+                        self.params_dict["first_image_num"] + index,
                     )
+                )
 
-                    cpos = None
+                if index not in alignment.positions:
                     if self.grid:
-                        col, row = self.grid.get_col_row_from_image_serial(
-                            index + self.params_dict["first_image_num"]
-                        )
-                        col += 0.5
-                        row = self.params_dict["steps_y"] - row - 0.5
+                        col = alignment.cols[index] + 0.5
+                        row = self.params_dict["steps_y"] - alignment.rows[index] - 0.5
                         cpos = self.grid.get_motor_pos_from_col_row(col, row)
                     else:
                         col = index
@@ -820,10 +972,12 @@ class AbstractOnlineProcessing(HardwareObject):
                         # num_images = self.data_collection.acquisitions[0].acquisition_parameters.num_images - 1
                         # (point_one, point_two) = self.data_collection.get_centred_positions()
                         # cpos = HWR.beamline.diffractometer.get_point_from_line(point_one, point_two, index, num_images)
-                    best_position["col"] = col
-                    best_position["row"] = row
-                    best_position["cpos"] = cpos
-                    best_positions_list.append(best_position)
+                    alignment.positions[index] = (col, row, cpos)
+                col, row, cpos = alignment.positions[index]
+                best_position["col"] = col
+                best_position["row"] = row
+                best_position["cpos"] = cpos
+                best_positions_list.append(best_position)
 
         self.results_aligned["best_positions"] = best_positions_list
 
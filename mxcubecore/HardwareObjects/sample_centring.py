@@ -6,6 +6,7 @@ import time
 
 import gevent.event
 import numpy
+from PIL import Image
 from scipy import optimize
 
 try:
@@ -36,6 +37,10 @@ CURRENT_CENTRING = None
 SAVED_INITIAL_POSITIONS = {}
 READY_FOR_NEXT_POINT = gevent.event.Event()
 NUM_CENTRING_ROUNDS = 1
+# Detect the loop on the camera image in memory rather than on a snapshot file
+IN_MEMORY_LOOP_DETECTION = True
+# Timing of the rounds of the last automatic centring (see RoundTiming)
+ROUND_TIMES = []
 
 
 class CentringMotor:
@@ -545,11 +550,123 @@ def start_auto(
     return CURRENT_CENTRING
 
 
-def find_loop(sample_view, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
+def get_loop_image(sample_view):
+    """Get the camera image for the loop detection, as a grayscale numpy
+    array, or as a snapshot file if IN_MEMORY_LOOP_DETECTION is False or
+    the camera does not provide the raw image.
+
+    Args:
+        sample_view (SampleView): Sample view
+
+    Returns:
+        (numpy.ndarray or str): Image or snapshot file path
+    """
+    camera = sample_view.camera
+    if IN_MEMORY_LOOP_DETECTION:
+        image = None
+        if hasattr(camera, "get_frame"):
+            try:
+                image = camera.get_frame().convert("gray")
+            except ValueError:
+                # no frame yet, or a pixel format not converted
+                logging.getLogger("HWR").debug(
+                    "Camera frame not converted, using a snapshot", exc_info=True
+                )
+        elif hasattr(camera, "get_last_image"):
+            data, width, height = camera.get_last_image()[:3]
+            image = numpy.asarray(
+                Image.frombuffer(
+                    "RGB", (width, height), data, "raw", "RGB", 0, 1
+                ).convert("L")
+            )
+
+        if image is not None:
+            # the frame conversions are shared with the other consumers
+            return numpy.require(image, requirements=("C", "W"))
+
     snapshot_filename = os.path.join(
         tempfile.gettempdir(), "mxcube_sample_snapshot.png"
     )
     sample_view.save_snapshot(snapshot_filename, overlay=False, bw=True)
+    return snapshot_filename
+
+
+def acquire_loop_image(sample_view, motor=None, ready_event=None):
+    """Acquire the image for the loop detection in a greenlet, as soon as
+    ready_event is set and the motor is ready, so that the image is there
+    when the motor move ends.
+
+    Args:
+        sample_view (SampleView): Sample view
+        motor (AbstractMotor): Motor to wait for (e.g. the rotating phi)
+        ready_event (gevent.event.Event): Event to wait for
+
+    Returns:
+        (gevent.Greenlet): Greenlet returning the image (see get_loop_image)
+    """
+
+    def acquire():
+        if ready_event is not None:
+            ready_event.wait()
+        if motor is not None:
+            motor.wait_ready(timeout=30)
+        return get_loop_image(sample_view)
+
+    return gevent.spawn(acquire)
+
+
+class RoundTiming:
+    """Time spent in an automatic centring round"""
+
+    def __init__(self, name):
+        self.name = name
+        self.images = 0
+        self.acquisition = 0.0
+        self.detection = 0.0
+        self.total = None
+        self._start = time.perf_counter()
+
+    def add_image(self, acquisition, detection):
+        self.images += 1
+        self.acquisition += acquisition
+        self.detection += detection
+
+    def done(self, msg_cb=None):
+        self.total = time.perf_counter() - self._start
+        ROUND_TIMES.append(self)
+        logging.getLogger("HWR").info(str(self))
+        if callable(msg_cb):
+            msg_cb(str(self))
+
+    def __str__(self):
+        return (
+            "Automatic centring %s: %.2f s, %d images "
+            "(waiting for images %.0f ms, loop detection %.0f ms)"
+            % (
+                self.name,
+                self.total or 0,
+                self.images,
+                1000 * self.acquisition,
+                1000 * self.detection,
+            )
+        )
+
+
+def find_loop(
+    sample_view,
+    pixelsPerMm_Hor,
+    chi_angle,
+    msg_cb,
+    new_point_cb,
+    image=None,
+    timing=None,
+):
+    start = time.perf_counter()
+    if image is None:
+        image = get_loop_image(sample_view)
+    elif isinstance(image, gevent.Greenlet):
+        image = image.get()
+    acquired = time.perf_counter()
 
     # Lucid does not accept 0 degree rotation and
     # has a reference frame that is reversed to the one used
@@ -560,8 +677,10 @@ def find_loop(sample_view, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
         chi_angle = -chi_angle
 
     info, x, y = lucid.find_loop(
-        snapshot_filename, rotation=chi_angle, debug=False, IterationClosing=6
+        image, rotation=chi_angle, debug=False, IterationClosing=6
     )
+    if timing is not None:
+        timing.add_image(acquired - start, time.perf_counter() - acquired)
 
     try:
         x = float(x)
@@ -595,22 +714,38 @@ def auto_center(
 ):
     imgWidth = sample_view.camera.get_width()
     imgHeight = sample_view.camera.get_height()
+    del ROUND_TIMES[:]
 
     # check if loop is there at the beginning
+    timing = RoundTiming("loop search")
+    image = acquire_loop_image(sample_view)
     i = 0
     while -1 in find_loop(
-        sample_view, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb
+        sample_view,
+        pixelsPerMm_Hor,
+        chi_angle,
+        msg_cb,
+        new_point_cb,
+        image=image,
+        timing=timing,
     ):
         phi.set_value_relative(90)
         i += 1
         if i > 4:
+            timing.done(msg_cb)
             if callable(msg_cb):
                 msg_cb("No loop detected, aborting")
             return
+        image = acquire_loop_image(sample_view, phi)
+    timing.done(msg_cb)
 
     for k in range(NUM_CENTRING_ROUNDS):
         if callable(msg_cb):
             msg_cb("Doing automatic centring")
+        timing = RoundTiming("round %d" % (k + 1))
+        if image is None:
+            # the sample moved to the centred position of the previous round
+            image = acquire_loop_image(sample_view)
 
         centring_greenlet = gevent.spawn(
             center,
@@ -629,7 +764,13 @@ def auto_center(
 
         for a in range(n_points):
             x, y = find_loop(
-                sample_view, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb
+                sample_view,
+                pixelsPerMm_Hor,
+                chi_angle,
+                msg_cb,
+                new_point_cb,
+                image=image,
+                timing=timing,
             )
             # logging.info("in autocentre, x=%f, y=%f",x,y)
             if x < 0 or y < 0:
@@ -642,6 +783,8 @@ def auto_center(
                         chi_angle,
                         msg_cb,
                         new_point_cb,
+                        image=acquire_loop_image(sample_view, phi),
+                        timing=timing,
                     )
                     if -1 in (x, y):
                         continue
@@ -663,9 +806,15 @@ def auto_center(
                     raise RuntimeError("Could not centre sample automatically.")
                 phi.set_value_relative(-i * 5)
             else:
-                user_click(x, y, wait=True)
+                user_click(x, y)
+
+            if a < n_points - 1:
+                # the next image is acquired as soon as phi stops rotating
+                image = acquire_loop_image(sample_view, phi, READY_FOR_NEXT_POINT)
 
         centred_pos = centring_greenlet.get()
+        timing.done(msg_cb)
         end(centred_pos)
+        image = None
 
     return centred_pos
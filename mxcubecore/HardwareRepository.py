@@ -34,16 +34,21 @@ from __future__ import (
 import importlib
 import logging
 import os
+import re
 import sys
 import time
 import traceback
 import weakref
+from contextlib import contextmanager
 from datetime import datetime
 from typing import (
     TYPE_CHECKING,
     Union,
 )
 
+import gevent
+import gevent.event
+import gevent.lock
 from ruamel.yaml import YAML
 
 from mxcubecore import (
@@ -51,6 +56,7 @@ from mxcubecore import (
     HardwareObjectFileParser,
 )
 from mxcubecore.dispatcher import dispatcher
+from mxcubecore.utils import config_cache
 from mxcubecore.utils.conversion import (
     make_table,
     string_types,
@@ -77,6 +83,254 @@ TIMERS = []
 beamline = None
 BEAMLINE_CONFIG_FILE = "beamline_config.yml"
 
+# Maximum number of hardware objects initialised concurrently at startup.
+# With 1, the objects are loaded one after the other, in configuration order.
+LOAD_CONCURRENCY = 1
+
+# References to other hardware objects in XML files
+XML_REFERENCE_RE = re.compile(r"""\b(?:hwrid|href)\s*=\s*["']([^"']+)["']""")
+
+
+class _LoadSlots:
+    """Limit the number of hardware objects initialised concurrently.
+
+    Slots are re-entrant: a greenlet holding a slot keeps it for the objects
+    it loads while initialising an object (e.g. resolving XML references).
+    """
+
+    def __init__(self, size=1):
+        self._semaphore = gevent.lock.BoundedSemaphore(size)
+        self._holders = set()
+
+    @contextmanager
+    def slot(self):
+        current = gevent.getcurrent()
+        if current in self._holders:
+            yield
+            return
+        with _timed_load():
+            # waiting for a slot is not part of the load time
+            self._semaphore.acquire()
+        self._holders.add(current)
+        try:
+            yield
+        finally:
+            self._holders.discard(current)
+            self._semaphore.release()
+
+
+_load_slots = _LoadSlots()
+
+# Load timing stacks per greenlet: [start time, time spent in nested loads]
+_timing_stacks = {}
+
+
+@contextmanager
+def _timed_load(node=None):
+    """Record the load time of a dependency graph node in the repository
+    load_times, excluding the nested loads and waits. With no node, only
+    exclude the time from the enclosing load"""
+    current = gevent.getcurrent()
+    stack = _timing_stacks.setdefault(current, [])
+    entry = [time.time(), 0.0]
+    stack.append(entry)
+    try:
+        yield
+    finally:
+        stack.pop()
+        elapsed = time.time() - entry[0]
+        if stack:
+            stack[-1][1] += elapsed
+        else:
+            del _timing_stacks[current]
+        if node is not None and _instance is not None:
+            _instance.load_times[node] = 1000 * (elapsed - entry[1])
+
+
+def _graph_node(config_file):
+    """Dependency graph node of a configuration file: the file name for yaml
+    files, the hardware object name (e.g. /session) for xml files"""
+    fname, fext = os.path.splitext(config_file)
+    if fext == ".xml":
+        return fname if fname.startswith("/") else "/" + fname
+    return config_file
+
+
+def _xml_reference_node(reference, node):
+    """Hardware object name of a reference, as resolved by the xml parser"""
+    if reference.startswith("../"):
+        return "/".join(node.split("/")[:-1] + [reference[3:]])
+    if reference.startswith("./"):
+        return "/".join(node.split("/")[:-1] + [reference[2:]])
+    return reference if reference.startswith("/") else "/" + reference
+
+
+def get_dependency_graph(configuration_file=BEAMLINE_CONFIG_FILE, _graph=None):
+    """Get the dependencies between the configuration files, from the
+    _objects of the yaml files and the references (hwrid, href) of the
+    xml files.
+
+    Args:
+        configuration_file (str): Configuration file to start from
+        _graph (dict): Internal, graph being built
+
+    Returns:
+        dict: Node to the list of nodes it depends on. Nodes are the yaml
+              file names and the xml hardware object names (e.g. /session)
+    """
+    if _graph is None:
+        _graph = {}
+    node = _graph_node(configuration_file)
+    if node in _graph:
+        return _graph
+    _graph[node] = dependencies = []
+
+    is_xml = node.startswith("/")
+    if is_xml:
+        path = _instance.find_in_repository(node + os.path.extsep + "xml")
+    else:
+        path = _instance.find_in_repository(configuration_file)
+    if path is None:
+        return _graph
+
+    try:
+        with open(path, "r") as fp0:
+            if is_xml:
+                for reference in XML_REFERENCE_RE.findall(fp0.read()):
+                    dependencies.append(_xml_reference_node(reference, node))
+            else:
+                configuration = config_cache.load_yaml(yaml, fp0.read(), path)
+                objects = configuration.get("_objects") or {}
+                dependencies.extend(_graph_node(name) for name in objects.values())
+    except Exception:
+        logging.getLogger("HWR").exception(
+            "Cannot read the dependencies of %s", configuration_file
+        )
+
+    for dependency in list(dependencies):
+        if dependency.startswith("/"):
+            get_dependency_graph(dependency + ".xml", _graph)
+        else:
+            get_dependency_graph(dependency, _graph)
+    return _graph
+
+
+def _dependency_closure(graph, node):
+    """All the nodes a node depends on, directly or not"""
+    closure = set()
+    todo = list(graph.get(node, ()))
+    while todo:
+        dependency = todo.pop()
+        if dependency not in closure:
+            closure.add(dependency)
+            todo.extend(graph.get(dependency, ()))
+    return closure
+
+
+def get_critical_path_time(graph, load_times, node=BEAMLINE_CONFIG_FILE):
+    """Get the load time of the longest chain of dependent objects, i.e. the
+    shortest possible time to load a node with unlimited concurrency.
+
+    Args:
+        graph (dict): Dependency graph (see get_dependency_graph)
+        load_times (dict): Node to its own load time [ms]
+        node (str): Node to start from
+
+    Returns:
+        float: Critical path time [ms]
+    """
+    times = {}
+
+    def path_time(node, visiting):
+        if node in times:
+            return times[node]
+        if node in visiting:
+            # circular reference
+            return 0
+        visiting.add(node)
+        result = load_times.get(node, 0) + max(
+            [path_time(dependency, visiting) for dependency in graph.get(node, ())]
+            or [0]
+        )
+        visiting.discard(node)
+        times[node] = result
+        return result
+
+    return path_time(node, set())
+
+
+def _load_contained_object(role, config_file, container, class_name, _table):
+    """Load an object contained in a yaml configured object"""
+    fname, fext = os.path.splitext(config_file)
+    if fext in (".yaml", ".yml"):
+        with _timed_load(config_file):
+            load_from_yaml(config_file, role=role, _container=container, _table=_table)
+    elif fext == ".xml":
+        msg1 = ""
+        time0 = time.time()
+        try:
+            with _load_slots.slot():
+                hwobj = _instance.get_hardware_object(fname)
+            if hwobj is None:
+                msg1 = "No object loaded"
+                class_name1 = "None"
+            else:
+                class_name1 = hwobj.__class__.__name__
+                if hasattr(container, role):
+                    container.replace_object(role, hwobj)
+                else:
+                    msg1 = "No such role: %s.%s" % (class_name, role)
+        except Exception as ex:
+            msg1 = "Loading error (%s)" % str(ex)
+            class_name1 = ""
+        load_time = 1000 * (time.time() - time0)
+        _table.append((role, class_name1, config_file, "%.1d" % load_time, msg1))
+
+
+def _load_contained_objects(_objects, container, class_name, _table):
+    """Load the objects contained in a yaml configured object concurrently.
+
+    Each object is loaded once the other contained objects it depends on
+    (see get_dependency_graph) are loaded, at most LOAD_CONCURRENCY objects
+    being initialised at the same time. The objects failing to load (e.g.
+    using in their init another object not loaded yet) are loaded again
+    once the other ones are loaded, one after the other.
+    """
+    graph = _instance.dependency_graph
+    for config_file in _objects.values():
+        get_dependency_graph(config_file, graph)
+
+    nodes = {role: _graph_node(config_file) for role, config_file in _objects.items()}
+    closures = {node: _dependency_closure(graph, node) for node in nodes.values()}
+    loaded = {node: gevent.event.Event() for node in nodes.values()}
+
+    def load(role, config_file):
+        node = nodes[role]
+        try:
+            for dependency in closures[node]:
+                # objects depending on each other are not waited for
+                if dependency in loaded and node not in closures[dependency]:
+                    loaded[dependency].wait()
+            _load_contained_object(role, config_file, container, class_name, _table)
+        finally:
+            loaded[node].set()
+
+    with _timed_load():
+        gevent.joinall(
+            [
+                gevent.spawn(load, role, config_file)
+                for role, config_file in _objects.items()
+            ]
+        )
+
+        for role, config_file in _objects.items():
+            if role in container._objects and container._objects[role] is None:
+                logging.getLogger("HWR").info(
+                    "Loading %s again, after the other objects", config_file
+                )
+                _instance.invalid_hardware_objects.discard(nodes[role])
+                _load_contained_object(role, config_file, container, class_name, _table)
+
 
 def load_from_yaml(configuration_file, role, _container=None, _table=None):
     """
@@ -112,7 +366,14 @@ def load_from_yaml(configuration_file, role, _container=None, _table=None):
     if not msg0:
         # Load the configuration file
         with open(configuration_path, "r") as fp0:
-            configuration = yaml.load(fp0)
+            configuration = config_cache.load_yaml(yaml, fp0.read(), configuration_path)
+        _instance.dependency_graph.setdefault(
+            _graph_node(configuration_file),
+            [
+                _graph_node(name)
+                for name in (configuration.get("_objects") or {}).values()
+            ],
+        )
 
         # Get actual class
         initialise_class = configuration.pop("_initialise_class", None)
@@ -150,35 +411,38 @@ def load_from_yaml(configuration_file, role, _container=None, _table=None):
                 # at top level we want to get the actual error
                 raise
 
-    if not msg0:
-        try:
-            # instantiate object
-            result = cls(name=role, **initialise_class)
-        except Exception:
-            if _container:
-                msg0 = "Error instantiating %s" % cls.__name__
-                print(
-                    "Encountered Exception (continuing):\n%s" % traceback.format_exc()
-                )
-            else:
-                # at top level we want to get the actual error
-                raise
+    # The object own initialisation takes a load slot, its contents do not
+    with _load_slots.slot():
+        if not msg0:
+            try:
+                # instantiate object
+                result = cls(name=role, **initialise_class)
+            except Exception:
+                if _container:
+                    msg0 = "Error instantiating %s" % cls.__name__
+                    print(
+                        "Encountered Exception (continuing):\n%s"
+                        % traceback.format_exc()
+                    )
+                else:
+                    # at top level we want to get the actual error
+                    raise
 
-    if _container is None:
-        # We are loading the beamline object into HardwareRepository
-        # and want the link to be set before _init or content loading
-        beamline = result
+        if _container is None:
+            # We are loading the beamline object into HardwareRepository
+            # and want the link to be set before _init or content loading
+            beamline = result
 
-    if not msg0:
-        try:
-            # Initialise object
-            result._init()
-        except Exception:
-            if _container:
-                msg0 = "Error in %s._init()" % cls.__name__
-            else:
-                # at top level we want to get the actual error
-                raise
+        if not msg0:
+            try:
+                # Initialise object
+                result._init()
+            except Exception:
+                if _container:
+                    msg0 = "Error in %s._init()" % cls.__name__
+                else:
+                    # at top level we want to get the actual error
+                    raise
 
     if not msg0:
         # Recursively load contained objects (of any type that the system can support)
@@ -190,33 +454,14 @@ def load_from_yaml(configuration_file, role, _container=None, _table=None):
                 (role, class_name, configuration_file, "%.1d" % load_time, msg1)
             )
             msg0 = "Done loading contents"
-        for role1, config_file in _objects.items():
-            fname, fext = os.path.splitext(config_file)
-            if fext in (".yaml", ".yml"):
-                load_from_yaml(
-                    config_file, role=role1, _container=result, _table=_table
-                )
-            elif fext == ".xml":
-                msg1 = ""
-                time0 = time.time()
-                try:
-                    hwobj = _instance.get_hardware_object(fname)
-                    if hwobj is None:
-                        msg1 = "No object loaded"
-                        class_name1 = "None"
-                    else:
-                        class_name1 = hwobj.__class__.__name__
-                        if hasattr(result, role1):
-                            result.replace_object(role1, hwobj)
-                        else:
-                            msg1 = "No such role: %s.%s" % (class_name, role1)
-                except Exception as ex:
-                    msg1 = "Loading error (%s)" % str(ex)
-                    class_name = ""
-                load_time = 1000 * (time.time() - time0)
-                _table.append(
-                    (role1, class_name1, config_file, "%.1d" % load_time, msg1)
-                )
+        if LOAD_CONCURRENCY > 1 and len(_objects) > 1:
+            _load_contained_objects(_objects, result, class_name, _table)
+        else:
+            with _timed_load():
+                for role1, config_file in _objects.items():
+                    _load_contained_object(
+                        role1, config_file, result, class_name, _table
+                    )
 
         # Set simple, miscellaneous properties.
         # NB the attribute must have been initialied in the class __init__ first.
@@ -231,21 +476,25 @@ def load_from_yaml(configuration_file, role, _container=None, _table=None):
                     "%s has no attribute '%s'", class_name, key
                 )
 
-    if not msg0:
-        if _container:
-            if hasattr(_container, role):
-                _container.replace_object(role, result)
-            else:
-                msg0 = "No such role: %s.%s" % (_container.__class__.__name__, role)
-        try:
-            # Initialise object
-            result.init()
-        except Exception:
+    with _load_slots.slot():
+        if not msg0:
             if _container:
-                msg0 = "Error in %s.init()" % cls.__name__
-            else:
-                # at top level we want to get the actual error
-                raise
+                if hasattr(_container, role):
+                    _container.replace_object(role, result)
+                else:
+                    msg0 = "No such role: %s.%s" % (
+                        _container.__class__.__name__,
+                        role,
+                    )
+            try:
+                # Initialise object
+                result.init()
+            except Exception:
+                if _container:
+                    msg0 = "Error in %s.init()" % cls.__name__
+                else:
+                    # at top level we want to get the actual error
+                    raise
 
     load_time = 1000 * (time.time() - start_time)
     _table.append((role, class_name, configuration_file, "%.1d" % load_time, msg0))
@@ -279,18 +528,26 @@ def set_user_file_directory(user_file_directory):
     BaseHardwareObjects.HardwareObjectNode.set_user_file_directory(user_file_directory)
 
 
-def init_hardware_repository(configuration_path):
+def init_hardware_repository(configuration_path, load_concurrency=None):
     """Initialise hardware repository - must be run at program start
 
     Args:
         configuration_path (str): PATHSEP-separated string of directories
         giving configuration file lookup path
+        load_concurrency (int): Maximum number of hardware objects initialised
+        concurrently (default LOAD_CONCURRENCY). Objects are loaded once the
+        objects they reference in their configuration files are loaded, so
+        objects using other ones (e.g. through HWR.beamline) in their init
+        without referencing them should only be used with 1 (sequential load,
+        in configuration order).
 
     Returns:
 
     """
     global _instance
     global beamline
+    global LOAD_CONCURRENCY
+    global _load_slots
 
     if _instance is not None or beamline is not None:
         raise RuntimeError(
@@ -312,9 +569,16 @@ def init_hardware_repository(configuration_path):
         configuration_path = lookup_path
 
     logging.getLogger("HWR").info("Hardware repository: %s", configuration_path)
+    if load_concurrency is not None:
+        LOAD_CONCURRENCY = max(int(load_concurrency), 1)
+    _load_slots = _LoadSlots(LOAD_CONCURRENCY)
+
     _instance = __HardwareRepositoryClient(configuration_path)
     _instance.connect()
-    beamline = load_from_yaml(BEAMLINE_CONFIG_FILE, role="beamline")
+    start_time = time.time()
+    with _timed_load(BEAMLINE_CONFIG_FILE):
+        beamline = load_from_yaml(BEAMLINE_CONFIG_FILE, role="beamline")
+    _instance.load_elapsed_time = 1000 * (time.time() - start_time)
     beamline._hwr_init_done()
 
 
@@ -360,6 +624,13 @@ class __HardwareRepositoryClient:
         self.hwobj_info_list = []
         self.invalid_hardware_objects = None
         self.hardware_objects = None
+        # Hardware objects being loaded, name to (greenlet, AsyncResult)
+        self._loading = {}
+        # Dependency graph node to own load time [ms], see get_dependency_graph
+        self.load_times = {}
+        self.load_elapsed_time = None
+        # Dependency graph of the loaded objects, built while loading them
+        self.dependency_graph = {}
 
     def connect(self):
         if self.__connected:
@@ -436,6 +707,16 @@ class __HardwareRepositoryClient:
                     pass
                 break
 
+        if xml_data:
+            node = _graph_node(hwobj_name + os.path.extsep + "xml")
+            self.dependency_graph.setdefault(
+                node,
+                [
+                    _xml_reference_node(reference, node)
+                    for reference in XML_REFERENCE_RE.findall(xml_data)
+                ],
+            )
+
         start_time = datetime.now()
 
         if xml_data:
@@ -674,8 +955,26 @@ class __HardwareRepositoryClient:
 
                 if object_name in self.hardware_objects:
                     hardware_obj = self.hardware_objects[object_name]
+                elif object_name in self._loading:
+                    greenlet, loading = self._loading[object_name]
+                    if greenlet is gevent.getcurrent():
+                        logging.getLogger("HWR").error(
+                            "Circular reference to Hardware Object %s", object_name
+                        )
+                        return None
+                    # being loaded by another greenlet
+                    with _timed_load():
+                        hardware_obj = loading.get()
                 else:
-                    hardware_obj = self._load_hardware_object(object_name)
+                    hardware_obj = None
+                    loading = gevent.event.AsyncResult()
+                    self._loading[object_name] = (gevent.getcurrent(), loading)
+                    try:
+                        with _timed_load(object_name):
+                            hardware_obj = self._load_hardware_object(object_name)
+                    finally:
+                        del self._loading[object_name]
+                        loading.set(hardware_obj)
                 return hardware_obj
         except TypeError as err:
             logging.getLogger("HWR").exception(
@@ -913,6 +1212,60 @@ class __HardwareRepositoryClient:
         for row in sorted(self.hwobj_info_list):
             print("| %s" % row_format.format(*row))
         print("+", "=" * sum(longest_cols), "+")
+        self.print_load_times()
+
+    def get_load_times(self):
+        """Get the startup load times. The own load times of the objects are
+        wall clock times, only meaningful when the objects are loaded one
+        after the other.
+
+        Returns:
+            tuple: total (sum of the hardware objects own load times),
+                   critical path (see get_critical_path_time) and
+                   elapsed load times [ms]. The total and the critical path
+                   are None with a LOAD_CONCURRENCY above 1.
+        """
+        if LOAD_CONCURRENCY > 1:
+            return None, None, self.load_elapsed_time
+        return (
+            sum(self.load_times.values()),
+            get_critical_path_time(self.dependency_graph, self.load_times),
+            self.load_elapsed_time,
+        )
+
+    def print_load_times(self):
+        """Print the startup load times, and the objects on the critical path"""
+        if not self.load_times or self.load_elapsed_time is None:
+            return
+        graph = self.dependency_graph
+        total, critical_path, elapsed = self.get_load_times()
+        if total is None:
+            print(
+                make_table(
+                    ("Load", "Time (ms)"),
+                    [("Elapsed (concurrency %d)" % LOAD_CONCURRENCY, "%.1f" % elapsed)],
+                )
+            )
+            return
+
+        rows = []
+        node = BEAMLINE_CONFIG_FILE
+        while node is not None:
+            rows.append((node, "%.1f" % self.load_times.get(node, 0)))
+            dependencies = [
+                dependency
+                for dependency in graph.get(node, ())
+                if node not in _dependency_closure(graph, dependency)
+            ]
+            node = max(
+                dependencies,
+                key=lambda dep: get_critical_path_time(graph, self.load_times, dep),
+                default=None,
+            )
+        rows.append(("Critical path", "%.1f" % critical_path))
+        rows.append(("Total (sequential)", "%.1f" % total))
+        rows.append(("Elapsed (concurrency %d)" % LOAD_CONCURRENCY, "%.1f" % elapsed))
+        print(make_table(("Critical path", "Own load time (ms)"), rows))
 
     def reload_hardware_objects(self):
         """
@@ -1,4 +1,8 @@
+import hashlib
+import heapq
+import itertools
 import logging
+import time
 
 import gevent
 import gevent.monkey
@@ -17,8 +21,18 @@ log = logging.getLogger("HWR")
 
 POLLERS = {}
 
+# pollers indexed by polled call identity, to find duplicates in poll()
+_POLLERS_INDEX = {}
+
 gevent_version = list(map(int, gevent.__version__.split(".")))
 
+# scheduler used to run the pollers, None means one thread per poller
+_scheduler = None
+
+# number of threads currently running a single poller
+_poller_threads = 0
+_poller_threads_lock = _threading.Lock()
+
 
 class _NotInitializedValue:
     pass
@@ -37,6 +51,201 @@ def get_poller(poller_id):
     return POLLERS.get(poller_id)
 
 
+def values_equal(value, old_value):
+    """Default comparison of a polled value with the previous one.
+
+    Arrays are compared as a whole, arrays of different shapes being
+    different.
+    """
+    if isinstance(value, numpy.ndarray) or isinstance(old_value, numpy.ndarray):
+        return numpy.array_equal(value, old_value)
+    return value == old_value
+
+
+class DeadbandComparison:
+    """Consider numeric values equal while they stay within a deadband
+    of the previous (reported) value.
+
+    A value is different if abs(value - old_value) > absolute + relative *
+    abs(old_value) for any element. Non numeric values (including None and
+    strings) are compared with values_equal.
+    """
+
+    def __init__(self, absolute=0, relative=0):
+        self.absolute = absolute
+        self.relative = relative
+
+    def __call__(self, value, old_value):
+        if value is None or old_value is None:
+            return values_equal(value, old_value)
+        if isinstance(value, str) or isinstance(old_value, str):
+            return values_equal(value, old_value)
+        try:
+            value_array = numpy.asarray(value, dtype=float)
+            old_array = numpy.asarray(old_value, dtype=float)
+        except (TypeError, ValueError):
+            return values_equal(value, old_value)
+
+        if value_array.shape != old_array.shape:
+            return False
+
+        tolerance = self.absolute + self.relative * numpy.abs(old_array)
+        return bool(numpy.all(numpy.abs(value_array - old_array) <= tolerance))
+
+
+class HashComparison:
+    """Compare arrays through a digest of their content, shape and type.
+
+    Meant for large arrays: the digest of the previous value is kept, and
+    only computed again if the previous value is not the last one reported
+    (e.g. a restarted poller). Other values are compared with values_equal.
+    """
+
+    def __init__(self):
+        # last reported value, and its digest
+        self.value = NotInitializedValue
+        self.digest = None
+
+    @staticmethod
+    def _digest(value):
+        return (
+            value.shape,
+            value.dtype.str,
+            hashlib.blake2b(numpy.ascontiguousarray(value)).digest(),
+        )
+
+    def __call__(self, value, old_value):
+        if not isinstance(value, numpy.ndarray) or value.dtype.hasobject:
+            return values_equal(value, old_value)
+        if not isinstance(old_value, numpy.ndarray) or old_value.dtype.hasobject:
+            old_digest = None
+        elif old_value is self.value:
+            old_digest = self.digest
+        else:
+            old_digest = self._digest(old_value)
+
+        digest = self._digest(value)
+        if digest == old_digest:
+            return True
+        # the value is reported, and becomes the previous value
+        self.value = value
+        self.digest = digest
+        return False
+
+
+def get_comparison(comparison=None, deadband=None):
+    """Get the comparison to use for a poller from the channel configuration.
+
+    Args:
+        comparison (str): None or "equal" for the default comparison,
+                          "hash" for HashComparison.
+        deadband (float or str): Absolute deadband, or relative deadband
+                                 if given as a percentage (e.g. "0.5%").
+    Returns:
+        (bool or callable): The compare argument for poll().
+    Raises:
+        ValueError: Invalid comparison or deadband.
+    """
+    if deadband is not None:
+        if isinstance(deadband, str) and deadband.strip().endswith("%"):
+            return DeadbandComparison(relative=float(deadband.strip()[:-1]) / 100.0)
+        return DeadbandComparison(absolute=float(deadband))
+    if comparison == "hash":
+        return HashComparison()
+    if comparison in (None, "equal"):
+        return True
+    raise ValueError("Unknown polled values comparison %r" % comparison)
+
+
+def _polled_call_key(polled_call):
+    """Get a key identifying a polled call.
+
+    Bound methods are created anew at each attribute access, so they are
+    identified by their instance and their function.
+
+    Args:
+        polled_call (callable): The polled call.
+    Returns:
+        (tuple): The key.
+    """
+    instance = getattr(polled_call, "__self__", None)
+    if instance is None:
+        return (id(polled_call),)
+    func = getattr(polled_call, "__func__", None)
+    if func is None:
+        return (id(instance), getattr(polled_call, "__name__", None))
+    return (id(instance), id(func))
+
+
+def _find_poller(polled_call, polled_call_args):
+    for poller in _POLLERS_INDEX.get(_polled_call_key(polled_call), ()):
+        if (
+            poller.polled_call_ref() == polled_call
+            and poller.args == polled_call_args
+        ):
+            return poller
+    return None
+
+
+def _register_poller(poller):
+    POLLERS[poller.get_id()] = poller
+    _POLLERS_INDEX.setdefault(poller.key, []).append(poller)
+
+
+def _unregister_poller(poller):
+    del POLLERS[poller.get_id()]
+    pollers = _POLLERS_INDEX.get(poller.key, [])
+    if poller in pollers:
+        pollers.remove(poller)
+    if not pollers:
+        _POLLERS_INDEX.pop(poller.key, None)
+
+
+def set_engine(engine="thread", workers=0):
+    """Select how the pollers created from now on are run.
+
+    Args:
+        engine (str): "thread" to start one thread per poller (default),
+                      "scheduler" to run all pollers from one deadline heap.
+        workers (int): Number of worker threads executing the polled calls
+                       for the "scheduler" engine. With 0, the polled calls
+                       are executed by the scheduler thread itself.
+    Raises:
+        ValueError: Unknown engine.
+    """
+    global _scheduler
+
+    if engine == "thread":
+        _scheduler = None
+    elif engine == "scheduler":
+        if _scheduler is None or _scheduler.workers != workers:
+            _scheduler = _PollingScheduler(workers)
+    else:
+        raise ValueError("Unknown polling engine %r" % engine)
+
+
+def get_engine():
+    """Get the name of the engine used for new pollers.
+
+    Returns:
+        (str): "thread" or "scheduler".
+    """
+    return "thread" if _scheduler is None else "scheduler"
+
+
+def get_thread_count():
+    """Get the number of threads used for polling.
+
+    Returns:
+        (int): Number of running poller threads, including the scheduler
+               and its workers.
+    """
+    count = _poller_threads
+    if _scheduler is not None:
+        count += _scheduler.get_thread_count()
+    return count
+
+
 def poll(
     polled_call,
     polled_call_args=(),
@@ -47,13 +256,10 @@ def poll(
     start_delay=0,
     start_value=NotInitializedValue,
 ):
-    # logging.info(">>>> %s", POLLERS)
-    for poller in POLLERS.values():
-        poller_polled_call = poller.polled_call_ref()
-        # logging.info(">>>>> poller.poll_cmd=%s, poll_cmd=%s, poller.args=%s, args=%s", poller_polled_call, polled_call, poller.args, polled_call_args)
-        if poller_polled_call == polled_call and poller.args == polled_call_args:
-            poller.set_polling_period(min(polling_period, poller.get_polling_period()))
-            return poller
+    poller = _find_poller(polled_call, polled_call_args)
+    if poller is not None:
+        poller.set_polling_period(min(polling_period, poller.get_polling_period()))
+        return poller
 
     # logging.info(">>>>> CREATING NEW POLLER for cmd %r, args=%s, polling time=%d", polled_call, polled_call_args, polling_period)
     poller = _Poller(
@@ -65,11 +271,93 @@ def poll(
         compare,
     )
     poller.old_res = start_value
-    POLLERS[poller.get_id()] = poller
+    _register_poller(poller)
     poller.start_delayed(start_delay)
     return poller
 
 
+class _PollingScheduler:
+    """Run the polled calls of all the pollers from a single deadline heap.
+
+    The scheduler thread pops the pollers whose deadline has passed and
+    either executes the polled call itself, or hands the poller over to a
+    fixed pool of worker threads.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self._heap = []
+        self._sequence = itertools.count()
+        self._lock = _threading.Lock()
+        self._wakeup = _threading.Queue()
+        self._jobs = _threading.Queue()
+
+        _threading.start_new_thread(self._run, ())
+        for _ in range(workers):
+            _threading.start_new_thread(self._work, ())
+
+    def get_thread_count(self):
+        return 1 + self.workers
+
+    def schedule(self, poller, delay=0):
+        """Schedule the next polled call of a poller.
+
+        Args:
+            poller (_Poller): The poller.
+            delay (float): Delay before the call [ms].
+        """
+        self._push(poller, delay)
+        self._wakeup.put(None)
+
+    def _push(self, poller, delay):
+        deadline = time.monotonic() + delay / 1000.0
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, next(self._sequence), poller))
+
+    def _execute(self, deadline, poller):
+        if poller.is_stopped():
+            return False
+        poller.set_lateness(time.monotonic() - deadline)
+        try:
+            return poller.poll_once()
+        except Exception:
+            log.exception("Polling scheduler: error while polling")
+            return False
+
+    def _run(self):
+        cookie = self._wakeup.allocate_cookie()
+
+        while True:
+            due = []
+            with self._lock:
+                now = time.monotonic()
+                while self._heap and self._heap[0][0] <= now:
+                    due.append(heapq.heappop(self._heap))
+                timeout = self._heap[0][0] - now if self._heap else -1
+
+            if due:
+                for deadline, _, poller in due:
+                    if self.workers:
+                        self._jobs.put((deadline, poller))
+                    elif self._execute(deadline, poller):
+                        self._push(poller, poller.get_polling_period())
+                # deadlines may have passed while polling, look again
+                continue
+
+            try:
+                self._wakeup.get(cookie, timeout)
+            except _threading.EmptyTimeout:
+                pass
+
+    def _work(self):
+        cookie = self._jobs.allocate_cookie()
+
+        while True:
+            deadline, poller = self._jobs.get(cookie)
+            if self._execute(deadline, poller):
+                self.schedule(poller, poller.get_polling_period())
+
+
 class _Poller:
     def __init__(
         self,
@@ -82,6 +370,7 @@ class _Poller:
     ):
         self.polled_call = polled_call
         self.polled_call_ref = saferef.safe_ref(polled_call)
+        self.key = _polled_call_key(polled_call)
         self.args = polled_call_args
         self.polling_period = polling_period
         self.value_changed_callback_ref = saferef.safe_ref(value_changed_callback)
@@ -91,6 +380,8 @@ class _Poller:
         self.queue = queue.Queue()
         self.delay = 0
         self.stop_event = Event()
+        self.lateness = 0
+        self.max_lateness = 0
 
         #if gevent_version < [1,3,0]:
             #self.async_watcher = gevent.get_hub().loop.async()
@@ -99,11 +390,15 @@ class _Poller:
 
     def start_delayed(self, delay):
         self.delay = delay
-        _threading.start_new_thread(self.run, ())
+        if _scheduler is None:
+            _threading.start_new_thread(self.run, ())
+        else:
+            self.async_watcher.start(self.new_event)
+            _scheduler.schedule(self, delay)
 
     def stop(self):
         self.stop_event.set()
-        del POLLERS[self.get_id()]
+        _unregister_poller(self)
 
     def is_stopped(self):
         return self.stop_event.is_set()
@@ -117,6 +412,23 @@ class _Poller:
     def set_polling_period(self, polling_period):
         self.polling_period = polling_period
 
+    def get_lateness(self):
+        """Get how late the polled call was started compared to its schedule.
+
+        Returns:
+            (tuple): Last and maximum lateness [ms].
+        """
+        return self.lateness, self.max_lateness
+
+    def set_lateness(self, lateness):
+        """Record the lateness of the last polled call.
+
+        Args:
+            lateness (float): Lateness [s].
+        """
+        self.lateness = max(lateness, 0) * 1000.0
+        self.max_lateness = max(self.max_lateness, self.lateness)
+
     def restart(self, delay=0):
         self.stop()
 
@@ -151,65 +463,70 @@ class _Poller:
                 if cb is not None:
                     gevent.spawn(cb, res)
 
-    def run(self):
-        sleep = gevent.monkey._get_original("time", ["sleep"])[0]
+    def poll_once(self):
+        """Execute the polled call once and report the value if it changed.
 
-        self.async_watcher.start(self.new_event)
+        Returns:
+            (bool): True if polling should continue, False otherwise.
+        """
+        if self.stop_event.is_set():
+            return False
 
-        err_callback_args = None
-        error_cb = None
-        first_run = True
+        polled_call = self.polled_call_ref()
+        if polled_call is None:
+            return False
+
+        try:
+            res = polled_call(*self.args)
+        except Exception as e:
+            if not self.stop_event.is_set():
+                if self.error_callback_ref() is not None:
+                    self.queue.put(PollingException(e, self.get_id()))
+                    self.async_watcher.send()
+            return False
 
-        while not self.stop_event.is_set():
-            if first_run and self.delay:
-                sleep(self.delay / 1000.0)
-            first_run = False
+        del polled_call
 
-            if self.stop_event.is_set():
-                break
+        if self.stop_event.is_set():
+            return False
 
-            polled_call = self.polled_call_ref()
-            if polled_call is None:
-                break
+        if not self.compare:
+            is_equal = False
+        elif callable(self.compare):
+            is_equal = self.compare(res, self.old_res)
+        else:
+            is_equal = values_equal(res, self.old_res)
 
-            try:
-                res = polled_call(*self.args)
-            except Exception as e:
-                if self.stop_event.is_set():
-                    break
-                error_cb = self.error_callback_ref()
-                if error_cb is not None:
-                    self.queue.put(PollingException(e, self.get_id()))
-                break
+        if not is_equal:
+            self.old_res = res
+            self.queue.put(res)
+            self.async_watcher.send()
 
-            del polled_call
+        return True
 
-            if self.stop_event.is_set():
-                break
+    def run(self):
+        global _poller_threads
 
-            if isinstance(res, numpy.ndarray):  # for arrays
-                comparison = res == self.old_res
-                if isinstance(comparison, bool):
-                    is_equal = comparison
-                else:
-                    is_equal = all(comparison)
-            else:
-                is_equal = res == self.old_res
+        sleep = gevent.monkey.get_original("time", "sleep")
 
-            if self.compare and is_equal:
-                # do nothing: previous value is the same as "new" value
-                pass
-            else:
-                new_value = True
-                if self.compare:
-                    new_value = not is_equal
+        self.async_watcher.start(self.new_event)
 
-                if new_value:
-                    self.old_res = res
-                    self.queue.put(res)
-                    self.async_watcher.send()
+        with _poller_threads_lock:
+            _poller_threads += 1
 
-            sleep(self.polling_period / 1000.0)
+        try:
+            deadline = time.monotonic() + self.delay / 1000.0
+            if self.delay:
+                sleep(self.delay / 1000.0)
 
-        if error_cb is not None:
-            self.async_watcher.send()
+            while not self.stop_event.is_set():
+                self.set_lateness(time.monotonic() - deadline)
+
+                if not self.poll_once():
+                    break
+
+                deadline = time.monotonic() + self.polling_period / 1000.0
+                sleep(self.polling_period / 1000.0)
+        finally:
+            with _poller_threads_lock:
+                _poller_threads -= 1
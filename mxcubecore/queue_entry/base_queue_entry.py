@@ -107,6 +107,7 @@ class QueueEntryContainer(object):
         """
         result = None
         index = None
+        queue_controller = queue_entry.get_queue_controller()
         queue_entry.set_queue_controller(None)
         queue_entry.set_container(None)
 
@@ -118,6 +119,9 @@ class QueueEntryContainer(object):
         if index is not None:
             result = self._queue_entry_list.pop(index)
 
+        if queue_controller is not None:
+            queue_controller.unindex_entry(queue_entry)
+
         log = logging.getLogger("queue_exec")
         msg = "dequeue called with: " + str(queue_entry)
         log.info(msg)
@@ -222,9 +226,13 @@ class BaseQueueEntry(QueueEntryContainer):
         Method inherited from QueueEntryContainer, a derived class
         should newer need to override this method.
         """
-        queue_entry.set_queue_controller(self.get_queue_controller())
+        queue_controller = self.get_queue_controller()
+        queue_entry.set_queue_controller(queue_controller)
         super(BaseQueueEntry, self).enqueue(queue_entry)
 
+        if queue_controller is not None:
+            queue_controller.index_entry(queue_entry)
+
     def set_data_model(self, data_model):
         """
         Sets the model node of this queue entry to <data_model>
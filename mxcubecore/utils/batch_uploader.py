@@ -0,0 +1,327 @@
+# encoding: utf-8
+#
+# License:
+#
+# This file is part of MXCuBE.
+#
+# MXCuBE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MXCuBE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MXCuBE. If not, see <https://www.gnu.org/licenses/>.
+
+"""Background uploader of records to a remote service (e.g. the LIMS)
+
+The records are queued by put, and sent in batches by a greenlet, a batch
+being flushed when it is full or when the oldest queued record is older than
+the flush interval. A send failing with a transient error (e.g. the
+service being unreachable) is retried with an exponential backoff. After
+several failures, and when too many records are queued, the pending records
+are spooled to a directory, as json lines, and sent again once the service
+is back, including after a restart. A record failing with any other error
+(e.g. rejected by the service) is not retried: it is dropped, and written
+to a dead letter file of the spool directory.
+"""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import time
+
+import gevent
+import gevent.event
+
+
+def _json_default(value):
+    # numpy scalars
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class BatchUploader:
+    """Sends records in the background, in batches"""
+
+    def __init__(
+        self,
+        send,
+        batch_size=100,
+        flush_interval=2.0,
+        max_retries=3,
+        backoff=1.0,
+        max_backoff=60.0,
+        spool_directory=None,
+        name="uploader",
+        transient_errors=(OSError,),
+        max_queue_size=10000,
+    ):
+        """
+        Args:
+            send (callable): Called with a record, raises if it is not sent
+            batch_size (int): Maximum number of records of a batch
+            flush_interval (float): Maximum time [s] a record is queued
+            max_retries (int): Failed sends before the records are spooled
+            backoff (float): Delay [s] before the first retry, doubled for
+                             each further failure
+            max_backoff (float): Maximum delay [s] between retries
+            spool_directory (str): Directory of the records that could not be
+                                   sent, None to keep them in memory
+            name (str): Name, in the log messages and the spool file names
+            transient_errors (tuple): Exceptions of the failed sends that are
+                                      retried, the records failing with other
+                                      exceptions being dropped
+            max_queue_size (int): Maximum number of queued records, the
+                                  queued records being spooled (or the oldest
+                                  dropped, without spool directory) above
+        """
+        self.send = send
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spool_directory = spool_directory
+        self.name = name
+        self.transient_errors = transient_errors
+        self.max_queue_size = max_queue_size
+
+        self._queue = collections.deque()
+        self._wakeup = gevent.event.Event()
+        self._idle = gevent.event.Event()
+        self._idle.set()
+        self._task = None
+        self._flush_requested = False
+        self._spool_numbers = itertools.count()
+        self._failures = 0
+
+        self.sent = 0
+        self.spooled = 0
+        self.dropped = 0
+        self.last_error = None
+        self.last_flush_time = None
+
+    def put(self, record):
+        """Queue a record, starting the uploader if needed
+
+        Args:
+            record (dict): Record, json serialisable if spooled
+        """
+        if self.max_queue_size and len(self._queue) >= self.max_queue_size:
+            if self.spool_directory is None:
+                self._queue.popleft()
+                self.dropped += 1
+            else:
+                self._spool([record for _, record in self._queue])
+                self._queue.clear()
+        self._queue.append((time.monotonic(), record))
+        self._idle.clear()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        self.start()
+
+    def start(self):
+        """Start the uploader greenlet, sending the spooled records first"""
+        if self._task is None or self._task.dead:
+            spool_files = self._spool_files()
+            if spool_files:
+                self._idle.clear()
+                self.spooled = 0
+                for path in spool_files:
+                    with open(path) as spool_file:
+                        self.spooled += sum(1 for line in spool_file if line.strip())
+            self._task = gevent.spawn(self._run)
+
+    def stop(self, timeout=None):
+        """Stop the uploader, after sending the queued records
+
+        Args:
+            timeout (float): Maximum time [s] to wait, the remaining records
+                             being spooled
+        """
+        self.flush(timeout)
+        if self._task is not None:
+            self._task.kill()
+            self._task = None
+        if self._queue:
+            self._spool([record for _, record in self._queue])
+            self._queue.clear()
+
+    def flush(self, timeout=None):
+        """Send the queued records now, and wait for them to be sent
+
+        Args:
+            timeout (float): Maximum time [s] to wait
+
+        Returns:
+            (bool): True if all the records are sent
+        """
+        if self._task is None:
+            return not self._queue and not self._spool_files()
+        self._flush_requested = True
+        self._wakeup.set()
+        return self._idle.wait(timeout)
+
+    def get_metrics(self):
+        """
+        Returns:
+            (dict): queue_depth (queued records), spooled (records in the
+                    spool directory), sent, dropped (records not sent),
+                    failures (consecutive failed sends), last_error and
+                    last_flush_time
+        """
+        return {
+            "queue_depth": len(self._queue),
+            "spooled": self.spooled,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failures": self._failures,
+            "last_error": self.last_error,
+            "last_flush_time": self.last_flush_time,
+        }
+
+    def _spool_files(self):
+        if self.spool_directory is None or not os.path.isdir(self.spool_directory):
+            return []
+        return sorted(
+            os.path.join(self.spool_directory, file_name)
+            for file_name in os.listdir(self.spool_directory)
+            if file_name.startswith(self.name + "-") and file_name.endswith(".jsonl")
+        )
+
+    def _spool(self, records):
+        if self.spool_directory is None:
+            # kept in memory, sent before the queued records
+            self._queue.extendleft((0, record) for record in reversed(records))
+            return
+        if not os.path.isdir(self.spool_directory):
+            os.makedirs(self.spool_directory)
+        path = os.path.join(
+            self.spool_directory,
+            "%s-%d-%06d.jsonl"
+            % (self.name, time.time() * 1e6, next(self._spool_numbers)),
+        )
+        with open(path, "w") as spool_file:
+            for record in records:
+                spool_file.write(json.dumps(record, default=_json_default) + "\n")
+        self.spooled += len(records)
+        logging.getLogger("HWR").warning(
+            "%s: %d records spooled to %s", self.name, len(records), path
+        )
+
+    def _dead_letter(self, record, error):
+        """Drop a record the service does not accept"""
+        self.dropped += 1
+        self.last_error = str(error)
+        logging.getLogger("HWR").error(
+            "%s: record dropped (%s): %s", self.name, error, record
+        )
+        if self.spool_directory is None:
+            return
+        if not os.path.isdir(self.spool_directory):
+            os.makedirs(self.spool_directory)
+        path = os.path.join(self.spool_directory, "%s.failed.jsonl" % self.name)
+        with open(path, "a") as dead_letter_file:
+            dead_letter_file.write(json.dumps(record, default=_json_default) + "\n")
+
+    def _send_batch(self, records):
+        """Send the records, returning the number of records sent or dropped"""
+        for done, record in enumerate(records):
+            try:
+                self.send(record)
+            except self.transient_errors as ex:
+                self._failures += 1
+                self.last_error = str(ex)
+                logging.getLogger("HWR").debug(
+                    "%s: send failed (%d): %s", self.name, self._failures, ex
+                )
+                return done
+            except Exception as ex:
+                self._dead_letter(record, ex)
+                continue
+            self.sent += 1
+            self._failures = 0
+        return len(records)
+
+    def _retry_delay(self):
+        return min(self.backoff * 2 ** (self._failures - 1), self.max_backoff)
+
+    def _send_spooled(self):
+        """Send the spooled records, returning False if the service fails"""
+        for path in self._spool_files():
+            with open(path) as spool_file:
+                records = [json.loads(line) for line in spool_file if line.strip()]
+            done = self._send_batch(records)
+            if done < len(records):
+                if done:
+                    # keep the records not sent
+                    with open(path, "w") as spool_file:
+                        for record in records[done:]:
+                            spool_file.write(json.dumps(record) + "\n")
+                self.spooled = max(self.spooled - done, 0)
+                return False
+            os.remove(path)
+            self.spooled = max(self.spooled - len(records), 0)
+        return True
+
+    def _next_batch(self):
+        if not self._queue:
+            return []
+        age = time.monotonic() - self._queue[0][0]
+        if (
+            len(self._queue) < self.batch_size
+            and age < self.flush_interval
+            and not self._flush_requested
+        ):
+            return []
+        return [
+            self._queue.popleft()[1]
+            for _ in range(min(self.batch_size, len(self._queue)))
+        ]
+
+    def _run(self):
+        while True:
+            if self._failures:
+                gevent.sleep(self._retry_delay())
+            else:
+                timeout = self.flush_interval
+                if self._queue:
+                    timeout -= time.monotonic() - self._queue[0][0]
+                self._wakeup.wait(max(timeout, 0))
+
+            if not self._send_spooled():
+                continue
+
+            batch = self._next_batch()
+            if batch:
+                done = self._send_batch(batch)
+                self.last_flush_time = time.time()
+                if done < len(batch):
+                    unsent = batch[done:]
+                    if self._failures >= self.max_retries:
+                        # the service is down, spooling the pending records
+                        unsent += [record for _, record in self._queue]
+                        self._queue.clear()
+                        self._spool(unsent)
+                    else:
+                        self._queue.extendleft(
+                            (0, record) for record in reversed(unsent)
+                        )
+                    continue
+
+            if not self._queue:
+                self._wakeup.clear()
+                self._flush_requested = False
+                if not self._spool_files():
+                    self._idle.set()
+            elif len(self._queue) < self.batch_size and not self._flush_requested:
+                # waiting for a full batch, or for the flush interval
+                self._wakeup.clear()
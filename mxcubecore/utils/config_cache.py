@@ -0,0 +1,200 @@
+# encoding: utf-8
+#
+# License:
+#
+# This file is part of MXCuBE.
+#
+# MXCuBE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MXCuBE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MXCuBE. If not, see <https://www.gnu.org/licenses/>.
+
+"""On-disk cache of the parsed configuration files.
+
+The parsed yaml configurations, and the SAX events of the xml Hardware
+Object files, are pickled in a cache directory. Entries are stored per file
+(path or Hardware Object name) with the hash of the file contents, and are
+parsed again, and replaced, as soon as the file contents change.
+
+The cache is disabled unless a cache directory is set, with
+set_cache_directory or the MXCUBE_CONFIG_CACHE environment variable.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import xml.sax
+from xml.sax.handler import ContentHandler
+
+# Changing the version invalidates the existing cache files
+CACHE_VERSION = 1
+
+CACHE_DIRECTORY = os.environ.get("MXCUBE_CONFIG_CACHE") or None
+
+# SAX events
+START_ELEMENT = 0
+CHARACTERS = 1
+END_ELEMENT = 2
+
+
+def set_cache_directory(directory):
+    """Set the cache directory, created when needed
+
+    Args:
+        directory (str): Cache directory. None disables the cache
+    """
+    global CACHE_DIRECTORY
+    CACHE_DIRECTORY = directory
+
+
+def get_cache_directory():
+    """
+    Returns:
+        (str): Cache directory, None if the cache is disabled
+    """
+    return CACHE_DIRECTORY
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def _cache_path(kind, key):
+    return os.path.join(CACHE_DIRECTORY, "%s-%s.pickle" % (kind, _digest(key)))
+
+
+def _write(path, entry):
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIRECTORY, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fp0:
+            pickle.dump(entry, fp0, pickle.HIGHEST_PROTOCOL)
+        # concurrent readers see either the old or the new entry
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def cached(kind, key, text, parse):
+    """Parse a configuration, or get it from the cache if the text did not
+    change since it was cached
+
+    Args:
+        kind (str): Configuration kind (e.g. "yaml")
+        key (str): Configuration key (e.g. file path)
+        text (str): Configuration text
+        parse (callable): Parsing function, called with the text
+
+    Returns:
+        Parsed configuration (a new copy on each call)
+    """
+    if not CACHE_DIRECTORY:
+        return parse(text)
+
+    path = _cache_path(kind, key)
+    text_hash = _digest(text)
+    try:
+        with open(path, "rb") as fp0:
+            version, cached_hash, result = pickle.load(fp0)
+        if version == CACHE_VERSION and cached_hash == text_hash:
+            return result
+    except FileNotFoundError:
+        pass
+    except Exception:
+        logging.getLogger("HWR").debug("Invalid configuration cache file %s", path)
+
+    result = parse(text)
+    try:
+        _write(path, (CACHE_VERSION, text_hash, result))
+    except Exception:
+        logging.getLogger("HWR").warning(
+            "Cannot write configuration cache file %s", path, exc_info=True
+        )
+    return result
+
+
+def load_yaml(yaml, text, path):
+    """Load a yaml configuration
+
+    Args:
+        yaml (ruamel.yaml.YAML): Yaml loader
+        text (str): Yaml text
+        path (str): Configuration file path
+
+    Returns:
+        Parsed configuration
+    """
+    return cached("yaml", path, text, yaml.load)
+
+
+class _EventRecorder(ContentHandler):
+    def __init__(self):
+        ContentHandler.__init__(self)
+        self.events = []
+
+    def startElement(self, name, attrs):
+        self.events.append((START_ELEMENT, name, dict(attrs)))
+
+    def characters(self, content):
+        if self.events and self.events[-1][0] == CHARACTERS:
+            self.events[-1] = (CHARACTERS, self.events[-1][1] + content)
+        else:
+            self.events.append((CHARACTERS, content))
+
+    def endElement(self, name):
+        self.events.append((END_ELEMENT, name))
+
+
+def parse_xml_events(xml_string):
+    """Parse xml text into a list of SAX events
+
+    Args:
+        xml_string (str): Xml text
+
+    Returns:
+        (list): (START_ELEMENT, name, attributes), (CHARACTERS, content)
+                and (END_ELEMENT, name) tuples
+    """
+    recorder = _EventRecorder()
+    xml.sax.parseString(xml_string.encode(), recorder)
+    return recorder.events
+
+
+def load_xml_events(xml_string, name):
+    """Get the SAX events of a Hardware Object xml file
+
+    Args:
+        xml_string (str): Xml text
+        name (str): Hardware Object name
+
+    Returns:
+        (list): SAX events (see parse_xml_events)
+    """
+    return cached("xml", name, xml_string, parse_xml_events)
+
+
+def replay_xml_events(events, handler):
+    """Feed SAX events to a SAX content handler
+
+    Args:
+        events (list): SAX events (see parse_xml_events)
+        handler (xml.sax.handler.ContentHandler): Content handler
+    """
+    for event in events:
+        if event[0] == START_ELEMENT:
+            handler.startElement(event[1], event[2])
+        elif event[0] == CHARACTERS:
+            handler.characters(event[1])
+        else:
+            handler.endElement(event[1])
@@ -0,0 +1,161 @@
+# encoding: utf-8
+#
+# License:
+#
+# This file is part of MXCuBE.
+#
+# MXCuBE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MXCuBE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MXCuBE. If not, see <https://www.gnu.org/licenses/>.
+
+"""Columnar on-disk store of per image processing results
+
+A store is a directory with one memory mapped .npy file per result key (a
+column with a value per image), a "processed" column flagging the images
+having results, and a store.json file describing the columns. The results
+are written as they are processed, the store being readable (with numpy.load
+or ResultsStore.open) while the processing runs.
+"""
+
+import json
+import os
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+INFO_FILE = "store.json"
+PROCESSED = "processed"
+
+
+class ResultsStore:
+    """Per image results, one memory mapped column per result key"""
+
+    def __init__(self, directory, columns, read_only=False):
+        """Use ResultsStore.create or ResultsStore.open"""
+        self.directory = directory
+        self.columns = columns
+        self.read_only = read_only
+
+    @classmethod
+    def create(cls, directory, keys, size, dtype="float64"):
+        """Create a store, the results being 0 and not processed
+
+        Args:
+            directory (str): Store directory, created if needed
+            keys (list): Result keys
+            size (int): Number of images
+            dtype (str): Results data type
+
+        Returns:
+            (ResultsStore): Store
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        columns = {}
+        for key, key_dtype in [(key, dtype) for key in keys] + [(PROCESSED, "bool")]:
+            columns[key] = open_memmap(
+                os.path.join(directory, key + ".npy"),
+                mode="w+",
+                dtype=key_dtype,
+                shape=(size,),
+            )
+        with open(os.path.join(directory, INFO_FILE), "w") as info_file:
+            json.dump({"keys": list(keys), "size": size, "dtype": dtype}, info_file)
+        return cls(directory, columns)
+
+    @classmethod
+    def open(cls, directory):
+        """Open a store for reading, possibly while it is written
+
+        Args:
+            directory (str): Store directory
+
+        Returns:
+            (ResultsStore): Store
+        """
+        with open(os.path.join(directory, INFO_FILE)) as info_file:
+            info = json.load(info_file)
+        columns = {
+            key: np.load(os.path.join(directory, key + ".npy"), mmap_mode="r")
+            for key in info["keys"] + [PROCESSED]
+        }
+        return cls(directory, columns, read_only=True)
+
+    @property
+    def keys(self):
+        """Result keys"""
+        return [key for key in self.columns if key != PROCESSED]
+
+    @property
+    def size(self):
+        """Number of images"""
+        return next(iter(self.columns.values())).size
+
+    def write(self, indexes, results):
+        """Write the results of processed images
+
+        Args:
+            indexes (numpy.ndarray): Image indexes
+            results (dict): Result key: all results array, or results of the
+                            images only (same size as indexes)
+        """
+        for key, values in results.items():
+            if key not in self.columns:
+                continue
+            values = np.asarray(values)
+            if values.size == self.size and values.size != len(indexes):
+                values = values[indexes]
+            self.columns[key][indexes] = values
+        self.columns[PROCESSED][indexes] = True
+
+    def get(self, key, processed_only=False):
+        """
+        Args:
+            key (str): Result key
+            processed_only (bool): Only the results of the processed images
+
+        Returns:
+            (numpy.ndarray): Results, sharing the store memory
+        """
+        if processed_only:
+            return self.columns[key][self.columns[PROCESSED]]
+        return self.columns[key]
+
+    def processed_indexes(self):
+        """
+        Returns:
+            (numpy.ndarray): Indexes of the processed images
+        """
+        return np.flatnonzero(self.columns[PROCESSED])
+
+    def write_csv(self, path, keys, formats, header=None):
+        """Write the results as csv, a line per image: index and results
+
+        Args:
+            path (str): csv file path
+            keys (list): Result keys of the csv columns
+            formats (list): Format of the index and of each result
+            header (str): First line
+        """
+        data = np.column_stack(
+            [np.arange(self.size)] + [self.columns[key] for key in keys]
+        )
+        with open(path, "w") as csv_file:
+            if header is not None:
+                csv_file.write(header + "\n")
+            np.savetxt(csv_file, data, fmt=formats, delimiter=",")
+
+    def flush(self):
+        """Write the pending changes to the disk"""
+        if not self.read_only:
+            for column in self.columns.values():
+                column.flush()
@@ -0,0 +1,210 @@
+# encoding: utf-8
+#
+# License:
+#
+# This file is part of MXCuBE.
+#
+# MXCuBE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MXCuBE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MXCuBE. If not, see <https://www.gnu.org/licenses/>.
+
+"""Shared suds SOAP clients
+
+ClientRegistry keeps one client per WSDL url, so that the WSDL is downloaded
+and parsed once. PooledTransport sends the requests through a requests
+session, keeping the connections alive, and times them per web service
+method. get_wsdl_cache returns a persistent WSDL cache, versioned with the
+suds version and the web services root.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import re
+import time
+
+import requests
+import suds
+from suds.cache import ObjectCache
+from suds.client import Client
+from suds.transport import (
+    Reply,
+    TransportError,
+)
+from suds.transport.http import HttpAuthenticated
+
+# Name of the method called in a SOAP envelope (first element of the body)
+SOAP_METHOD_RE = re.compile(rb"<(?:[\w.-]+:)?Body[^>]*>\s*<(?:[\w.-]+:)?([\w.-]+)")
+
+
+class WebServiceTimings:
+    """Number of calls and time spent per web service method"""
+
+    def __init__(self):
+        self._timings = {}
+
+    def add(self, method, elapsed):
+        """
+        Args:
+            method (str): Web service method
+            elapsed (float): Call time [s]
+        """
+        calls, total, longest = self._timings.get(method, (0, 0.0, 0.0))
+        self._timings[method] = (calls + 1, total + elapsed, max(longest, elapsed))
+
+    def get(self):
+        """
+        Returns:
+            (dict): method: (number of calls, total time [s], longest call [s])
+        """
+        return dict(self._timings)
+
+    def clear(self):
+        self._timings.clear()
+
+    def __str__(self):
+        lines = ["%-40s %8s %12s %12s" % ("method", "calls", "mean (ms)", "max (ms)")]
+        for method, (calls, total, longest) in sorted(
+            self._timings.items(), key=lambda item: -item[1][1]
+        ):
+            lines.append(
+                "%-40s %8d %12.1f %12.1f"
+                % (method, calls, 1000 * total / calls, 1000 * longest)
+            )
+        return "\n".join(lines)
+
+
+class PooledTransport(HttpAuthenticated):
+    """Authenticated http transport keeping the connections alive in a
+    pool, shared by the clients using the transport.
+    """
+
+    def __init__(self, timings=None, pool_size=10, **kwargs):
+        """
+        Args:
+            timings (WebServiceTimings): Timings of the calls, None to not
+                                         time them
+            pool_size (int): Maximum number of connections kept per host
+            kwargs: Transport options (username, password, proxy, timeout)
+        """
+        super().__init__(**kwargs)
+        self.timings = timings
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _request(self, method, request):
+        self.addcredentials(request)
+        response = self.session.request(
+            method,
+            request.url,
+            data=request.message,
+            headers=request.headers,
+            proxies=self.options.proxy or None,
+            timeout=self.options.timeout,
+        )
+        if response.status_code >= 400:
+            raise TransportError(
+                response.reason, response.status_code, io.BytesIO(response.content)
+            )
+        return response
+
+    def open(self, request):
+        if not request.url.startswith(("http://", "https://")):
+            # e.g. a local WSDL file
+            return super().open(request)
+        return io.BytesIO(self._request("GET", request).content)
+
+    def send(self, request):
+        start = time.perf_counter()
+        try:
+            response = self._request("POST", request)
+        finally:
+            if self.timings is not None:
+                match = SOAP_METHOD_RE.search(request.message or b"")
+                self.timings.add(
+                    match.group(1).decode() if match else request.url,
+                    time.perf_counter() - start,
+                )
+        if response.status_code in (202, 204):
+            # no reply, handled by the suds client
+            raise TransportError(response.reason, response.status_code)
+        return Reply(200, response.headers, response.content)
+
+    def __deepcopy__(self, memo={}):
+        # the clones share the connection pool
+        return self
+
+
+def get_wsdl_cache(directory, ws_root, days=7):
+    """Get a persistent cache of the parsed WSDL and XSD documents, in a
+    subdirectory named after the suds version and the web services root, so
+    that a suds upgrade or another server does not use stale documents.
+
+    Args:
+        directory (str): Cache directory, None for no cache
+        ws_root (str): Web services root url
+        days (int): Days the documents are kept
+
+    Returns:
+        (suds.cache.ObjectCache): Cache, None if directory is None
+    """
+    if directory is None:
+        return None
+    version = "suds-%s-%s" % (
+        suds.__version__,
+        hashlib.blake2b((ws_root or "").encode(), digest_size=6).hexdigest(),
+    )
+    return ObjectCache(os.path.join(directory, version), days=days)
+
+
+class ClientRegistry:
+    """suds clients, one per WSDL url"""
+
+    def __init__(self):
+        self._clients = {}
+        # Options of the clients created by get
+        self.options = {"cache": None}
+
+    def register(self, url, client):
+        """
+        Args:
+            url (str): WSDL url
+            client (suds.client.Client): Client
+        """
+        self._clients[url] = client
+
+    def get(self, url, **options):
+        """Get the client of a WSDL url, created at the first call
+
+        Args:
+            url (str): WSDL url
+            options: Client options, added to the registry ones
+
+        Returns:
+            (suds.client.Client): Client
+        """
+        client = self._clients.get(url)
+        if client is None:
+            logging.getLogger("HWR").debug("Creating web service client %s", url)
+            client = Client(url, **dict(self.options, **options))
+            self._clients[url] = client
+        return client
+
+    def clear(self):
+        """Forget the clients"""
+        self._clients.clear()
@@ -0,0 +1,193 @@
+# encoding: utf-8
+#
+# License:
+#
+# This file is part of MXCuBE.
+#
+# MXCuBE is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# MXCuBE is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with MXCuBE. If not, see <https://www.gnu.org/licenses/>.
+
+"""Video frames shared between the consumers of a camera image"""
+
+import io
+
+import numpy
+from PIL import Image
+
+# Number of channels of the PIL image modes
+CHANNELS = {"L": 1, "RGB": 3, "RGBA": 4}
+
+
+class VideoFrame:
+    """A video image, wrapping the data received from the camera without
+    copying it. The conversions are done on demand, once per frame.
+    """
+
+    def __init__(self, frame_number, width, height, data, mode=None):
+        """
+        Args:
+            frame_number (int): Frame number
+            width (int): Image width
+            height (int): Image height
+            data (memoryview): Image data
+            mode (str): PIL image mode, None if the data is not converted
+        """
+        self.frame_number = frame_number
+        self.width = width
+        self.height = height
+        self.data = data
+        self.mode = mode
+        self.timestamp = None
+        # Number of conversions done (not taken from the memoised ones)
+        self.conversions = 0
+        self._encoded = {}
+
+    @classmethod
+    def from_image(cls, frame_number, data, width, height):
+        """Create a frame from raw image data, the image mode being deduced
+        from the data size
+
+        Args:
+            frame_number (int): Frame number
+            data (bytes): Image data
+            width (int): Image width
+            height (int): Image height
+
+        Returns:
+            (VideoFrame): Frame
+        """
+        data = memoryview(data)
+        channels = data.nbytes // max(width * height, 1)
+        mode = {1: "L", 3: "RGB", 4: "RGBA"}.get(channels)
+        if mode and data.nbytes != width * height * channels:
+            mode = None
+        return cls(frame_number, width, height, data, mode)
+
+    def _memoised(self, key, convert):
+        if key not in self._encoded:
+            self._encoded[key] = convert()
+            self.conversions += 1
+        return self._encoded[key]
+
+    def tobytes(self):
+        """
+        Returns:
+            (bytes): Image data
+        """
+        return self._memoised(("raw", 1.0), lambda: bytes(self.data))
+
+    def array(self):
+        """
+        Returns:
+            (numpy.ndarray): Image (height, width[, channels]) array sharing
+                             the frame data, read only
+        """
+        if self.mode is None:
+            return numpy.frombuffer(self.data, dtype=numpy.uint8)
+        shape = (self.height, self.width)
+        if CHANNELS[self.mode] > 1:
+            shape += (CHANNELS[self.mode],)
+        return numpy.frombuffer(self.data, dtype=numpy.uint8).reshape(shape)
+
+    def image(self):
+        """
+        Returns:
+            (PIL.Image): Image sharing the frame data
+        """
+        if self.mode is None:
+            raise ValueError("Frame %d cannot be converted" % self.frame_number)
+        return Image.frombuffer(
+            self.mode, (self.width, self.height), self.data, "raw", self.mode, 0, 1
+        )
+
+    def scaled_image(self, scale=1.0):
+        """
+        Args:
+            scale (float): Scale factor
+
+        Returns:
+            (PIL.Image): Scaled image, memoised
+        """
+        if scale == 1.0:
+            return self.image()
+
+        def resize():
+            size = (max(int(self.width * scale), 1), max(int(self.height * scale), 1))
+            return self.image().resize(size, Image.Resampling.BILINEAR)
+
+        return self._memoised(("image", scale), resize)
+
+    def encode(self, image_format="JPEG", scale=1.0, **options):
+        """Encode the image, the result being kept for the other consumers
+        of the frame.
+
+        Args:
+            image_format (str): PIL image format
+            scale (float): Scale factor
+            options: PIL save options (e.g. quality=80)
+
+        Returns:
+            (bytes): Encoded image
+        """
+
+        def encode():
+            img = self.scaled_image(scale)
+            if image_format.upper() == "JPEG" and img.mode == "RGBA":
+                img = img.convert("RGB")
+            img_bytes = io.BytesIO()
+            img.save(img_bytes, format=image_format, **options)
+            return img_bytes.getvalue()
+
+        key = (image_format.upper(), scale) + tuple(sorted(options.items()))
+        return self._memoised(key, encode)
+
+    def convert(self, encoding="raw", scale=1.0, quality=80):
+        """Convert the frame, the result being kept for the other consumers
+        of the frame.
+
+        Args:
+            encoding (str): "raw" (camera bytes), "rgb" (RGB bytes), "gray"
+                            (grayscale numpy array), "array" (numpy array)
+                            or a PIL image format (e.g. "jpeg")
+            scale (float): Scale factor
+            quality (int): JPEG quality
+
+        Returns:
+            (bytes or numpy.ndarray): Converted frame
+        """
+        encoding = encoding.lower()
+        if encoding == "raw" and scale == 1.0:
+            return self.tobytes()
+        if encoding == "array" and scale == 1.0:
+            return self.array()
+        if encoding == "raw":
+            return self._memoised(
+                ("raw", scale), lambda: self.scaled_image(scale).tobytes()
+            )
+        if encoding == "array":
+            return self._memoised(
+                ("array", scale), lambda: numpy.asarray(self.scaled_image(scale))
+            )
+        if encoding == "rgb":
+            return self._memoised(
+                ("rgb", scale),
+                lambda: self.scaled_image(scale).convert("RGB").tobytes(),
+            )
+        if encoding == "gray":
+            return self._memoised(
+                ("gray", scale),
+                lambda: numpy.asarray(self.scaled_image(scale).convert("L")),
+            )
+        if encoding == "jpeg":
+            return self.encode("JPEG", scale, quality=quality)
+        return self.encode(encoding.upper(), scale)
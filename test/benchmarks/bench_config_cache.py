@@ -0,0 +1,74 @@
+"""Benchmark the parsed configuration cache
+
+Parses all the yaml and xml files of the mockup and esrf_* configuration
+trees without cache, with an empty cache (cold, parsing and writing the
+cache files) and with a filled cache (warm).
+
+Usage: python -m test.benchmarks.bench_config_cache [configuration_dir ...]
+"""
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+from mxcubecore.HardwareRepository import yaml
+from mxcubecore.utils import config_cache
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+CONFIGURATION_DIR = os.path.join(ROOT_DIR, "mxcubecore/configuration")
+
+
+def read_files(directories):
+    files = []
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, "**"), recursive=True)):
+            if path.endswith((".yml", ".yaml", ".xml")):
+                with open(path, "r") as fp0:
+                    files.append((path, fp0.read()))
+    return files
+
+
+def parse_all(files):
+    failed = 0
+    start = time.perf_counter()
+    for path, text in files:
+        try:
+            if path.endswith(".xml"):
+                config_cache.load_xml_events(text, path)
+            else:
+                config_cache.load_yaml(yaml, text, path)
+        except Exception:
+            # not all files in the configuration trees are valid
+            failed += 1
+    return time.perf_counter() - start, failed
+
+
+def main(directories):
+    files = read_files(directories)
+
+    config_cache.set_cache_directory(None)
+    no_cache, failed = parse_all(files)
+    with tempfile.TemporaryDirectory() as cache_directory:
+        config_cache.set_cache_directory(cache_directory)
+        cold, _ = parse_all(files)
+        warm, _ = parse_all(files)
+    config_cache.set_cache_directory(None)
+
+    xml_count = sum(path.endswith(".xml") for path, _ in files)
+    print(
+        "%d xml and %d yaml files (%d not parsable), %d directories"
+        % (xml_count, len(files) - xml_count, failed, len(directories))
+    )
+    print("  no cache:   %8.1f ms" % (1000 * no_cache))
+    print("  cold cache: %8.1f ms" % (1000 * cold))
+    print("  warm cache: %8.1f ms" % (1000 * warm))
+
+
+if __name__ == "__main__":
+    main(
+        sys.argv[1:]
+        or [os.path.join(CONFIGURATION_DIR, "mockup")]
+        + sorted(glob.glob(os.path.join(CONFIGURATION_DIR, "esrf_*")))
+    )
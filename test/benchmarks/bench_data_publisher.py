@@ -0,0 +1,162 @@
+"""Benchmark the storage of the points published with the DataPublisher
+
+Feeds the data frames of a scan (start, N points, stop) to the subscriber
+side of the DataPublisher, writing to an in-process redis stand-in
+(fakeredis), with the pipelined writes and with the former per point
+writes, and reports the sustained points per second. The points are also
+sent as binary blocks (pub_block) of block_size points, and the encoding
+and decoding of the json and of the block frames is timed alone.
+
+Usage: python -m test.benchmarks.bench_data_publisher [points block_size]
+"""
+
+import json
+import sys
+import time
+
+import fakeredis
+import numpy
+
+from mxcubecore.HardwareObjects.DataPublisher import (
+    DataPublisher,
+    FrameType,
+    PlotDim,
+    decode_block,
+    encode_block,
+)
+
+
+class LegacyDataPublisher(DataPublisher):
+    """Per point writes and uncached descriptions, as done before"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._data = {}
+
+    def _get_description(self, _id):
+        return json.loads(self._r.get("HWR_DP_%s_DESCRIPTION" % _id))
+
+    def _handle_message(self, message):
+        redis_channel = message["channel"]
+        _id = redis_channel.split("_")[-1]
+        data = json.loads(message["data"])
+
+        if data["type"] == FrameType.START.value:
+            self._data[redis_channel] = {"x": [], "y": []}
+            self._update_description(_id, {"running": True})
+            self._clear_data(_id)
+            self.emit("start", self.get_description(_id, include_data=True)[0])
+            self._active_source_desc[redis_channel] = self._get_description(_id)
+        elif data["type"] == FrameType.STOP.value:
+            self._update_description(_id, {"running": False})
+            self.emit("end", self.get_description(_id, include_data=True)[0])
+            self._active_source_desc.pop(redis_channel)
+        elif data["type"] == FrameType.DATA.value:
+            self._data[redis_channel] = {
+                "x": self._data[redis_channel]["x"] + [data["data"]["x"]],
+                "y": self._data[redis_channel]["y"] + [data["data"]["y"]],
+            }
+            self.emit("data", {"id": _id, "data": data["data"]})
+            self._append_data(
+                _id, data["data"], self._active_source_desc[redis_channel]
+            )
+
+    def _append_data(self, _id, data, desc):
+        self._r.rpush("HWR_DP_%s_DATA_X" % _id, data.get("x", float("nan")))
+        self._r.rpush("HWR_DP_%s_DATA_Y" % _id, data.get("y", float("nan")))
+        if desc["data_dim"] > 1:
+            self._r.rpush("HWR_DP_%s_DATA_Z" % _id, data.get("z", float("nan")))
+
+
+def make_frames(num_points):
+    channel = "HWR_DP_NEW_DATA_POINT_scan"
+
+    def frame(frame_type, data):
+        return {
+            "channel": channel,
+            "data": json.dumps({"type": frame_type.value, "data": data}),
+        }
+
+    frames = [frame(FrameType.START, {})]
+    frames += [
+        frame(FrameType.DATA, {"x": index * 0.01, "y": index % 97, "z": 1.0})
+        for index in range(num_points)
+    ]
+    frames.append(frame(FrameType.STOP, {}))
+    return frames
+
+
+def make_block_frames(num_points, block_size):
+    frames = make_frames(0)
+    index = numpy.arange(num_points)
+    blocks = [
+        {
+            "channel": "HWR_DP_NEW_DATA_BLOCK_scan",
+            "data": encode_block(
+                index[start : start + block_size] * 0.01,
+                index[start : start + block_size] % 97,
+                numpy.ones(len(index[start : start + block_size])),
+            ),
+        }
+        for start in range(0, num_points, block_size)
+    ]
+    return frames[:1] + blocks + frames[1:]
+
+
+def timed(publisher_class, frames, num_points):
+    publisher = publisher_class("data_publisher")
+    publisher._r = fakeredis.FakeRedis(decode_responses=True)
+    publisher.register("scan", "Scan", "scan", data_dim=PlotDim.TWO_D)
+
+    start = time.perf_counter()
+    for frame in frames:
+        publisher._handle_message(frame)
+    elapsed = time.perf_counter() - start
+
+    assert publisher._r.llen("HWR_DP_scan_DATA_Z") == num_points
+    return elapsed
+
+
+def frames_overhead(num_points, block_size):
+    """Time to encode and decode the frames of the points"""
+    xs = numpy.arange(num_points) * 0.01
+    ys = numpy.arange(num_points) % 97
+
+    start = time.perf_counter()
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        json.loads(json.dumps({"type": "data", "data": {"x": x, "y": y}}))
+    per_point = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index in range(0, num_points, block_size):
+        decode_block(
+            encode_block(xs[index : index + block_size], ys[index : index + block_size])
+        )
+    blocks = time.perf_counter() - start
+
+    return per_point, blocks
+
+
+def main(num_points, block_size):
+    per_point, blocks = frames_overhead(num_points, block_size)
+    print("frames of %d x, y points" % num_points)
+    print(
+        "  %-10s %8.3f s %10.0f points/s" % ("json", per_point, num_points / per_point)
+    )
+    print("  %-10s %8.3f s %10.0f points/s" % ("blocks", blocks, num_points / blocks))
+
+    frames = make_frames(num_points)
+
+    print("scan of %d x, y, z points" % num_points)
+    for name, publisher_class, run_frames in (
+        ("blocks", DataPublisher, make_block_frames(num_points, block_size)),
+        ("pipelined", DataPublisher, frames),
+        ("per point", LegacyDataPublisher, frames),
+    ):
+        elapsed = timed(publisher_class, run_frames, num_points)
+        print("  %-10s %8.3f s %10.0f points/s" % (name, elapsed, num_points / elapsed))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]] or [20000, 100]
+    main(*args)
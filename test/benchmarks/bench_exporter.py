@@ -0,0 +1,118 @@
+"""Benchmark the Exporter client against a local fake exporter server
+
+The fake server replies to READ requests after a simulated network
+latency, replies keeping the order of the requests. The benchmark reads N
+properties one after the other, from concurrent greenlets, and with
+read_properties, with and without pipelining.
+
+Usage: python -m test.benchmarks.bench_exporter [N] [latency_ms]
+"""
+
+import sys
+import time
+
+from gevent import monkey
+
+monkey.patch_all(thread=False)
+
+import gevent
+import gevent.queue
+import gevent.server
+
+from mxcubecore.Command.Exporter import Exporter
+
+STX = b"\x02"
+ETX = b"\x03"
+
+
+class FakeExporterServer:
+    """Exporter server replying "RET:<value>" to "READ <property>" requests"""
+
+    def __init__(self, latency=0.001):
+        self.latency = latency
+        self.properties = {}
+        self.server = gevent.server.StreamServer(("127.0.0.1", 0), self.handle)
+
+    @property
+    def port(self):
+        return self.server.server_port
+
+    def start(self):
+        self.server.start()
+
+    def stop(self):
+        self.server.stop()
+
+    def reply(self, request):
+        cmd, _, prop = request.partition(" ")
+        if cmd == "READ" and prop in self.properties:
+            return "RET:%s" % self.properties[prop]
+        return "ERR:unknown request %s" % request
+
+    def send_replies(self, sock, replies):
+        for reply_time, reply in replies:
+            gevent.sleep(max(reply_time - time.time(), 0))
+            sock.sendall(STX + reply.encode() + ETX)
+
+    def handle(self, sock, address):
+        # replies are delayed by the latency, keeping the order of requests
+        replies = gevent.queue.Queue()
+        sender = gevent.spawn(self.send_replies, sock, replies)
+        buffer = b""
+        while True:
+            data = sock.recv(4096)
+            if not data:
+                break
+            buffer += data
+            while ETX in buffer:
+                frame, _, buffer = buffer.partition(ETX)
+                request = frame.lstrip(STX).decode()
+                replies.put((time.time() + self.latency, self.reply(request)))
+        sender.kill()
+
+
+def bench(server, count, pipelined):
+    exporter = Exporter("127.0.0.1", server.port, pipelined=pipelined)
+    props = ["Property%d" % i for i in range(count)]
+    results = {}
+
+    start = time.perf_counter()
+    values = [exporter.read_property(prop) for prop in props]
+    results["sequential"] = time.perf_counter() - start
+    assert values == list(range(count))
+
+    start = time.perf_counter()
+    greenlets = [gevent.spawn(exporter.read_property, prop) for prop in props]
+    gevent.joinall(greenlets, raise_error=True)
+    results["concurrent"] = time.perf_counter() - start
+    assert [greenlet.value for greenlet in greenlets] == list(range(count))
+
+    start = time.perf_counter()
+    values = exporter.read_properties(props)
+    results["read_properties"] = time.perf_counter() - start
+    assert values == list(range(count))
+
+    exporter.disconnect()
+    return results
+
+
+def main(count, latency):
+    server = FakeExporterServer(latency / 1000.0)
+    server.properties = {"Property%d" % i: i for i in range(count)}
+    server.start()
+
+    serial = bench(server, count, pipelined=False)
+    pipelined = bench(server, count, pipelined=True)
+    server.stop()
+
+    print("%d property reads, %.1f ms latency" % (count, latency))
+    print("  %-16s %10s %10s" % ("", "serial", "pipelined"))
+    for name in serial:
+        print("  %-16s %9.3fs %9.3fs" % (name, serial[name], pipelined[name]))
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 1.0,
+    )
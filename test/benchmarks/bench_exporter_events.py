@@ -0,0 +1,150 @@
+"""Benchmark the processing of exporter event streams
+
+Measures the throughput (messages/s) of the STX/ETX framing of synthetic
+MD event streams, compared with the former byte by byte parsing, and the
+end to end throughput of events received by an ExporterClient from a
+local socket. Also measures the decoding of the event values, with and
+without the value types learnt per event name.
+
+Usage: python -m test.benchmarks.bench_exporter_events [N]
+"""
+
+import sys
+import time
+
+from gevent import monkey
+
+monkey.patch_all(thread=False)
+
+import gevent
+import gevent.event
+import gevent.server
+
+from mxcubecore.Command.Exporter import Exporter
+from mxcubecore.Command.exporter.ExporterClient import ExporterClient
+from mxcubecore.Command.exporter.StandardClient import (
+    ETX,
+    MAX_SIZE_STREAM_MSG,
+    PROTOCOL,
+    STX,
+    FrameParser,
+)
+
+
+def make_stream(count):
+    """Synthetic stream of motor position and state events"""
+    frames = []
+    for i in range(count):
+        if i % 10:
+            msg = "EVT:OmegaPosition\t%.4f\t%d" % (i * 0.01, 1700000000000 + i)
+        else:
+            msg = "EVT:State\tRunning\t%d" % (1700000000000 + i)
+        frames.append(b"\x02" + msg.encode() + b"\x03")
+    return b"".join(frames)
+
+
+def chunks(data, size=4096):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+def legacy_parse(data_chunks):
+    """Byte by byte parsing, as done before FrameParser"""
+    messages = []
+    buffer = b""
+    received_stx = False
+    for ret in data_chunks:
+        for b in ret:
+            if b == STX:
+                buffer = b""
+                received_stx = True
+            elif b == ETX:
+                if received_stx:
+                    messages.append(buffer.decode())
+                    received_stx = False
+                    buffer = b""
+            elif received_stx:
+                buffer += bytes([b])
+        if len(buffer) > MAX_SIZE_STREAM_MSG:
+            received_stx = False
+            buffer = b""
+    return messages
+
+
+def frame_parse(data_chunks):
+    parser = FrameParser()
+    messages = []
+    for ret in data_chunks:
+        messages.extend(frame.decode() for frame in parser.feed(ret))
+    return messages
+
+
+class CountingClient(ExporterClient):
+    def __init__(self, port, count):
+        super().__init__("127.0.0.1", port, PROTOCOL.STREAM, 3, 1)
+        self.count = count
+        self.received = 0
+        self.done = gevent.event.Event()
+
+    def on_event(self, name, value, timestamp):
+        self.received += 1
+        if self.received == self.count:
+            self.done.set()
+
+
+def bench_socket(stream, count):
+    server = gevent.server.StreamServer(
+        ("127.0.0.1", 0), lambda sock, address: sock.sendall(stream)
+    )
+    server.start()
+    client = CountingClient(server.server_port, count)
+
+    start = time.perf_counter()
+    client.connect()
+    client.done.wait(60)
+    elapsed = time.perf_counter() - start
+
+    client.disconnect()
+    server.stop()
+    return client.received / elapsed
+
+
+def bench_decoding(messages):
+    events = [msg[4:].split("\t")[:2] for msg in messages]
+    events += [("MotorPositions", "\x1f1.5\x1f2.25\x1f-3.5\x1f0.0\x1f")] * len(events)
+    exporter = Exporter("127.0.0.1", 0)
+
+    start = time.perf_counter()
+    generic = [exporter._to_python_value(value) for _, value in events]
+    generic_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    typed = [exporter._to_python_value(value, name) for name, value in events]
+    typed_time = time.perf_counter() - start
+    assert typed == generic
+
+    print("  generic decoding:      %12.0f values/s" % (len(events) / generic_time))
+    print("  typed decoding:        %12.0f values/s" % (len(events) / typed_time))
+
+
+def main(count):
+    stream = make_stream(count)
+    data_chunks = chunks(stream)
+
+    start = time.perf_counter()
+    legacy = legacy_parse(data_chunks)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parsed = frame_parse(data_chunks)
+    parse_time = time.perf_counter() - start
+    assert parsed == legacy and len(parsed) == count
+
+    print("%d events, %d bytes" % (count, len(stream)))
+    print("  byte by byte parsing:  %12.0f msg/s" % (count / legacy_time))
+    print("  FrameParser:           %12.0f msg/s" % (count / parse_time))
+    print("  ExporterClient socket: %12.0f msg/s" % bench_socket(stream, count))
+    bench_decoding(parsed)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,44 @@
+"""Benchmark the HardwareRepository startup loading
+
+Loads the beamline configuration with increasing load concurrency and
+prints the elapsed load time. The sum of the hardware objects own load
+times and the critical path of the dependency graph are those of the
+sequential load (concurrency 1).
+
+Usage: python -m test.benchmarks.bench_hwr_loading [configuration_path]
+"""
+
+import os
+import sys
+
+from gevent import monkey
+
+monkey.patch_all(thread=False)
+
+from mxcubecore import HardwareRepository as HWR
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+MOCKUP_PATH = "%s%s%s" % (
+    os.path.join(ROOT_DIR, "mxcubecore/configuration/mockup"),
+    os.path.pathsep,
+    os.path.join(ROOT_DIR, "mxcubecore/configuration/mockup/test"),
+)
+
+
+def main(configuration_path):
+    results = []
+    # the first load (including the modules import) is not measured
+    for concurrency in (1, 1, 2, 4, 8, 16):
+        HWR._instance = HWR.beamline = None
+        HWR.init_hardware_repository(configuration_path, load_concurrency=concurrency)
+        results.append((concurrency,) + HWR.get_hardware_repository().get_load_times())
+
+    _, total, critical_path, _ = results[1]
+    print("total %.1f ms, critical path %.1f ms" % (total, critical_path))
+    print("%12s %12s" % ("concurrency", "elapsed (ms)"))
+    for concurrency, _, _, elapsed in results[1:]:
+        print("%12d %12.1f" % (concurrency, elapsed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else MOCKUP_PATH)
@@ -0,0 +1,59 @@
+"""Benchmark the image acquisition of the automatic centring loop detection
+
+Gets the image handed to lucid at common camera resolutions: in memory (a
+grayscale numpy array) and through the former snapshot file (saved as PNG,
+then read back as grayscale, as lucid does with a file path).
+
+Usage: python -m test.benchmarks.bench_loop_image
+"""
+
+import time
+
+import numpy
+from PIL import Image
+
+from mxcubecore.HardwareObjects import sample_centring
+from mxcubecore.HardwareObjects.SampleView import SampleView
+
+RESOLUTIONS = ((659, 493), (1024, 768), (1360, 1024), (2048, 1536))
+
+
+class FakeCamera:
+    def __init__(self, width, height):
+        self.image = Image.effect_noise((width, height), 40).convert("RGB")
+
+    def get_last_image(self):
+        return self.image.tobytes(), self.image.width, self.image.height
+
+
+def snapshot_file_image(sample_view):
+    sample_centring.IN_MEMORY_LOOP_DETECTION = False
+    try:
+        path = sample_centring.get_loop_image(sample_view)
+    finally:
+        sample_centring.IN_MEMORY_LOOP_DETECTION = True
+    return numpy.asarray(Image.open(path).convert("L"))
+
+
+def timed(func, repeat=10):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return 1000 * (time.perf_counter() - start) / repeat
+
+
+def main():
+    print("%12s %14s %14s" % ("resolution", "in memory (ms)", "file (ms)"))
+    for width, height in RESOLUTIONS:
+        sample_view = SampleView("sample-view")
+        sample_view._camera = FakeCamera(width, height)
+
+        in_memory = timed(lambda: sample_centring.get_loop_image(sample_view))
+        snapshot_file = timed(lambda: snapshot_file_image(sample_view))
+        print(
+            "%12s %14.1f %14.1f" % ("%dx%d" % (width, height), in_memory, snapshot_file)
+        )
+
+
+if __name__ == "__main__":
+    main()
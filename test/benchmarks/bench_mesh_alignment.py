@@ -0,0 +1,155 @@
+"""Benchmark the alignment of mesh scan results during online processing
+
+Replays synthetic Dozor batches (image number, spots, -, resolution, score)
+of a mesh scan through DozorOnlineProcessing.batch_processed, with the
+vectorised alignment and with the former per image alignment, and reports
+the time spent per batch and the image rate the alignment can sustain.
+
+Usage: python -m test.benchmarks.bench_mesh_alignment [cols rows batch_size]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from mxcubecore.HardwareObjects.abstract.AbstractOnlineProcessing import (
+    DEFAULT_RESULT_TYPES,
+)
+from mxcubecore.HardwareObjects.DozorOnlineProcessing import DozorOnlineProcessing
+
+
+class FakeGrid:
+    """Mesh scanned in vertical zig-zag lines"""
+
+    def __init__(self, num_cols, num_rows):
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+
+    def get_col_row_from_image_serial(self, image_serial):
+        line, image = divmod(image_serial - 1, self.num_rows)
+        if line % 2:
+            image = self.num_rows - 1 - image
+        return line, image
+
+    def get_motor_pos_from_col_row(self, col, row):
+        return {"phiy": col * 0.01, "phiz": row * 0.01}
+
+    def set_score(self, score):
+        pass
+
+
+def legacy_align_processing_results(self, start_index, end_index):
+    """Per image alignment, as done before"""
+    for score_key in self.results_raw:
+        for cell_index in range(start_index, end_index + 1):
+            col, row = self.grid.get_col_row_from_image_serial(
+                cell_index + self.params_dict["first_image_num"]
+            )
+            if (
+                col < self.results_aligned[score_key].shape[0]
+                and row < self.results_aligned[score_key].shape[1]
+            ):
+                self.results_aligned[score_key][col][row] = self.results_raw[score_key][
+                    cell_index
+                ]
+
+    self.grid.set_score(self.results_raw["spots_num"])
+    (center_x, center_y) = ndimage.center_of_mass(self.results_aligned["score"])
+    self.results_aligned["center_mass"] = self.grid.get_motor_pos_from_col_row(
+        center_x, center_y
+    )
+
+    best_positions_list = []
+    for index in (-self.results_raw["score"]).argsort()[:10]:
+        if self.results_raw["score"][index] > 0:
+            col, row = self.grid.get_col_row_from_image_serial(
+                index + self.params_dict["first_image_num"]
+            )
+            best_positions_list.append(
+                {
+                    "index": index,
+                    "score": self.results_raw["score"][index],
+                    "filename": os.path.basename(
+                        self.params_dict["template"]
+                        % (self.params_dict["run_number"], index + 1)
+                    ),
+                    "cpos": self.grid.get_motor_pos_from_col_row(
+                        col + 0.5, self.params_dict["steps_y"] - row - 0.5
+                    ),
+                }
+            )
+    self.results_aligned["best_positions"] = best_positions_list
+
+
+def make_processing(grid, legacy=False):
+    processing = DozorOnlineProcessing("dozor")
+    if legacy:
+        processing.align_processing_results = (
+            lambda start, end: legacy_align_processing_results(processing, start, end)
+        )
+    images_num = grid.num_cols * grid.num_rows
+    processing.started = True
+    processing.grid = grid
+    processing.params_dict = {
+        "first_image_num": 1,
+        "images_num": images_num,
+        "steps_x": grid.num_cols,
+        "steps_y": grid.num_rows,
+        "template": "/data/mesh_%d_%05d.cbf",
+        "run_number": 1,
+    }
+    processing.results_raw = {}
+    processing.results_aligned = {}
+    for result_type in DEFAULT_RESULT_TYPES:
+        processing.results_raw[result_type["key"]] = np.zeros(images_num)
+        processing.results_aligned[result_type["key"]] = np.zeros(
+            (grid.num_cols, grid.num_rows)
+        )
+    return processing
+
+
+def make_batches(images_num, batch_size):
+    rng = np.random.default_rng(0)
+    scores = rng.gamma(0.5, 10, images_num)
+    return [
+        [
+            (image, int(score * 3), 0, 1.5 + score / 100, score)
+            for image, score in zip(
+                range(start + 1, min(start + batch_size, images_num) + 1),
+                scores[start : start + batch_size],
+            )
+        ]
+        for start in range(0, images_num, batch_size)
+    ]
+
+
+def replay(processing, batches):
+    start = time.perf_counter()
+    for batch in batches:
+        processing.batch_processed(batch)
+    return time.perf_counter() - start
+
+
+def main(num_cols, num_rows, batch_size):
+    grid = FakeGrid(num_cols, num_rows)
+    images_num = num_cols * num_rows
+    batches = make_batches(images_num, batch_size)
+
+    print(
+        "%dx%d mesh, %d batches of %d images"
+        % (num_cols, num_rows, len(batches), batch_size)
+    )
+    for name, legacy in (("vectorised", False), ("per image", True)):
+        elapsed = replay(make_processing(grid, legacy), batches)
+        print(
+            "  %-12s %8.3f ms/batch %10.0f images/s"
+            % (name, 1000 * elapsed / len(batches), images_num / elapsed)
+        )
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]] or [100, 100, 50]
+    main(*args)
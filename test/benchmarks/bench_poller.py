@@ -0,0 +1,65 @@
+"""Benchmark the registration of many pollers with Poller.poll
+
+Registers N pollers on distinct polled calls, then registers them a second
+time to exercise the duplicate lookup, and compares the time spent with a
+linear scan over all the pollers, as done before the lookup was indexed.
+
+Usage: python -m test.benchmarks.bench_poller [N]
+"""
+
+import sys
+import time
+
+from mxcubecore import Poller
+
+
+class Channel:
+    def read(self):
+        return 0
+
+    def update(self, value):
+        pass
+
+    def error(self, exception, poller_id):
+        pass
+
+
+def linear_find(polled_call, polled_call_args):
+    for poller in Poller.POLLERS.values():
+        if poller.polled_call_ref() == polled_call and poller.args == polled_call_args:
+            return poller
+    return None
+
+
+def main(count):
+    # long polling period: only the registration is measured
+    Poller.set_engine("scheduler")
+    channels = [Channel() for _ in range(count)]
+
+    start = time.perf_counter()
+    for channel in channels:
+        Poller.poll(channel.read, (), 10**9, channel.update, channel.error)
+    register = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for channel in channels:
+        Poller.poll(channel.read, (), 10**9, channel.update, channel.error)
+    indexed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for channel in channels:
+        linear_find(channel.read, ())
+    linear = time.perf_counter() - start
+
+    print("%d pollers" % count)
+    print("  register:              %8.3f s" % register)
+    print("  duplicate lookup:      %8.3f s" % indexed)
+    print("  linear scan (before):  %8.3f s" % linear)
+    print("  speed-up:              %8.1f x" % (linear / indexed))
+
+    for poller in list(Poller.POLLERS.values()):
+        poller.stop()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
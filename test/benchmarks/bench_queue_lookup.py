@@ -0,0 +1,88 @@
+"""Benchmark the queue node and queue entry lookups
+
+Builds a queue of N nodes (samples with a task group of tasks each) and
+looks up every node by id with QueueModel.get_node, and every queue entry
+by data model with QueueManager.get_entry_with_model, compared with the
+former recursive searches.
+
+Usage: python -m test.benchmarks.bench_queue_lookup [N]
+"""
+
+import random
+import sys
+import time
+
+from mxcubecore.HardwareObjects.QueueManager import QueueManager
+from mxcubecore.HardwareObjects.QueueModel import QueueModel
+from mxcubecore.model import queue_model_objects
+from mxcubecore.queue_entry.base_queue_entry import BaseQueueEntry
+
+TASKS_PER_SAMPLE = 8
+
+
+def build_queue(count):
+    queue_model = QueueModel("queue-model")
+    queue_manager = QueueManager("queue")
+    root = queue_model.get_model_root()
+    nodes = []
+
+    for _ in range(count // (TASKS_PER_SAMPLE + 2)):
+        sample = queue_model_objects.Sample()
+        queue_model.add_child(root, sample)
+        sample_entry = BaseQueueEntry(data_model=sample)
+        queue_manager.enqueue(sample_entry)
+
+        group = queue_model_objects.TaskGroup()
+        queue_model.add_child(sample, group)
+        group_entry = BaseQueueEntry(data_model=group)
+        sample_entry.enqueue(group_entry)
+        nodes.extend((sample, group))
+
+        for _ in range(TASKS_PER_SAMPLE):
+            task = queue_model_objects.TaskNode()
+            queue_model.add_child(group, task)
+            group_entry.enqueue(BaseQueueEntry(data_model=task))
+            nodes.append(task)
+
+    return queue_model, queue_manager, nodes
+
+
+def timed(lookup, items, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            lookup(item)
+    return (time.perf_counter() - start) / (repeat * len(items))
+
+
+def main(count):
+    queue_model, queue_manager, nodes = build_queue(count)
+    random.seed(0)
+    sample = random.sample(nodes, min(len(nodes), 200))
+    node_ids = [node._node_id for node in sample]
+
+    print("%d nodes" % len(nodes))
+    results = (
+        ("QueueModel.get_node", queue_model.get_node, node_ids),
+        (
+            "  recursive search",
+            lambda _id: queue_model._find_node(_id, queue_model.get_model_root()),
+            node_ids,
+        ),
+        (
+            "QueueManager.get_entry_with_model",
+            queue_manager.get_entry_with_model,
+            sample,
+        ),
+        (
+            "  recursive search",
+            lambda model: queue_manager._find_entry_with_model(model, queue_manager),
+            sample,
+        ),
+    )
+    for name, lookup, items in results:
+        print("  %-36s %10.2f us/lookup" % (name, 1e6 * timed(lookup, items)))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
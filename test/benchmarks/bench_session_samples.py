@@ -0,0 +1,96 @@
+"""Benchmark the matching of the ISPyB samples with the sample changer ones
+
+Runs ISPyBClient.get_session_samples on a synthetic proposal (code and
+sample changer location of each sample, the last ones being in the dewar)
+against a full 29 pucks x 16 samples dewar, with the indexed matching and
+with the former linear search, and reports the time per call.
+
+Usage: python -m test.benchmarks.bench_session_samples [num_samples repeat]
+"""
+
+import sys
+import time
+
+from suds.sudsobject import Object
+
+from mxcubecore.HardwareObjects import ISPyBClient as ispyb_client_module
+from mxcubecore.HardwareObjects.ISPyBClient import ISPyBClient
+
+
+class LinearSampleReferences(list):
+    """Sample changer samples searched linearly, as done before the index"""
+
+    def find(self, code=None, location=None):
+        for sample_ref in self:
+            if code and location:
+                if (
+                    sample_ref.code == code
+                    and sample_ref.container_reference == location[0]
+                    and sample_ref.sample_reference == location[1]
+                ):
+                    return sample_ref
+            elif code:
+                if sample_ref.code == code:
+                    return sample_ref
+            elif location:
+                if (
+                    sample_ref.container_reference == location[0]
+                    and sample_ref.sample_reference == location[1]
+                ):
+                    return sample_ref
+        return None
+
+
+def make_lims(num_samples):
+    lims_samples = []
+    for index in range(num_samples):
+        sample = Object()
+        puck, vial = divmod(index, 16)
+        sample.code = "DM-%d" % index
+        sample.containerSampleChangerLocation = str(puck + 1)
+        sample.sampleLocation = str(vial + 1)
+        lims_samples.append(sample)
+
+    class Service:
+        def findSampleInfoLightForProposal(self, proposal_id, beamline_name):
+            # the samples of past sessions first
+            return lims_samples[::-1]
+
+    class ToolsWebService:
+        service = Service()
+
+    client = ISPyBClient("lims")
+    client.get_session = lambda session_id: {}
+    client._tools_ws = ToolsWebService()
+    return client
+
+
+def timed(client, sample_refs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        samples = client.get_session_samples(1, 1, sample_refs)["loaded_sample"]
+    return (time.perf_counter() - start) / repeat, len(samples)
+
+
+def main(num_samples, repeat):
+    client = make_lims(num_samples)
+    sample_refs = [
+        ("DM-%d" % ((puck - 1) * 16 + vial - 1), puck, vial, "")
+        for puck in range(1, 30)
+        for vial in range(1, 17)
+    ]
+
+    print("%d ISPyB samples, %d sample changer samples" % (num_samples, 29 * 16))
+    indexed = ispyb_client_module.SampleReferenceIndex
+    for name, references in (("indexed", indexed), ("linear", LinearSampleReferences)):
+        ispyb_client_module.SampleReferenceIndex = references
+        try:
+            elapsed, num_matched = timed(client, sample_refs, repeat)
+        finally:
+            ispyb_client_module.SampleReferenceIndex = indexed
+        print("  %-8s %8.1f ms/call (%d samples)" % (name, 1000 * elapsed, num_matched))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]] or [5000, 3]
+    main(*args)
@@ -0,0 +1,72 @@
+"""Benchmark the projection of the shape centred positions on the screen
+
+Projects the centred positions of N shapes with
+GenericDiffractometer.motor_positions_list_to_screen (one batch) and with
+motor_positions_to_screen, one position at a time as SampleView did before.
+Reading a motor position costs READ_TIME, as a hardware channel read would.
+
+Usage: python -m test.benchmarks.bench_shape_reprojection [N]
+"""
+
+import sys
+import time
+
+import numpy
+
+from mxcubecore.HardwareObjects.GenericDiffractometer import GenericDiffractometer
+
+READ_TIME = 50e-6
+
+
+class FakeCentringMotor:
+    def __init__(self, value, direction=1):
+        self.value = value
+        self.direction = direction
+
+    def get_value(self):
+        end = time.perf_counter() + READ_TIME
+        while time.perf_counter() < end:
+            pass
+        return self.value
+
+
+def make_diffractometer():
+    diffractometer = GenericDiffractometer("diffractometer")
+    diffractometer.use_sample_centring = True
+    diffractometer.update_zoom_calibration = lambda: None
+    diffractometer.pixels_per_mm_x = 520.0
+    diffractometer.pixels_per_mm_y = 530.0
+    diffractometer.beam_position = (640, 512)
+    diffractometer.centring_phi = FakeCentringMotor(37.5)
+    diffractometer.centring_sampx = FakeCentringMotor(0.12)
+    diffractometer.centring_sampy = FakeCentringMotor(-0.3)
+    diffractometer.centring_phiy = FakeCentringMotor(0.05)
+    diffractometer.centring_phiz = FakeCentringMotor(0.2)
+    return diffractometer
+
+
+def timed(func, repeat=5):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return 1000 * (time.perf_counter() - start) / repeat
+
+
+def main(count):
+    diffractometer = make_diffractometer()
+    positions = [
+        dict(zip(("sampx", "sampy", "phiy", "phiz"), values))
+        for values in numpy.random.default_rng(0).uniform(-1, 1, (count, 4))
+    ]
+
+    batch = timed(lambda: diffractometer.motor_positions_list_to_screen(positions))
+    single = timed(
+        lambda: [diffractometer.motor_positions_to_screen(pos) for pos in positions]
+    )
+    print("%d centred positions" % count)
+    print("  one batch:          %8.2f ms" % batch)
+    print("  one at a time:      %8.2f ms" % single)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,99 @@
+"""Benchmark SampleView.take_snapshot with an overlay
+
+Takes snapshots with a base64 encoded PNG overlay (shapes drawn on a
+transparent background, as sent by the web client) at common camera
+resolutions: the first snapshot (decoding and resizing the overlay), the
+following ones (cached overlay) and the former per pixel compositing.
+
+Usage: python -m test.benchmarks.bench_snapshot_overlay
+"""
+
+import base64
+import time
+from io import BytesIO
+
+from PIL import (
+    Image,
+    ImageDraw,
+)
+
+from mxcubecore.HardwareObjects.SampleView import SampleView
+
+RESOLUTIONS = ((659, 493), (1024, 768), (1280, 1024), (1360, 1024), (2048, 1536))
+
+
+class FakeCamera:
+    def __init__(self, width, height):
+        self.image = Image.effect_noise((width, height), 40).convert("RGB")
+
+    def get_last_image(self):
+        return self.image.tobytes(), self.image.width, self.image.height
+
+
+def make_overlay_data(width, height):
+    overlay = Image.new("RGBA", (width // 2, height // 2), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    for i in range(10):
+        draw.ellipse((20 * i, 10 * i, 20 * i + 40, 10 * i + 40), outline="#ff0000")
+        draw.rectangle((30 * i, 200, 30 * i + 20, 260), outline="#00ff00", width=2)
+    buffer = BytesIO()
+    overlay.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue())
+
+
+def legacy_combine_images(img1, img2):
+    """Per pixel compositing, as done before"""
+    combined_img = Image.new("RGB", img1.size)
+    pixels1 = img1.load()
+    pixels2 = img2.load()
+    combined_pixels = combined_img.load()
+    width, height = img1.size
+    for x in range(width):
+        for y in range(height):
+            pixel1 = pixels1[x, y]
+            pixel2 = pixels2[x, y]
+            if pixel2[0] <= 200 and pixel2[1] <= 60 and pixel2[2] <= 140:
+                combined_pixels[x, y] = pixel1
+            else:
+                combined_pixels[x, y] = pixel2
+    return combined_img
+
+
+def legacy_take_snapshot(camera, overlay_data):
+    data, width, height = camera.get_last_image()
+    img = Image.frombytes("RGB", (width, height), data)
+    overlay_image = Image.open(BytesIO(base64.b64decode(overlay_data)))
+    overlay_image = overlay_image.resize((width, height), Image.Resampling.LANCZOS)
+    return legacy_combine_images(img, overlay_image.convert("RGB"))
+
+
+def timed(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return 1000 * (time.perf_counter() - start) / repeat
+
+
+def main():
+    print(
+        "%12s %12s %12s %12s"
+        % ("resolution", "first (ms)", "cached (ms)", "legacy (ms)")
+    )
+    for width, height in RESOLUTIONS:
+        sample_view = SampleView("sample-view")
+        sample_view._camera = FakeCamera(width, height)
+        overlay_data = make_overlay_data(width, height)
+
+        first = timed(lambda: sample_view.take_snapshot(overlay_data=overlay_data))
+        cached = timed(
+            lambda: sample_view.take_snapshot(overlay_data=overlay_data), repeat=10
+        )
+        legacy = timed(lambda: legacy_take_snapshot(sample_view.camera, overlay_data))
+        print(
+            "%12s %12.1f %12.1f %12.1f"
+            % ("%dx%d" % (width, height), first, cached, legacy)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark the creation of the Tango channels and commands of a device
+
+Creates the channels and commands of a stubbed PyTango device, as a sample
+changer or a diffractometer declares them, the stub sleeping a fixed
+latency per network call. Compares the shared proxy pool with one proxy,
+ping and attribute query per channel, as done before the pool.
+
+Usage: python -m test.benchmarks.bench_tango_startup [channels latency_ms]
+"""
+
+import sys
+import time
+
+from mxcubecore.Command import Tango
+from mxcubecore.Command.Tango import (
+    TangoChannel,
+    TangoCommand,
+)
+
+
+class AttributeInfo:
+    def __init__(self, name):
+        self.name = name
+
+
+class StubDeviceProxy:
+    latency = 0.002
+    calls = 0
+
+    def __init__(self, device_name):
+        self._network_call()
+        self.attributes = ["Attr%d" % index for index in range(100)]
+
+    def _network_call(self):
+        StubDeviceProxy.calls += 1
+        time.sleep(self.latency)
+
+    def ping(self):
+        self._network_call()
+
+    def set_timeout_millis(self, timeout):
+        pass
+
+    def attribute_list_query(self):
+        self._network_call()
+        return [AttributeInfo(name) for name in self.attributes]
+
+
+def create_objects(num_channels, pooled):
+    for index in range(num_channels):
+        if not pooled:
+            Tango.clear_device_proxies()
+        TangoChannel("chan%d" % index, "Attr%d" % index, tangoname="bl/sc/1")
+    for index in range(num_channels // 3):
+        if not pooled:
+            Tango.clear_device_proxies()
+        TangoCommand("cmd%d" % index, "Cmd%d" % index, "bl/sc/1").init_device()
+
+
+def main(num_channels, latency_ms):
+    Tango.DeviceProxy = StubDeviceProxy
+    StubDeviceProxy.latency = latency_ms / 1000.0
+
+    print(
+        "%d channels and %d commands on one device, %.1f ms per network call"
+        % (num_channels, num_channels // 3, latency_ms)
+    )
+    for name, pooled in (("pooled", True), ("per channel", False)):
+        Tango.clear_device_proxies()
+        StubDeviceProxy.calls = 0
+        start = time.perf_counter()
+        create_objects(num_channels, pooled)
+        elapsed = time.perf_counter() - start
+        print(
+            "  %-12s %8.1f ms %6d network calls"
+            % (name, 1000 * elapsed, StubDeviceProxy.calls)
+        )
+
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]] or [15, 2.0]
+    main(int(args[0]), args[1])
@@ -0,0 +1,159 @@
+"""Tests for the background batch uploader"""
+
+import json
+import os
+
+import gevent
+import numpy
+import pytest
+
+from mxcubecore.utils.batch_uploader import BatchUploader
+
+
+class FakeService:
+    def __init__(self):
+        self.records = []
+        self.down = False
+        self.calls = 0
+
+    def send(self, record):
+        self.calls += 1
+        if self.down:
+            raise IOError("service down")
+        if record.get("invalid"):
+            raise ValueError("record rejected")
+        self.records.append(record)
+
+
+@pytest.fixture
+def service():
+    return FakeService()
+
+
+def make_uploader(service, **kwargs):
+    options = dict(batch_size=10, flush_interval=0.05, backoff=0.01, max_backoff=0.02)
+    options.update(kwargs)
+    return BatchUploader(service.send, **options)
+
+
+def test_flush_by_size_and_time(service):
+    uploader = make_uploader(service, flush_interval=10)
+    for index in range(25):
+        uploader.put({"imageId": index})
+    gevent.sleep(0.05)
+    # the full batches only
+    assert [record["imageId"] for record in service.records] == list(range(20))
+    assert uploader.get_metrics()["queue_depth"] == 5
+
+    uploader.put({"imageId": 25})
+    assert uploader.flush(1)
+    assert [record["imageId"] for record in service.records] == list(range(26))
+    assert uploader.get_metrics()["sent"] == 26
+    uploader.stop()
+
+
+def test_retry_with_backoff(service):
+    uploader = make_uploader(service, max_retries=100)
+    service.down = True
+    for index in range(3):
+        uploader.put({"imageId": index})
+    gevent.sleep(0.2)
+    metrics = uploader.get_metrics()
+    assert metrics["failures"] > 1
+    assert metrics["queue_depth"] == 3
+    assert metrics["last_error"] == "service down"
+
+    service.down = False
+    assert uploader.flush(1)
+    assert [record["imageId"] for record in service.records] == [0, 1, 2]
+    assert uploader.get_metrics()["failures"] == 0
+    uploader.stop()
+
+
+def test_spool_during_outage(service, tmp_path):
+    spool_directory = str(tmp_path / "spool")
+    uploader = make_uploader(service, max_retries=2, spool_directory=spool_directory)
+    service.down = True
+    for index in range(5):
+        uploader.put({"imageId": index, "score": numpy.float32(index / 2)})
+    gevent.sleep(0.2)
+
+    metrics = uploader.get_metrics()
+    assert metrics["queue_depth"] == 0
+    assert metrics["spooled"] == 5
+    assert os.listdir(spool_directory)
+
+    # records queued during the outage are sent after the spooled ones
+    uploader.put({"imageId": 5})
+    service.down = False
+    assert uploader.flush(1)
+    assert [record["imageId"] for record in service.records] == list(range(6))
+    assert service.records[1]["score"] == 0.5
+    assert not os.listdir(spool_directory)
+    assert uploader.get_metrics()["spooled"] == 0
+    uploader.stop()
+
+
+def test_spool_survives_restart(service, tmp_path):
+    spool_directory = str(tmp_path / "spool")
+    service.down = True
+    uploader = make_uploader(service, max_retries=1, spool_directory=spool_directory)
+    for index in range(3):
+        uploader.put({"imageId": index})
+    uploader.stop(timeout=0.01)
+    assert uploader.get_metrics()["spooled"] == 3
+
+    service.down = False
+    uploader = make_uploader(service, spool_directory=spool_directory)
+    uploader.start()
+    assert uploader.get_metrics()["spooled"] == 3
+    assert uploader.flush(1)
+    assert sorted(record["imageId"] for record in service.records) == [0, 1, 2]
+    uploader.stop()
+
+
+def test_rejected_record_dropped(service, tmp_path):
+    spool_directory = str(tmp_path / "spool")
+    uploader = make_uploader(service, max_retries=2, spool_directory=spool_directory)
+    for index in range(5):
+        uploader.put({"imageId": index, "invalid": index == 2})
+    assert uploader.flush(1)
+
+    # the other records are sent, the rejected one is not retried
+    assert [record["imageId"] for record in service.records] == [0, 1, 3, 4]
+    assert service.calls == 5
+    metrics = uploader.get_metrics()
+    assert metrics["dropped"] == 1
+    assert metrics["failures"] == 0
+    assert metrics["spooled"] == 0
+    assert metrics["last_error"] == "record rejected"
+    with open(os.path.join(spool_directory, "uploader.failed.jsonl")) as dead_letters:
+        assert [json.loads(line)["imageId"] for line in dead_letters] == [2]
+    uploader.stop()
+
+
+def test_queue_size_limit(service, tmp_path):
+    spool_directory = str(tmp_path / "spool")
+    service.down = True
+    uploader = make_uploader(
+        service, max_retries=100, max_queue_size=20, spool_directory=spool_directory
+    )
+    for index in range(50):
+        uploader.put({"imageId": index})
+    metrics = uploader.get_metrics()
+    assert metrics["queue_depth"] <= 20
+    assert metrics["queue_depth"] + metrics["spooled"] == 50
+
+    service.down = False
+    assert uploader.flush(1)
+    assert [record["imageId"] for record in service.records] == list(range(50))
+    uploader.stop()
+
+    # without spool directory, the oldest records are dropped
+    memory_uploader = make_uploader(service, max_queue_size=20, flush_interval=10)
+    service.down = True
+    for index in range(50):
+        memory_uploader.put({"imageId": index})
+    assert memory_uploader.get_metrics()["queue_depth"] <= 20
+    assert memory_uploader.get_metrics()["dropped"] >= 30
+    memory_uploader.stop(timeout=0.01)
@@ -0,0 +1,177 @@
+"""Tests for the DataPublisher, with a fake redis server"""
+
+import json
+
+import gevent
+import numpy
+import pytest
+
+redis = pytest.importorskip("redis")
+fakeredis = pytest.importorskip("fakeredis")
+
+from mxcubecore.HardwareObjects.DataPublisher import (  # noqa: E402
+    DataPublisher,
+    FrameType,
+    PlotDim,
+    decode_block,
+    encode_block,
+)
+
+
+@pytest.fixture
+def publisher():
+    publisher = DataPublisher("data_publisher")
+    server = fakeredis.FakeServer()
+    publisher._r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    publisher._r_raw = fakeredis.FakeRedis(server=server)
+    publisher._write_batch_size = 10
+    publisher._write_interval = 20
+    return publisher
+
+
+def frame(_id, frame_type, data=None):
+    return {
+        "channel": "HWR_DP_NEW_DATA_POINT_%s" % _id,
+        "data": json.dumps({"type": frame_type.value, "data": data or {}}),
+    }
+
+
+def test_points_written_in_batches(publisher):
+    publisher.register("scan", "Scan", "scan", data_dim=PlotDim.TWO_D)
+    publisher._handle_message(frame("scan", FrameType.START))
+    assert publisher._get_description("scan")["running"]
+
+    for index in range(25):
+        publisher._handle_message(
+            frame("scan", FrameType.DATA, {"x": index, "y": 2 * index, "z": 1})
+        )
+
+    # two full batches written, 5 points pending
+    assert publisher._r.llen("HWR_DP_scan_DATA_X") == 20
+    assert publisher._pending_count == 5
+
+    # the pending points are written before the data is read
+    data = publisher.get_data("scan")
+    assert data["x"] == [str(index) for index in range(25)]
+    assert data["y"] == [str(2 * index) for index in range(25)]
+    assert data["z"] == ["1"] * 25
+
+    publisher._handle_message(frame("scan", FrameType.STOP))
+    desc = json.loads(publisher._r.get("HWR_DP_scan_DESCRIPTION"))
+    assert not desc["running"]
+
+    # a new run clears the data
+    publisher._handle_message(frame("scan", FrameType.START))
+    assert publisher.get_data("scan") == {"x": [], "y": [], "z": []}
+
+
+def test_description_with_data_during_run(publisher):
+    publisher.register("scan", "Scan", "scan")
+    ends = []
+    publisher.receiver = lambda desc: ends.append(desc)
+    publisher.connect("end", publisher.receiver)
+
+    publisher._handle_message(frame("scan", FrameType.START))
+    publisher._handle_message(frame("scan", FrameType.DATA, {"x": 1, "y": 2}))
+    desc = publisher.get_description("scan", include_data=True)[0]
+    assert desc["values"] == {"x": ["1"], "y": ["2"]}
+
+    publisher._handle_message(frame("scan", FrameType.DATA, {"x": 3, "y": 4}))
+    publisher._handle_message(frame("scan", FrameType.STOP))
+
+    # the values are not kept in the stored description
+    assert "values" not in json.loads(publisher._r.get("HWR_DP_scan_DESCRIPTION"))
+    assert "values" not in publisher.get_description("scan")[0]
+    assert ends[0]["values"] == {"x": ["1", "3"], "y": ["2", "4"]}
+    assert not ends[0]["running"]
+
+
+def test_pending_points_written_after_interval(publisher):
+    publisher.register("scan", "Scan", "scan")
+    publisher._handle_message(frame("scan", FrameType.START))
+    for index in range(3):
+        publisher._handle_message(frame("scan", FrameType.DATA, {"x": index, "y": 0}))
+
+    # as done by _handle_messages after each message or timeout
+    publisher._flush_data(publisher._write_interval)
+    assert publisher._r.llen("HWR_DP_scan_DATA_X") == 0
+
+    gevent.sleep(0.03)
+    publisher._flush_data(publisher._write_interval)
+    assert publisher._r.llen("HWR_DP_scan_DATA_X") == 3
+    assert publisher._pending_count == 0
+
+
+def test_failed_write_kept_pending(publisher, monkeypatch):
+    publisher.register("scan", "Scan", "scan")
+    publisher._handle_message(frame("scan", FrameType.START))
+    for index in range(3):
+        publisher._handle_message(frame("scan", FrameType.DATA, {"x": index, "y": 0}))
+
+    pipeline = publisher._r.pipeline
+
+    def execute():
+        raise redis.ConnectionError("redis down")
+
+    def failing_pipeline(**kwargs):
+        pipe = pipeline(**kwargs)
+        pipe.execute = execute
+        return pipe
+
+    monkeypatch.setattr(publisher._r, "pipeline", failing_pipeline)
+    with pytest.raises(redis.ConnectionError):
+        publisher._flush_data()
+    assert publisher._pending_count == 3
+
+    monkeypatch.undo()
+    publisher._flush_data()
+    assert publisher._r.lrange("HWR_DP_scan_DATA_X", 0, -1) == ["0", "1", "2"]
+
+
+def test_block_frames():
+    xs = numpy.linspace(0, 1, 7)
+    ys = numpy.arange(7)
+    frame = encode_block(xs, ys, zs=ys * 2)
+
+    block = decode_block(frame)
+    assert block.shape == (3, 7)
+    assert block.dtype == numpy.float64
+    numpy.testing.assert_array_equal(block[0], xs)
+    numpy.testing.assert_array_equal(block[2], ys * 2)
+    # the block shares the frame memory, aligned
+    assert not block.flags.owndata
+    assert block.flags.aligned
+
+    assert decode_block(encode_block([1, 2], [3, 4])).dtype == numpy.int64
+    with pytest.raises(ValueError):
+        decode_block(b"not a block")
+
+
+def test_published_blocks(publisher):
+    publisher.register("mesh", "Mesh", "mesh", data_dim=PlotDim.TWO_D)
+    blocks = []
+    publisher.receiver = lambda block: blocks.append(block)
+    publisher.connect("data_block", publisher.receiver)
+
+    pubsub = publisher._r_raw.pubsub(ignore_subscribe_messages=True)
+    pubsub.psubscribe("HWR_DP_NEW_DATA_POINT_*", "HWR_DP_NEW_DATA_BLOCK_*")
+    publisher.start("mesh")
+    for row in range(4):
+        xs = numpy.arange(10.0)
+        publisher.pub_block("mesh", xs, numpy.full(10, row), xs * row)
+    publisher.stop("mesh")
+
+    messages = []
+    while len(messages) < 6:
+        message = pubsub.get_message(timeout=0.1)
+        if message:
+            messages.append(message)
+            publisher._handle_message(message)
+
+    assert len(blocks) == 4
+    numpy.testing.assert_array_equal(blocks[3]["data"]["z"], numpy.arange(10.0) * 3)
+    # one rpush per axis and block: nothing left pending
+    assert publisher._pending_count == 0
+    data = publisher.get_data("mesh")
+    assert len(data["x"]) == len(data["z"]) == 40
+    assert data["y"][-1] == "3.0"
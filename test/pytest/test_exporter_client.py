@@ -0,0 +1,257 @@
+"""Tests for the Exporter client, against a local fake exporter server"""
+
+import gevent
+import gevent.server
+import numpy
+import pytest
+
+from mxcubecore.Command import Exporter as exporter_module
+from mxcubecore.Command.Exporter import (
+    Exporter,
+    ExporterChannel,
+    ExporterCommand,
+)
+from mxcubecore.Command.exporter import StandardClient
+from mxcubecore.Command.exporter.StandardClient import FrameParser
+
+STX = b"\x02"
+ETX = b"\x03"
+
+PROPERTIES = {
+    "OmegaPosition": "12.5",
+    "State": "Ready",
+    "FastShutterIsOpen": "false",
+    "MotorStates": "\x1fOmega=Ready\x1fKappa=Moving\x1f",
+}
+
+
+def handle(sock, address):
+    buffer = b""
+    while True:
+        data = sock.recv(4096)
+        if not data:
+            break
+        buffer += data
+        while ETX in buffer:
+            frame, _, buffer = buffer.partition(ETX)
+            cmd, _, prop = frame.lstrip(STX).decode().partition(" ")
+            if prop == "Slow":
+                gevent.sleep(0.5)
+                reply = "RET:slow"
+            elif cmd == "READ" and prop in PROPERTIES:
+                reply = "RET:" + PROPERTIES[prop]
+            elif cmd == "EXEC" and prop.startswith("getState"):
+                reply = "RET:" + PROPERTIES["State"]
+            else:
+                reply = "ERR:unknown property " + prop
+            sock.sendall(STX + reply.encode() + ETX)
+
+
+@pytest.fixture
+def server():
+    server = gevent.server.StreamServer(("127.0.0.1", 0), handle)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(params=[False, True], ids=["serial", "pipelined"])
+def exporter(request, server):
+    exporter = Exporter("127.0.0.1", server.server_port, pipelined=request.param)
+    yield exporter
+    exporter.disconnect()
+
+
+def test_read_property(exporter):
+    assert exporter.read_property("OmegaPosition") == 12.5
+    assert exporter.read_property("State") == "Ready"
+    assert exporter.read_property("FastShutterIsOpen") is False
+    assert exporter.read_property("Unknown") is None
+
+
+def test_read_property_concurrent(exporter):
+    props = list(PROPERTIES) * 20
+    greenlets = [gevent.spawn(exporter.read_property, prop) for prop in props]
+    gevent.joinall(greenlets, raise_error=True)
+
+    assert [greenlet.value for greenlet in greenlets] == [
+        exporter.read_property(prop) for prop in props
+    ]
+
+
+def test_read_properties(exporter):
+    assert exporter.read_properties(["State", "Unknown", "MotorStates"]) == [
+        "Ready",
+        None,
+        ["Omega=Ready", "Kappa=Moving"],
+    ]
+
+
+def test_pipelined_timeout(server):
+    exporter = Exporter("127.0.0.1", server.server_port, timeout=0.2, pipelined=True)
+
+    with pytest.raises(Exception):
+        exporter.read_properties(["State", "Slow"])
+    # the late reply is discarded and does not shift the following ones
+    assert exporter.read_property("State", timeout=1) == "Ready"
+    assert exporter.read_property("OmegaPosition") == 12.5
+
+    exporter.disconnect()
+
+
+def test_pipelined_send_error(server, monkeypatch):
+    exporter = Exporter("127.0.0.1", server.server_port, pipelined=True)
+    assert exporter.read_property("State") == "Ready"
+
+    def encode(cmd):
+        if "Slow" in cmd:
+            raise RuntimeError("send failed")
+        return cmd.encode()
+
+    monkeypatch.setattr(StandardClient, "encode", encode)
+    with pytest.raises(Exception):
+        exporter.read_properties(["State", "Slow"])
+    # no request is left waiting for a reply
+    assert not exporter._pending_replies
+    assert exporter.read_property("OmegaPosition") == 12.5
+    assert exporter.read_property("State") == "Ready"
+
+    exporter.disconnect()
+
+
+def test_channel_and_command(server, monkeypatch):
+    monkeypatch.setattr(exporter_module, "EXPORTER_CLIENTS", {})
+    updates = []
+
+    channel = ExporterChannel(
+        "omega",
+        "OmegaPosition",
+        address="127.0.0.1",
+        port=server.server_port,
+        pipelined=True,
+    )
+    channel.receiver = lambda value: updates.append(value)
+    channel.connect_signal("update", channel.receiver)
+    assert channel.value == 12.5
+    assert channel.get_value() == 12.5
+
+    # the exporter client is shared by address and port
+    command = ExporterCommand(
+        "state", "getState", address="127.0.0.1", port=server.server_port
+    )
+    assert len(exporter_module.EXPORTER_CLIENTS) == 1
+    assert command() == "Ready"
+    assert command.get_state() == "Ready"
+    assert command.is_connected()
+
+    channel.update(13.0)
+    assert updates == [13.0]
+    exporter_module.EXPORTER_CLIENTS[("127.0.0.1", server.server_port)].disconnect()
+
+
+def test_frame_parser():
+    parser = FrameParser(max_size=20)
+
+    assert parser.feed(b"\x02RET:1\x03\x02EVT:State\tReady\t1\x03") == [
+        b"RET:1",
+        b"EVT:State\tReady\t1",
+    ]
+    # frames split over several chunks, bytes outside frames ignored
+    assert parser.feed(b"garbage\x03\x02RET") == []
+    assert parser.feed(b":12") == []
+    assert parser.feed(b"3\x03\x02") == [b"RET:123"]
+    assert parser.feed(b"\x03") == [b""]
+    # an STX restarts the frame
+    assert parser.feed(b"\x02RET:lost\x02RET:2\x03") == [b"RET:2"]
+    # too long frames are dropped
+    assert parser.feed(b"\x02" + b"x" * 30) == []
+    assert parser.feed(b"\x03\x02RET:3\x03") == [b"RET:3"]
+
+
+def test_typed_decoding():
+    exporter = Exporter("127.0.0.1", 0)
+
+    assert exporter._to_python_value("12", "OmegaPosition") == 12
+    assert exporter.value_types["OmegaPosition"] == ("int", False)
+    # the learnt type is replaced when it does not fit
+    assert exporter._to_python_value("12.5", "OmegaPosition") == 12.5
+    assert exporter.value_types["OmegaPosition"] == ("float", False)
+    # as without learnt type, values without decimal point are int
+    value = exporter._to_python_value("13", "OmegaPosition")
+    assert value == 13 and isinstance(value, int)
+    value = exporter._to_python_value("1e3", "OmegaPosition")
+    assert value == 1000.0 and isinstance(value, float)
+
+    assert exporter._to_python_value("\x1f1\x1f2\x1f", "Counts") == [1, 2]
+    assert exporter._to_python_value("\x1f1.5\x1f2\x1f", "Counts") == [1.5, 2.0]
+    assert exporter.value_types["Counts"] == ("float_list", False)
+    values = exporter._to_python_value("\x1f-1\x1f2\x1f", "Counts")
+    assert values == [-1, 2] and all(isinstance(value, int) for value in values)
+    assert exporter._to_python_value("true", "FastShutterIsOpen") is True
+
+    # strings are not learnt: a later value may be a number
+    assert exporter._to_python_value("", "Zoom") == ""
+    assert "Zoom" not in exporter.value_types
+    assert exporter._to_python_value("3", "Zoom") == 3
+    assert exporter._to_python_value("unknown", "Zoom") == "unknown"
+    assert "Zoom" not in exporter.value_types
+
+    exporter.set_value_type("Profile", "float_array")
+    profile = exporter._to_python_value("\x1f1\x1f2.5\x1f3\x1f", "Profile")
+    assert isinstance(profile, numpy.ndarray)
+    assert profile.tolist() == [1.0, 2.5, 3.0]
+    with pytest.raises(ValueError):
+        exporter._to_python_value("\x1f1\x1fa\x1f", "Profile")
+    with pytest.raises(ValueError):
+        exporter.set_value_type("Profile", "complex")
+
+
+def test_events():
+    exporter = Exporter("127.0.0.1", 0)
+    received = []
+
+    exporter.register("OmegaPosition", received.append)
+    for value in ("1.5", "1.5", "2", "2", "1.5"):
+        exporter.on_event("OmegaPosition", value, 0)
+    gevent.sleep(0.1)
+
+    assert received == [1.5, 2.0, 1.5]
+    assert exporter.skipped_events == 2
+
+
+def test_coalesced_events():
+    exporter = Exporter("127.0.0.1", 0)
+    received = []
+
+    exporter.set_event_coalescing("OmegaPosition")
+    exporter.register("OmegaPosition", received.append)
+    exporter.register("State", received.append)
+    for position in range(100):
+        exporter.on_event("OmegaPosition", str(position), 0)
+    exporter.on_event("State", "Moving", 0)
+    exporter.on_event("State", "Ready", 0)
+    gevent.sleep(0.1)
+
+    # latest value wins, other events are not coalesced
+    assert received == [99, "Moving", "Ready"]
+    assert exporter.get_events_statistics() == {
+        "queued": 0,
+        "skipped": 0,
+        "merged": 99,
+    }
+
+
+def test_coalesced_events_max_rate():
+    exporter = Exporter("127.0.0.1", 0)
+    received = []
+
+    exporter.set_event_coalescing("OmegaPosition", max_rate=10)
+    exporter.register("OmegaPosition", received.append)
+    for position in range(50):
+        exporter.on_event("OmegaPosition", str(position), 0)
+        gevent.sleep(0.01)
+    gevent.sleep(0.2)
+
+    # about 10 Hz over 0.5 s, the last value being dispatched
+    assert 4 <= len(received) <= 7
+    assert received[-1] == 49
@@ -0,0 +1,169 @@
+"""Tests for the FrameBroker, with a fake camera"""
+
+import gevent
+import numpy
+import pytest
+
+from mxcubecore.HardwareObjects import sample_centring
+from mxcubecore.HardwareObjects.FrameBroker import FrameBroker
+from mxcubecore.utils.video_frame import VideoFrame
+
+
+class FakeCamera:
+    def __init__(self, width=16, height=12):
+        self.width = width
+        self.height = height
+        self.frame_number = 0
+        self.reads = 0
+        self._frame = None
+
+    def next_frame(self):
+        self.frame_number += 1
+
+    def get_frame(self):
+        self.reads += 1
+        if self._frame is None or self._frame.frame_number != self.frame_number:
+            pixels = numpy.full(
+                (self.height, self.width, 3), self.frame_number, numpy.uint8
+            )
+            self._frame = VideoFrame.from_image(
+                self.frame_number, pixels.tobytes(), self.width, self.height
+            )
+        return self._frame
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+
+class FakeSampleView:
+    def __init__(self, camera):
+        self.camera = camera
+
+
+class FakeImageCamera:
+    def __init__(self):
+        self.image = (bytes(4 * 3), 2, 2)
+
+    def get_last_image(self):
+        return self.image
+
+
+@pytest.fixture
+def broker():
+    broker = FrameBroker("frame-broker")
+    broker._camera = FakeCamera()
+    broker._interval = 0.001
+    yield broker
+    for subscription_id in list(broker._subscriptions):
+        broker.unsubscribe(subscription_id)
+
+
+def test_ring_buffer(broker):
+    for _ in range(12):
+        broker._camera.next_frame()
+        broker.grab()
+    # the same frame is kept once
+    broker.grab()
+
+    frames = broker.get_frames()
+    assert [frame.frame_number for frame in frames] == list(range(5, 13))
+    assert broker.get_frame() is frames[-1]
+
+
+def test_get_last_image_camera(broker):
+    broker._camera = FakeImageCamera()
+    frame = broker.grab()
+    assert frame.mode == "RGB"
+    assert broker.grab() is frame
+
+    broker._camera.image = (bytes(4 * 3), 2, 2)
+    assert broker.grab().frame_number == frame.frame_number + 1
+    assert len(broker.get_frames()) == 2
+
+
+def test_shared_conversions(broker):
+    received = []
+    for _ in range(5):
+        broker.subscribe(
+            lambda data, frame: received.append((data, frame)),
+            scale=0.5,
+            encoding="jpeg",
+        )
+    broker._camera.next_frame()
+    gevent.sleep(0.05)
+
+    assert len(received) == 5
+    frame = received[0][1]
+    assert all(data is received[0][0] for data, _ in received)
+    assert received[0][0][:2] == b"\xff\xd8"
+    # one resize and one encoding for the five consumers
+    assert frame.conversions == 2
+
+    # each consumer receives each frame once
+    gevent.sleep(0.05)
+    assert len(received) == 5
+
+
+def test_max_fps(broker):
+    fast, slow = [], []
+    broker.subscribe(lambda data, frame: fast.append(frame), encoding="raw")
+    broker.subscribe(lambda data, frame: slow.append(frame), 1, encoding="raw")
+    for _ in range(5):
+        broker._camera.next_frame()
+        gevent.sleep(0.02)
+
+    assert len(fast) == 5
+    assert len(slow) == 1
+
+
+def test_unsubscribe(broker):
+    subscription_id = broker.subscribe(lambda data, frame: None)
+    assert broker._polling is not None
+    broker.unsubscribe(subscription_id)
+    assert broker._polling is None
+
+    reads = broker._camera.reads
+    gevent.sleep(0.02)
+    assert broker._camera.reads == reads
+
+
+def test_video_consumers(broker):
+    broker._camera.next_frame()
+    frame = broker.grab()
+
+    # snapshots and loop detection read the broker as the camera
+    data, width, height = broker.get_last_image()
+    assert (width, height) == (broker.get_width(), broker.get_height()) == (16, 12)
+    assert data is frame.convert("rgb")
+    image = sample_centring.get_loop_image(FakeSampleView(broker))
+    assert image.shape == (12, 16)
+    assert image[0, 0] == 1
+
+    # the video display receives the frames while connected
+    images = []
+    broker.receiver = lambda *args: images.append(args)
+    broker.connect("imageReceived", broker.receiver)
+    broker._camera.next_frame()
+    gevent.sleep(0.05)
+    assert images[-1][1:] == (16, 12, False)
+    assert len(images[-1][0]) == 16 * 12 * 3
+
+    broker.disconnect("imageReceived", broker.receiver)
+    assert broker._polling is None
+
+
+def test_video_consumers_raw_frames(broker):
+    # frames of an unknown pixel format are passed as sent by the camera
+    frame = VideoFrame(1, 16, 12, bytes(range(192)))
+    broker._camera.get_frame = lambda: frame
+    assert broker.get_last_image() == (frame.tobytes(), 16, 12)
+
+    images = []
+    broker.receiver = lambda *args: images.append(args)
+    broker.connect("imageReceived", broker.receiver)
+    gevent.sleep(0.05)
+    assert images == [(frame.tobytes(), 16, 12, False)]
+    broker.disconnect("imageReceived", broker.receiver)
@@ -0,0 +1,132 @@
+"""Tests for the HardwareRepository loading"""
+
+import os
+
+import pytest
+
+from mxcubecore import HardwareRepository as HWR
+from mxcubecore.utils import config_cache
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+HWR_PATH = "%s%s%s" % (
+    os.path.join(ROOT_DIR, "mxcubecore/configuration/mockup"),
+    os.path.pathsep,
+    os.path.join(ROOT_DIR, "mxcubecore/configuration/mockup/test"),
+)
+
+
+@pytest.fixture(params=[1, 8], ids=["sequential", "concurrent"])
+def load_concurrency(request):
+    HWR._instance = HWR.beamline = None
+    yield request.param
+    HWR.LOAD_CONCURRENCY = 1
+
+
+def test_load_concurrency(load_concurrency):
+    HWR.init_hardware_repository(HWR_PATH, load_concurrency=load_concurrency)
+    hwr = HWR.get_hardware_repository()
+    beamline = HWR.beamline
+
+    assert HWR.LOAD_CONCURRENCY == load_concurrency
+    for role in ("session", "lims", "diffractometer", "energy", "transmission"):
+        assert getattr(beamline, role) is not None
+    # objects referenced by several ones are loaded once
+    assert not hwr._loading
+    loaded = [row[0] for row in hwr.hwobj_info_list if not row[3]]
+    assert len(loaded) == len(set(loaded))
+    assert beamline.diffractometer is hwr.get_hardware_object("/diffractometer-mockup")
+
+    # the graph of the loaded objects is built while loading them
+    assert "/session" in hwr.dependency_graph[HWR.BEAMLINE_CONFIG_FILE]
+    assert "/session" in hwr.dependency_graph
+
+    total, critical_path, elapsed = hwr.get_load_times()
+    assert elapsed > 0
+    if load_concurrency == 1:
+        assert 0 < critical_path <= total
+    else:
+        # the own load times overlap
+        assert total is critical_path is None
+
+
+def test_configuration_read_once(monkeypatch):
+    HWR._instance = HWR.beamline = None
+    opened = []
+    real_open = open
+
+    def counting_open(path, *args, **kwargs):
+        if str(path).endswith((".xml", ".yml", ".yaml")):
+            opened.append(path)
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr("builtins.open", counting_open)
+    HWR.init_hardware_repository(HWR_PATH)
+    monkeypatch.undo()
+
+    assert opened
+    assert len(opened) == len(set(opened))
+
+
+def test_dependency_graph():
+    HWR._instance = HWR.beamline = None
+    HWR.init_hardware_repository(HWR_PATH)
+
+    graph = HWR.get_dependency_graph()
+    assert "/session" in graph[HWR.BEAMLINE_CONFIG_FILE]
+    assert all(isinstance(deps, list) for deps in graph.values())
+
+    load_times = {HWR.BEAMLINE_CONFIG_FILE: 1, "a": 2, "b": 3, "c": 4}
+    graph = {HWR.BEAMLINE_CONFIG_FILE: ["a", "b"], "a": ["c"], "b": [], "c": ["a"]}
+    assert HWR.get_critical_path_time(graph, load_times) == 7
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    config_cache.set_cache_directory(str(tmp_path))
+    yield tmp_path
+    config_cache.set_cache_directory(None)
+
+
+def test_config_cache(cache_directory):
+    calls = []
+
+    def parse(text):
+        calls.append(text)
+        return {"text": text}
+
+    assert config_cache.cached("yaml", "/a.yml", "a: 1", parse) == {"text": "a: 1"}
+    assert config_cache.cached("yaml", "/a.yml", "a: 1", parse) == {"text": "a: 1"}
+    assert calls == ["a: 1"]
+    # changed contents invalidate the cache entry
+    assert config_cache.cached("yaml", "/a.yml", "a: 2", parse) == {"text": "a: 2"}
+    assert config_cache.cached("yaml", "/a.yml", "a: 2", parse) == {"text": "a: 2"}
+    assert calls == ["a: 1", "a: 2"]
+    assert len(list(cache_directory.iterdir())) == 1
+
+
+def test_config_cache_loading(cache_directory):
+    for _ in range(2):
+        HWR._instance = HWR.beamline = None
+        HWR.init_hardware_repository(HWR_PATH)
+        hwr = HWR.get_hardware_repository()
+
+        assert HWR.beamline.energy is not None
+        assert hwr.get_hardware_object("/session").get_property("beamline_name")
+    kinds = {path.name.split("-")[0] for path in cache_directory.iterdir()}
+    assert kinds == {"xml", "yaml"}
+
+
+def test_xml_events():
+    xml_string = (
+        '<object class="Session" role="x"><name>  ab&amp;c </name>'
+        '<object href="/energy" role="energy"/></object>'
+    )
+    events = config_cache.parse_xml_events(xml_string)
+
+    assert events[0] == (
+        config_cache.START_ELEMENT,
+        "object",
+        {"class": "Session", "role": "x"},
+    )
+    assert (config_cache.CHARACTERS, "  ab&c ") in events
+    assert events[-1] == (config_cache.END_ELEMENT, "object")
@@ -0,0 +1,143 @@
+"""Tests for the matching of the ISPyB samples with the sample changer ones"""
+
+import random
+
+import pytest
+from suds.sudsobject import Object
+
+from mxcubecore.HardwareObjects.ISPyBClient import (
+    ISPyBClient,
+    SampleReference,
+    SampleReferenceIndex,
+)
+
+
+def lims_sample(code, container_location, sample_location):
+    sample = Object()
+    sample.code = code
+    sample.containerSampleChangerLocation = container_location
+    sample.sampleLocation = sample_location
+    return sample
+
+
+def find_sample(sample_refs, code=None, location=None):
+    """Linear search, as done before the index"""
+    for sample_ref in sample_refs:
+        if code and location:
+            if (
+                sample_ref.code == code
+                and sample_ref.container_reference == location[0]
+                and sample_ref.sample_reference == location[1]
+            ):
+                return sample_ref
+        elif code:
+            if sample_ref.code == code:
+                return sample_ref
+        elif location:
+            if (
+                sample_ref.container_reference == location[0]
+                and sample_ref.sample_reference == location[1]
+            ):
+                return sample_ref
+    return None
+
+
+@pytest.fixture
+def lims():
+    client = ISPyBClient("lims")
+    client.get_session = lambda session_id: {}
+
+    class Service:
+        samples = []
+
+        def findSampleInfoLightForProposal(self, proposal_id, beamline_name):
+            return self.samples
+
+    class ToolsWebService:
+        service = Service()
+
+    client._tools_ws = ToolsWebService()
+    return client
+
+
+def test_index_matches_linear_search():
+    rng = random.Random(0)
+    sample_refs = [
+        SampleReference(
+            rng.choice(["", "DM%d" % rng.randrange(50)]),
+            rng.randrange(1, 6),
+            rng.randrange(1, 6),
+            "",
+        )
+        for _ in range(200)
+    ]
+    index = SampleReferenceIndex(sample_refs)
+    remaining = list(sample_refs)
+
+    for _ in range(300):
+        code = rng.choice([None, "", "DM%d" % rng.randrange(50)])
+        location = rng.choice([None, (rng.randrange(1, 6), rng.randrange(1, 6))])
+        expected = find_sample(remaining, code=code, location=location)
+        found = index.find(code=code, location=location)
+        assert found is expected
+        if found is not None:
+            remaining.remove(found)
+            index.remove(found)
+
+    assert list(index) == remaining
+    assert len(index) == len(remaining)
+    with pytest.raises(ValueError):
+        index.remove(None)
+
+
+def test_session_samples(lims):
+    lims._tools_ws.service.samples = [
+        # code and location match
+        lims_sample("DM1", "1", "1"),
+        # code mismatch: the sample changer code is used
+        lims_sample("OLD", "1", "2"),
+        # location only: the sample changer code is added
+        lims_sample("", "2", "1"),
+        # neither code nor location
+        lims_sample("", "", ""),
+    ]
+    sample_refs = [
+        ("DM1", 1, 1, ""),
+        ("DM2", 1, 2, ""),
+        ("DM3", 2, 1, ""),
+        ("DM4", 3, 1, ""),
+    ]
+
+    samples = lims.get_session_samples(1, 1, sample_refs)["loaded_sample"]
+
+    assert len(samples) == 5
+    assert [sample["code"] for sample in samples[:2]] == ["DM1", "DM2"]
+    assert samples[2]["sampleCode"] == "DM3"
+    # the unmatched sample changer samples are added
+    assert samples[-1] == {
+        "code": "DM4",
+        "location": 1,
+        "containerSampleChangerLocation": 3,
+    }
+
+
+def test_session_samples_large_proposal(lims):
+    """5000 ISPyB samples against a full dewar"""
+    sample_refs = [
+        ("DM-%d-%d" % (puck, vial), puck, vial, "")
+        for puck in range(1, 30)
+        for vial in range(1, 17)
+    ]
+    lims_samples = [
+        lims_sample("DM-%d-%d" % (puck, vial), str(puck), str(vial))
+        for puck, vial in [(p, v) for p in range(1, 30) for v in range(1, 17)]
+    ]
+    lims_samples += [lims_sample("", "", "") for _ in range(5000 - len(lims_samples))]
+    lims._tools_ws.service.samples = lims_samples
+
+    samples = lims.get_session_samples(1, 1, sample_refs)["loaded_sample"]
+
+    # all the sample changer samples are matched, none is added
+    assert len(samples) == 5000
+    assert samples[0]["code"] == "DM-1-1"
+    assert samples[463]["code"] == "DM-29-16"
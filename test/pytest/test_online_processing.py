@@ -0,0 +1,202 @@
+"""Tests for the alignment of the online processing results"""
+
+import threading
+
+import numpy as np
+import pytest
+from matplotlib.image import imread
+from scipy import ndimage
+
+from mxcubecore.HardwareObjects.abstract.AbstractOnlineProcessing import (
+    DEFAULT_RESULT_TYPES,
+    AbstractOnlineProcessing,
+)
+from mxcubecore.utils.results_store import ResultsStore
+
+
+class FakeGrid:
+    """Mesh of num_cols x num_rows, scanned in vertical zig-zag lines"""
+
+    def __init__(self, num_cols, num_rows, first_image_num=1):
+        self.num_cols = num_cols
+        self.num_rows = num_rows
+        self.first_image_num = first_image_num
+        self.score = None
+
+    def get_col_row_from_image_serial(self, image_serial):
+        line, image = divmod(image_serial - self.first_image_num, self.num_rows)
+        if line % 2:
+            image = self.num_rows - 1 - image
+        return line, image
+
+    def get_motor_pos_from_col_row(self, col, row):
+        return {"phiy": col * 0.01, "phiz": row * 0.01}
+
+    def set_score(self, score):
+        self.score = score
+
+
+def make_processing(grid, images_num):
+    processing = AbstractOnlineProcessing("online-processing")
+    processing.grid = grid
+    processing.result_types = DEFAULT_RESULT_TYPES
+    processing.params_dict = {
+        "first_image_num": 1,
+        "images_num": images_num,
+        "steps_x": grid.num_cols,
+        "steps_y": grid.num_rows,
+        "template": "/data/mesh_%d_%05d.cbf",
+        "run_number": 1,
+    }
+    processing.results_raw = {}
+    processing.results_aligned = {}
+    for result_type in DEFAULT_RESULT_TYPES:
+        processing.results_raw[result_type["key"]] = np.zeros(images_num)
+        processing.results_aligned[result_type["key"]] = np.zeros(
+            (grid.num_cols, grid.num_rows)
+        )
+    return processing
+
+
+def process_batch(processing, indexes, scores):
+    for key, values in processing.results_raw.items():
+        values[indexes] = scores if key == "score" else scores * 2
+    processing.align_processing_results(indexes[0], indexes[-1])
+
+
+@pytest.mark.parametrize("rescore", [False, True])
+def test_align_processing_results(rescore):
+    grid = FakeGrid(12, 7)
+    images_num = grid.num_cols * grid.num_rows
+    processing = make_processing(grid, images_num)
+    rng = np.random.default_rng(0)
+    scores = rng.integers(0, 50, images_num).astype(float)
+
+    for start in range(0, images_num, 9):
+        indexes = np.arange(start, min(start + 9, images_num))
+        process_batch(processing, indexes, scores[indexes])
+    if rescore:
+        # images processed again, the best ones getting worse
+        indexes = np.argsort(-scores, kind="stable")[:5]
+        indexes.sort()
+        scores[indexes] = 0
+        process_batch(processing, indexes, scores[indexes])
+
+    expected = np.zeros((grid.num_cols, grid.num_rows))
+    for index in range(images_num):
+        expected[grid.get_col_row_from_image_serial(index + 1)] = scores[index]
+    aligned = processing.results_aligned
+    assert np.array_equal(aligned["score"], expected)
+    assert np.array_equal(aligned["spots_num"], expected * 2)
+
+    center_x, center_y = ndimage.center_of_mass(expected)
+    assert aligned["center_mass"]["phiy"] == pytest.approx(center_x * 0.01)
+    assert aligned["center_mass"]["phiz"] == pytest.approx(center_y * 0.01)
+
+    best_indexes = np.argsort(-scores, kind="stable")[:10]
+    best_positions = aligned["best_positions"]
+    assert [position["index"] for position in best_positions] == list(best_indexes)
+    best = best_positions[0]
+    col, row = grid.get_col_row_from_image_serial(best["index"] + 1)
+    assert best["score"] == scores[best["index"]]
+    assert (best["col"], best["row"]) == (col + 0.5, grid.num_rows - row - 0.5)
+    assert best["filename"] == "mesh_1_%05d.cbf" % (best["index"] + 1)
+
+
+def test_align_no_diffraction():
+    grid = FakeGrid(4, 3)
+    processing = make_processing(grid, 12)
+    process_batch(processing, np.arange(12), np.zeros(12))
+
+    assert processing.results_aligned["best_positions"] == []
+    assert np.isnan(processing.results_aligned["center_mass"]["phiy"])
+
+
+def test_results_store(tmp_path):
+    grid = FakeGrid(4, 3)
+    processing = make_processing(grid, 12)
+    keys = list(processing.results_raw)
+    processing.results_store = ResultsStore.create(str(tmp_path), keys, 12)
+    scores = np.arange(12, dtype=float)
+
+    process_batch(processing, np.arange(0, 5), scores[0:5])
+
+    # readable while the processing runs
+    store = ResultsStore.open(str(tmp_path))
+    assert store.keys == keys
+    assert list(store.processed_indexes()) == [0, 1, 2, 3, 4]
+    assert list(store.get("score", processed_only=True)) == [0, 1, 2, 3, 4]
+
+    process_batch(processing, np.arange(5, 12), scores[5:12])
+    assert np.array_equal(store.get("score"), scores)
+    assert np.array_equal(store.get("spots_num"), scores * 2)
+
+    csv_path = tmp_path / "results.csv"
+    processing.results_store.write_csv(
+        str(csv_path),
+        ("score", "spots_num", "spots_resolution"),
+        ("%d", "%f", "%d", "%f"),
+        "header",
+    )
+    lines = csv_path.read_text().splitlines()
+    assert lines[0] == "header"
+    assert lines[1:] == [
+        "%d,%f,%d,%f" % (index, score, score * 2, score * 2)
+        for index, score in enumerate(scores)
+    ]
+
+
+@pytest.mark.parametrize("lines_num", [1, 4])
+def test_save_results_files(tmp_path, monkeypatch, lines_num):
+    grid = FakeGrid(lines_num, 12 // lines_num)
+    grid.set_overlay_pixmap = lambda path: setattr(grid, "overlay", path)
+    processing = make_processing(grid, 12)
+    params_dict = dict(
+        processing.params_dict,
+        lines_num=lines_num,
+        xOffset=0.01,
+        yOffset=0.01,
+        archive_directory=str(tmp_path / "archive"),
+        cartography_path=str(tmp_path / "process" / "plot.png"),
+        html_file_path=str(tmp_path / "process" / "index.html"),
+        json_file_path=str(tmp_path / "process" / "report.json"),
+        csv_file_path=str(tmp_path / "process" / "results.csv"),
+    )
+    store = ResultsStore.create(
+        str(tmp_path / "store"), list(processing.results_raw), 12
+    )
+    processing.results_store = store
+    process_batch(processing, np.arange(12), np.arange(12, dtype=float))
+    expected_overlay = str(tmp_path / "expected.png")
+    processing.save_grid_overlay(expected_overlay, processing.results_aligned["score"])
+
+    # the plots are saved in threads
+    threads = []
+
+    def recorded(func):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return func(*args)
+
+        return wrapper
+
+    for name in ("save_grid_overlay", "save_results_plot"):
+        monkeypatch.setattr(processing, name, recorded(getattr(processing, name)))
+
+    # the plots are made from the store, not from the results in memory
+    results_raw = {key: np.zeros(12) for key in processing.results_raw}
+    processing.save_results_files(
+        params_dict,
+        results_raw,
+        processing.results_aligned,
+        store,
+        processing.get_alignment(),
+        grid,
+    )
+
+    assert (tmp_path / "process" / "plot.png").exists()
+    assert len(threads) == (2 if lines_num > 1 else 1)
+    assert threading.get_ident() not in threads
+    if lines_num > 1:
+        assert grid.overlay == str(tmp_path / "archive" / "grid_overlay.png")
+        assert np.array_equal(imread(grid.overlay), imread(expected_overlay))
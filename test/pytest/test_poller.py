@@ -0,0 +1,208 @@
+"""Tests for the Poller module"""
+
+import gevent
+import numpy
+import pytest
+
+from mxcubecore import Poller
+
+
+class PolledDevice:
+    """Polled call returning successive values, and the poller callbacks"""
+
+    def __init__(self, values=None):
+        self.calls = 0
+        self.values = values
+        self.received = []
+        self.errors = []
+
+    def read(self, *args):
+        self.calls += 1
+        if self.values is None:
+            return self.calls
+        return self.values[min(self.calls, len(self.values)) - 1]
+
+    def fail(self):
+        raise RuntimeError("polling error")
+
+    def value_changed(self, value):
+        self.received.append(value)
+
+    def polling_error(self, exception, poller_id):
+        self.errors.append((exception, poller_id))
+
+    def poll(self, polled_call=None, polling_period=10):
+        return Poller.poll(
+            polled_call or self.read,
+            polling_period=polling_period,
+            value_changed_callback=self.value_changed,
+            error_callback=self.polling_error,
+        )
+
+
+@pytest.fixture(params=["thread", "scheduler"])
+def engine(request):
+    Poller.set_engine(request.param)
+    yield request.param
+    for poller in list(Poller.POLLERS.values()):
+        poller.stop()
+    Poller.set_engine("thread")
+
+
+def test_poll_value_changed(engine):
+    device = PolledDevice()
+
+    poller = device.poll()
+    gevent.sleep(0.3)
+    poller.stop()
+
+    assert Poller.get_engine() == engine
+    assert len(device.received) > 3
+    assert device.received == sorted(device.received)
+
+
+def test_poll_compare(engine):
+    device = PolledDevice([1, 1, 2, 2, 2, 3])
+
+    poller = device.poll()
+    gevent.sleep(0.3)
+    poller.stop()
+
+    assert device.received == [1, 2, 3]
+
+
+def test_poll_error(engine):
+    device = PolledDevice()
+
+    poller = device.poll(device.fail)
+    gevent.sleep(0.1)
+
+    assert len(device.errors) == 1
+    assert isinstance(device.errors[0][0], RuntimeError)
+    assert device.errors[0][1] == poller.get_id()
+    assert device.received == []
+
+
+def test_poll_deduplication(engine):
+    device = PolledDevice()
+
+    poller = device.poll(polling_period=100)
+    assert device.poll(polling_period=50) is poller
+    assert poller.get_polling_period() == 50
+    assert Poller.get_poller(poller.get_id()) is poller
+
+
+def test_poll_deduplication_index(engine):
+    device, other_device = PolledDevice(), PolledDevice()
+
+    poller = device.poll(polling_period=100)
+    other_poller = other_device.poll(polling_period=100)
+    args_poller = Poller.poll(
+        device.read, (1,), 100, device.value_changed, device.polling_error
+    )
+
+    assert len({poller, other_poller, args_poller}) == 3
+    assert (
+        Poller.poll(device.read, (1,), 100, device.value_changed, device.polling_error)
+        is args_poller
+    )
+
+    poller.stop()
+    new_poller = device.poll(polling_period=100)
+    assert new_poller is not poller
+    assert device.poll(polling_period=100) is new_poller
+
+
+def test_poll_restart(engine):
+    device = PolledDevice([1, 1, 2])
+
+    poller = device.poll()
+    gevent.sleep(0.1)
+    new_poller = poller.restart()
+    gevent.sleep(0.1)
+
+    assert poller.is_stopped()
+    assert new_poller is not poller
+    assert device.received == [1, 2]
+
+
+def test_scheduler_thread_count():
+    devices = [PolledDevice() for _ in range(20)]
+
+    Poller.set_engine("scheduler", workers=2)
+    try:
+        thread_count = Poller.get_thread_count()
+        pollers = [device.poll(polling_period=20) for device in devices]
+        gevent.sleep(0.2)
+
+        assert Poller.get_thread_count() == thread_count
+        assert all(device.calls > 1 for device in devices)
+        for poller in pollers:
+            last, maximum = poller.get_lateness()
+            assert 0 <= last <= maximum
+            poller.stop()
+    finally:
+        Poller.set_engine("thread")
+
+
+def test_values_equal():
+    assert Poller.values_equal(1.0, 1.0)
+    assert not Poller.values_equal(1.0, Poller.NotInitializedValue)
+    assert Poller.values_equal(numpy.arange(4), numpy.arange(4))
+    assert not Poller.values_equal(numpy.arange(4), numpy.arange(5))
+    assert not Poller.values_equal(numpy.arange(4), Poller.NotInitializedValue)
+
+
+def test_deadband_comparison():
+    absolute = Poller.get_comparison(deadband=0.1)
+    assert absolute(1.05, 1.0)
+    assert not absolute(1.2, 1.0)
+    assert absolute(numpy.array([1.0, 2.05]), numpy.array([1.0, 2.0]))
+    assert not absolute(numpy.array([1.0, 2.0]), numpy.array([1.0, 2.0, 3.0]))
+    assert not absolute("ON", "OFF")
+    assert not absolute(1.0, Poller.NotInitializedValue)
+    assert not absolute(None, 1.0)
+    assert not absolute(1.0, None)
+    assert absolute(None, None)
+    assert not absolute("1.0", 1.0)
+
+    relative = Poller.get_comparison(deadband="1%")
+    assert relative(100.5, 100.0)
+    assert not relative(102.0, 100.0)
+
+
+def test_hash_comparison():
+    comparison = Poller.get_comparison("hash")
+    value = numpy.arange(10000)
+
+    assert not comparison(value, Poller.NotInitializedValue)
+    assert comparison(value.copy(), value)
+    assert not comparison(value.reshape(100, 100), value)
+    assert not comparison(value.astype(float), value)
+
+    # compared with the previous value given, not the last one reported
+    other = numpy.zeros(10000)
+    assert not comparison(value, other)
+    assert not comparison(value, other)
+    assert not comparison(value, Poller.NotInitializedValue)
+    assert comparison(value.copy(), value)
+    assert Poller.get_comparison() is True
+
+    with pytest.raises(ValueError):
+        Poller.get_comparison("unknown")
+
+
+def test_poll_deadband(engine):
+    device = PolledDevice([1.0, 1.01, 0.99, 1.05, 2.0, 2.08])
+
+    poller = Poller.poll(
+        device.read,
+        polling_period=10,
+        value_changed_callback=device.value_changed,
+        error_callback=device.polling_error,
+        compare=Poller.get_comparison(deadband=0.1),
+    )
+    gevent.sleep(0.3)
+    poller.stop()
+
+    assert device.received == [1.0, 2.0]
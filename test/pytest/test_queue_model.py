@@ -0,0 +1,102 @@
+"""Tests for the QueueModel and QueueManager node and entry lookups"""
+
+from mxcubecore.HardwareObjects.QueueManager import QueueManager
+from mxcubecore.HardwareObjects.QueueModel import QueueModel
+from mxcubecore.model import queue_model_objects
+from mxcubecore.queue_entry.base_queue_entry import BaseQueueEntry
+
+
+def make_queue(queue_model, sample_count=3, task_count=2):
+    root = queue_model.get_model_root()
+    samples = []
+    for _ in range(sample_count):
+        sample = queue_model_objects.Sample()
+        queue_model.add_child(root, sample)
+        group = queue_model_objects.TaskGroup()
+        queue_model.add_child(sample, group)
+        for _ in range(task_count):
+            queue_model.add_child(group, queue_model_objects.TaskNode())
+        samples.append(sample)
+    return samples
+
+
+def test_get_node():
+    queue_model = QueueModel("queue-model")
+    samples = make_queue(queue_model)
+    group = samples[1].get_children()[0]
+    task = group.get_children()[1]
+
+    assert queue_model.get_node(task._node_id) is task
+    assert queue_model.get_node(task._node_id, parent=group) is task
+    assert queue_model.get_node(task._node_id, parent=samples[0]) is None
+    assert queue_model.get_node(12345) is None
+
+    # removed nodes, and their children, are not found any more
+    queue_model.del_child(samples[1], group)
+    assert queue_model.get_node(group._node_id) is None
+    assert queue_model.get_node(task._node_id) is None
+
+    # moved nodes are found under their new parent
+    other_group = samples[2].get_children()[0]
+    queue_model.set_parent(samples[0], other_group)
+    assert other_group in samples[0].get_children()
+    assert other_group not in samples[2].get_children()
+    assert queue_model.get_node(other_group._node_id, parent=samples[0]) is other_group
+    assert queue_model.get_node(other_group._node_id, parent=samples[2]) is None
+
+
+def test_get_node_not_indexed():
+    queue_model = QueueModel("queue-model")
+    samples = make_queue(queue_model)
+    group = samples[0].get_children()[0]
+    # node added without the queue model
+    task = queue_model_objects.TaskNode()
+    task._node_id = 1000
+    group._children.append(task)
+    task._parent = group
+
+    assert queue_model.get_node(1000) is task
+    assert queue_model.get_node(1000) is task
+
+
+def test_get_entry_with_model():
+    queue_manager = QueueManager("queue")
+    models = [queue_model_objects.TaskNode() for _ in range(4)]
+    entries = [BaseQueueEntry(data_model=model) for model in models]
+
+    queue_manager.enqueue(entries[0])
+    entries[0].enqueue(entries[1])
+    queue_manager.enqueue(entries[2])
+    entries[2].enqueue(entries[3])
+
+    for model, entry in zip(models, entries):
+        assert queue_manager.get_entry_with_model(model) is entry
+    assert queue_manager.get_entry_with_model(models[1], entries[2]) is None
+    assert queue_manager.get_entry_with_model(queue_model_objects.TaskNode()) is None
+
+    queue_manager.dequeue(entries[2])
+    assert queue_manager.get_entry_with_model(models[2]) is None
+    queue_manager.clear()
+    assert queue_manager.get_entry_with_model(models[0]) is None
+
+
+def test_entry_index():
+    queue_manager = QueueManager("queue")
+    models = [queue_model_objects.TaskNode() for _ in range(4)]
+    entries = [BaseQueueEntry(data_model=model) for model in models]
+
+    # child entries are indexed when enqueued, before or after their parent
+    entries[1].enqueue(entries[2])
+    entries[0].enqueue(entries[1])
+    queue_manager.enqueue(entries[0])
+    entries[2].enqueue(entries[3])
+    assert queue_manager._entry_index == {
+        id(model): entry for model, entry in zip(models, entries)
+    }
+    assert entries[3].get_queue_controller() is queue_manager
+
+    # and removed when dequeued
+    entries[0].dequeue(entries[1])
+    assert queue_manager._entry_index == {id(models[0]): entries[0]}
+    assert queue_manager.get_entry_with_model(models[3]) is None
+    assert queue_manager._entry_index == {id(models[0]): entries[0]}
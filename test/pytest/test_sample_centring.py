@@ -0,0 +1,180 @@
+"""Tests for the automatic centring, with a fake lucid, camera and motors"""
+
+import gevent
+import gevent.event
+import numpy
+import pytest
+
+from mxcubecore.HardwareObjects import sample_centring
+
+
+class FakeMotor:
+    def __init__(self, value=0.0, move_time=0.01):
+        self.value = value
+        self.move_time = move_time
+        self._ready_event = gevent.event.Event()
+        self._ready_event.set()
+
+    def get_value(self):
+        return self.value
+
+    def is_ready(self):
+        return self._ready_event.is_set()
+
+    def wait_ready(self, timeout=None):
+        self._ready_event.wait(timeout)
+
+    def set_value(self, value, timeout=0):
+        def move():
+            gevent.sleep(self.move_time)
+            self.value = value
+            self._ready_event.set()
+
+        self._ready_event.clear()
+        gevent.spawn(move)
+        if timeout != 0:
+            self.wait_ready(timeout)
+
+    def set_value_relative(self, relative_value, timeout=0):
+        self.set_value(self.value + relative_value, timeout)
+
+
+class FakeCamera:
+    def __init__(self, phi, width=64, height=48):
+        self.phi = phi
+        self.width = width
+        self.height = height
+        # phi position and state of each image
+        self.images = []
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def get_last_image(self):
+        self.images.append((self.phi.get_value(), self.phi.is_ready()))
+        pixels = numpy.full((self.height, self.width, 3), 128, numpy.uint8)
+        return pixels.tobytes(), self.width, self.height
+
+
+class FakeSampleView:
+    def __init__(self, camera):
+        self.camera = camera
+
+    def save_snapshot(self, path, overlay=None, bw=False):
+        raise AssertionError("No snapshot file expected")
+
+
+class FakeLucid:
+    def __init__(self, loop_visible=True):
+        self.loop_visible = loop_visible
+        self.images = []
+
+    def find_loop(self, image, rotation=None, debug=False, IterationClosing=6):
+        self.images.append(image)
+        if self.loop_visible:
+            return "Coord", 40, 20
+        return "No loop detected", -1, -1
+
+
+@pytest.fixture
+def centring(monkeypatch):
+    lucid = FakeLucid()
+    monkeypatch.setattr(sample_centring, "lucid", lucid, raising=False)
+    motors = {
+        name: sample_centring.CentringMotor(FakeMotor())
+        for name in ("phi", "phiy", "phiz", "sampx", "sampy")
+    }
+    sample_view = FakeSampleView(FakeCamera(motors["phi"]))
+    return lucid, motors, sample_view
+
+
+def test_auto_center(centring):
+    lucid, motors, sample_view = centring
+
+    greenlet = sample_centring.start_auto(
+        sample_view, motors, 1000, 1000, 32, 24, n_points=3
+    )
+    centred_pos = greenlet.get(timeout=5)
+    assert centred_pos is not None
+
+    # the images go to lucid in memory, as grayscale arrays
+    assert len(lucid.images) == 4
+    for image in lucid.images:
+        assert isinstance(image, numpy.ndarray)
+        assert image.shape == (48, 64)
+        assert image.dtype == numpy.uint8
+
+    # each image is acquired once phi stopped rotating, the image of the
+    # loop search being the first one of the centring
+    assert sample_view.camera.images == [(0.0, True), (90.0, True), (180.0, True)]
+
+    search, round_1 = sample_centring.ROUND_TIMES
+    assert search.images == 1
+    assert round_1.images == 3
+    assert round_1.total >= round_1.acquisition + round_1.detection
+
+
+def test_auto_center_no_loop(centring):
+    lucid, motors, sample_view = centring
+    lucid.loop_visible = False
+    messages = []
+
+    greenlet = sample_centring.start_auto(
+        sample_view, motors, 1000, 1000, 32, 24, msg_cb=messages.append
+    )
+    assert greenlet.get(timeout=5) is None
+    assert messages[-1] == "No loop detected, aborting"
+    assert [phi for phi, _ in sample_view.camera.images] == [0, 90, 180, 270, 360]
+    assert all(ready for _, ready in sample_view.camera.images)
+
+
+def test_snapshot_file(centring, monkeypatch, tmp_path):
+    _, _, sample_view = centring
+    monkeypatch.setattr(sample_centring, "IN_MEMORY_LOOP_DETECTION", False)
+    monkeypatch.setattr(sample_centring.tempfile, "gettempdir", lambda: str(tmp_path))
+    saved = []
+    sample_view.save_snapshot = lambda path, overlay=None, bw=False: saved.append(path)
+
+    assert sample_centring.get_loop_image(sample_view) == saved[0]
+
+
+def test_auto_center_rounds(centring, monkeypatch):
+    lucid, motors, sample_view = centring
+    monkeypatch.setattr(sample_centring, "NUM_CENTRING_ROUNDS", 2)
+    moves = []
+    end = sample_centring.end
+    monkeypatch.setattr(
+        sample_centring,
+        "end",
+        lambda centred_pos=None: moves.append(len(sample_view.camera.images))
+        or end(centred_pos),
+    )
+
+    greenlet = sample_centring.start_auto(
+        sample_view, motors, 1000, 1000, 32, 24, n_points=3
+    )
+    assert greenlet.get(timeout=5) is not None
+
+    # the first image of the second round is acquired once the sample is
+    # at the centred position of the first round, no image is left over
+    assert moves == [3, 6]
+    assert len(sample_view.camera.images) == 6
+    assert len(lucid.images) == 7
+    assert all(ready for _, ready in sample_view.camera.images)
+
+
+def test_frame_not_converted(centring, monkeypatch, tmp_path):
+    _, _, sample_view = centring
+    monkeypatch.setattr(sample_centring.tempfile, "gettempdir", lambda: str(tmp_path))
+    saved = []
+    sample_view.save_snapshot = lambda path, overlay=None, bw=False: saved.append(path)
+
+    class Frame:
+        def convert(self, encoding):
+            raise ValueError("Frame 1 cannot be converted")
+
+    sample_view.camera.get_frame = lambda: Frame()
+    assert sample_centring.get_loop_image(sample_view) == saved[0]
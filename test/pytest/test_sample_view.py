@@ -25,7 +25,18 @@ from __future__ import (
     unicode_literals,
 )
 
+import base64
+import math
+from io import BytesIO
+
+import gevent
+import numpy as np
 import pytest
+from PIL import Image
+
+from mxcubecore import HardwareRepository as HWR
+from mxcubecore.HardwareObjects.GenericDiffractometer import GenericDiffractometer
+from mxcubecore.HardwareObjects.SampleView import combine_images
 
 __copyright__ = """ Copyright © 2010 - 2020 by MXCuBE Collaboration """
 __license__ = "LGPLv3+"
@@ -137,3 +148,162 @@ def test_sample_view_select_shape(sample_view):
 
     sample_view.de_select_all()
     assert len(sample_view.get_selected_shapes()) == 0
+
+
+class FakeCamera:
+    def __init__(self, width, height):
+        self.image = Image.new("RGB", (width, height), (10, 120, 30))
+
+    def get_last_image(self):
+        return self.image.tobytes(), self.image.width, self.image.height
+
+
+def make_overlay(width, height, mode="RGB"):
+    overlay = Image.new(mode, (width, height))
+    pixels = overlay.load()
+    for x in range(width):
+        for y in range(height):
+            color = ((x * 37) % 256, (y * 53) % 256, ((x + y) * 17) % 256)
+            pixels[x, y] = color + ((x * y * 7) % 256,) if mode == "RGBA" else color
+    return overlay
+
+
+def test_combine_images():
+    img = Image.new("RGB", (40, 30), (1, 2, 3))
+    overlay = make_overlay(40, 30)
+
+    combined = combine_images(img, overlay).load()
+    pixels = overlay.load()
+    for x in range(40):
+        for y in range(30):
+            red, green, blue = pixels[x, y]
+            visible = red > 200 or green > 60 or blue > 140
+            assert combined[x, y] == (pixels[x, y] if visible else (1, 2, 3))
+
+    with pytest.raises(ValueError):
+        combine_images(img, make_overlay(20, 30))
+
+
+def test_combine_images_alpha():
+    img = Image.new("RGB", (40, 30), (0, 0, 0))
+    overlay = make_overlay(40, 30, "RGBA")
+
+    combined = np.asarray(combine_images(img, overlay), dtype=float)
+    rgba = np.asarray(overlay, dtype=float)
+    rgb, alpha = rgba[..., :3], rgba[..., 3:] / 255
+    visible = (rgba[..., 0] > 200) | (rgba[..., 1] > 60) | (rgba[..., 2] > 140)
+    expected = np.where(visible[..., np.newaxis], rgb * alpha, 0)
+    assert np.abs(combined - expected).max() <= 0.5
+
+
+def test_take_snapshot_overlay(sample_view):
+    sample_view._camera = FakeCamera(64, 48)
+    buffer = BytesIO()
+    make_overlay(32, 24).save(buffer, format="PNG")
+    overlay_data = base64.b64encode(buffer.getvalue())
+
+    snapshot = sample_view.take_snapshot(overlay_data=overlay_data)
+    assert snapshot.size == (64, 48)
+    layer = sample_view._overlay_cache[2]
+
+    # the overlay is decoded once for several snapshots
+    assert sample_view.take_snapshot(overlay_data=overlay_data) == snapshot
+    assert sample_view._overlay_cache[2] is layer
+    assert sample_view.take_snapshot().getpixel((0, 0)) == (10, 120, 30)
+
+
+def test_update_shape_positions(sample_view):
+    emitted = []
+
+    def shapes_changed():
+        emitted.append(1)
+
+    sample_view.connect("shapesChanged", shapes_changed)
+    sample_view.shapes_update_interval = 0.05
+    sample_view._shapes_updated_at = 0
+    x, y = HWR.beamline.diffractometer.last_centred_position[:2]
+
+    for _ in range(10):
+        sample_view._update_shape_positions()
+    assert len(emitted) == 1
+    assert sample_view.get_points()[0].screen_coord == (x, y)
+    assert sample_view.get_lines()[0].screen_coord == (x, y, x, y)
+
+    # the updates asked for in the interval are done once, at its end
+    gevent.sleep(0.1)
+    assert len(emitted) == 2
+
+
+class FakeCentringMotor:
+    def __init__(self, value, direction=1):
+        self.value = value
+        self.direction = direction
+
+    def get_value(self):
+        return self.value
+
+
+def motor_position_to_screen(diffractometer, centred_positions_dict):
+    """Projection of a single centred position, as done before"""
+    phi_angle = math.radians(
+        diffractometer.centring_phi.direction * diffractometer.centring_phi.get_value()
+    )
+    deltas = [
+        motor.direction * (centred_positions_dict[name] - motor.get_value())
+        for name, motor in (
+            ("sampx", diffractometer.centring_sampx),
+            ("sampy", diffractometer.centring_sampy),
+            ("phiy", diffractometer.centring_phiy),
+            ("phiz", diffractometer.centring_phiz),
+        )
+    ]
+    sampx, sampy, phiy, phiz = deltas
+    rot_matrix = np.matrix(
+        [
+            math.cos(phi_angle),
+            -math.sin(phi_angle),
+            math.sin(phi_angle),
+            math.cos(phi_angle),
+        ]
+    )
+    rot_matrix.shape = (2, 2)
+    inv_rot_matrix = np.array(rot_matrix.I)
+    dx, dy = (
+        np.dot(np.array([sampx, sampy]), inv_rot_matrix)
+        * diffractometer.pixels_per_mm_x
+    )
+    x = (phiy * diffractometer.pixels_per_mm_x) + diffractometer.beam_position[0]
+    y = dy + (phiz * diffractometer.pixels_per_mm_y) + diffractometer.beam_position[1]
+    return x, y
+
+
+def test_motor_positions_list_to_screen():
+    diffractometer = GenericDiffractometer("diffractometer")
+    diffractometer.use_sample_centring = True
+    diffractometer.update_zoom_calibration = lambda: None
+    diffractometer.pixels_per_mm_x = 520.0
+    diffractometer.pixels_per_mm_y = 530.0
+    diffractometer.beam_position = (640, 512)
+    diffractometer.centring_phi = FakeCentringMotor(37.5, -1)
+    diffractometer.centring_sampx = FakeCentringMotor(0.12)
+    diffractometer.centring_sampy = FakeCentringMotor(-0.3, -1)
+    diffractometer.centring_phiy = FakeCentringMotor(0.05)
+    diffractometer.centring_phiz = FakeCentringMotor(0.2, -1)
+
+    rng = np.random.default_rng(0)
+    positions = [
+        dict(zip(("sampx", "sampy", "phiy", "phiz"), values))
+        for values in rng.uniform(-1, 1, (50, 4))
+    ]
+    expected = [motor_position_to_screen(diffractometer, pos) for pos in positions]
+
+    screen_positions = diffractometer.motor_positions_list_to_screen(positions)
+    assert screen_positions.shape == (50, 2)
+    assert np.allclose(screen_positions, expected)
+    assert np.allclose(
+        diffractometer.motor_positions_to_screen(positions[0]), expected[0]
+    )
+
+    # the calibration is not known
+    diffractometer.pixels_per_mm_x = None
+    assert not diffractometer.motor_positions_list_to_screen(positions).any()
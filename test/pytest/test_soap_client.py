@@ -0,0 +1,118 @@
+"""Tests for the shared suds clients and their pooled transport"""
+
+import os
+
+import pytest
+import suds
+from suds.transport import (
+    Request,
+    TransportError,
+)
+
+from mxcubecore.utils import soap_client
+from mxcubecore.utils.soap_client import (
+    ClientRegistry,
+    PooledTransport,
+    WebServiceTimings,
+    get_wsdl_cache,
+)
+
+ENVELOPE = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/">'
+    b"<SOAP-ENV:Header/><ns0:Body>"
+    b"<ns1:storeOrUpdateWorkflow><arg0>1</arg0></ns1:storeOrUpdateWorkflow>"
+    b"</ns0:Body></SOAP-ENV:Envelope>"
+)
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, content=b"<reply/>"):
+        self.status_code = status_code
+        self.reason = "reason %d" % status_code
+        self.content = content
+        self.headers = {"Content-Type": "text/xml"}
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    transport = PooledTransport(timings=WebServiceTimings())
+    transport.requests = []
+
+    def request(method, url, **kwargs):
+        transport.requests.append((method, url, kwargs))
+        return transport.response
+
+    transport.response = FakeResponse()
+    monkeypatch.setattr(transport.session, "request", request)
+    return transport
+
+
+def test_registry_reuses_clients(monkeypatch):
+    created = []
+
+    def client(url, **options):
+        created.append((url, options))
+        return object()
+
+    monkeypatch.setattr(soap_client, "Client", client)
+    registry = ClientRegistry()
+    registry.options = {"cache": None, "timeout": 3}
+
+    first = registry.get("http://ws/A?wsdl")
+    assert registry.get("http://ws/A?wsdl") is first
+    assert registry.get("http://ws/B?wsdl") is not first
+    assert created[0] == ("http://ws/A?wsdl", {"cache": None, "timeout": 3})
+    assert len(created) == 2
+
+    registry.clear()
+    assert registry.get("http://ws/A?wsdl") is not first
+    assert len(created) == 3
+
+
+def test_wsdl_cache_is_versioned(tmp_path):
+    assert get_wsdl_cache(None, "http://ws/") is None
+
+    cache = get_wsdl_cache(str(tmp_path), "http://ws/")
+    other = get_wsdl_cache(str(tmp_path), "http://other-ws/")
+    assert os.path.dirname(cache.location) == str(tmp_path)
+    assert suds.__version__ in os.path.basename(cache.location)
+    assert cache.location != other.location
+
+
+def test_send_times_methods(transport):
+    request = Request("http://ws/collection", ENVELOPE)
+    for _ in range(3):
+        reply = transport.send(request)
+
+    assert reply.code == 200
+    assert reply.message == b"<reply/>"
+    assert transport.requests[0][0] == "POST"
+    assert transport.requests[0][2]["data"] == ENVELOPE
+    calls, total, longest = transport.timings.get()["storeOrUpdateWorkflow"]
+    assert calls == 3
+    assert 0 <= longest <= total
+    assert "storeOrUpdateWorkflow" in str(transport.timings)
+
+
+def test_send_errors(transport):
+    transport.response = FakeResponse(500, b"<fault/>")
+    with pytest.raises(TransportError) as error:
+        transport.send(Request("http://ws/collection", ENVELOPE))
+    assert error.value.httpcode == 500
+    assert error.value.fp.read() == b"<fault/>"
+    # failed calls are timed too
+    assert transport.timings.get()["storeOrUpdateWorkflow"][0] == 1
+
+    transport.response = FakeResponse(202, b"")
+    with pytest.raises(TransportError) as error:
+        transport.send(Request("http://ws/collection", ENVELOPE))
+    assert error.value.httpcode == 202
+
+
+def test_open_and_copy(transport):
+    transport.response = FakeResponse(content=b"<definitions/>")
+    assert transport.open(Request("http://ws/A?wsdl")).read() == b"<definitions/>"
+    assert transport.requests[-1][0] == "GET"
+    # suds clones the transport with the client: the clones share the pool
+    assert transport.__deepcopy__({}) is transport
@@ -0,0 +1,291 @@
+"""Tests for the Tango channels and commands, with a fake PyTango device"""
+
+import gc
+
+import gevent
+import numpy
+import PyTango
+import pytest
+
+from mxcubecore.Command import Tango
+from mxcubecore.Command.Tango import (
+    TangoChannel,
+    TangoCommand,
+)
+from mxcubecore.CommandContainer import ConnectionError
+
+
+class FakeAttributeInfo:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeDeviceAttribute:
+    def __init__(self, name, value, has_failed=False):
+        self.name = name
+        self.value = value
+        self.has_failed = has_failed
+
+    def get_err_stack(self):
+        return ()
+
+
+class FakeDeviceProxy:
+    """Device proxy counting the network calls"""
+
+    instances = []
+    running = True
+
+    def __init__(self, device_name):
+        self.device_name = device_name
+        self.attributes = {
+            "State": "ON",
+            "Position": 1.5,
+            "Status": "ready",
+            "Spectrum": numpy.arange(4096, dtype=numpy.float64),
+        }
+        self.timeout = 3000
+        self.calls = []
+        FakeDeviceProxy.instances.append(self)
+
+    def ping(self):
+        self.calls.append("ping")
+        if not FakeDeviceProxy.running:
+            raise PyTango.ConnectionFailed()
+        return 100
+
+    def set_timeout_millis(self, timeout):
+        self.timeout = timeout
+
+    def attribute_list_query(self):
+        self.calls.append("attribute_list_query")
+        return [FakeAttributeInfo(name) for name in self.attributes]
+
+    def _value(self, name):
+        # Tango attribute names are case insensitive
+        for attr_name, value in self.attributes.items():
+            if attr_name.lower() == name.lower():
+                return value
+        raise PyTango.DevFailed()
+
+    def read_attribute(self, name, *args):
+        self.calls.append(("read_attribute", name))
+        return FakeDeviceAttribute(name, self._value(name))
+
+    def write_attribute(self, name, value):
+        self.calls.append(("write_attribute", name))
+        for attr_name in self.attributes:
+            if attr_name.lower() == name.lower():
+                self.attributes[attr_name] = value
+
+    def read_attributes(self, names, *args):
+        # an unknown attribute fails the whole call
+        self.calls.append(("read_attributes", tuple(names)))
+        return [FakeDeviceAttribute(name, self._value(name)) for name in names]
+
+    def on(self):
+        self.calls.append("on")
+        return True
+
+
+@pytest.fixture
+def proxies(monkeypatch):
+    monkeypatch.setattr(Tango, "DeviceProxy", FakeDeviceProxy)
+    FakeDeviceProxy.instances = []
+    FakeDeviceProxy.running = True
+    Tango.clear_device_proxies()
+    yield FakeDeviceProxy.instances
+    for device_poller in list(Tango._DevicePoller._device_pollers.values()):
+        device_poller.poller.stop()
+    Tango._DevicePoller._device_pollers.clear()
+    Tango.clear_device_proxies()
+
+
+def connect_updates(channels, updates):
+    # the signal receivers are weak references: kept by the channel
+    for channel in channels:
+        channel.receiver = lambda value, name=channel.name(): updates.append(
+            (name, value)
+        )
+        channel.connect_signal("update", channel.receiver)
+
+
+def wait_until(condition, timeout=2):
+    with gevent.Timeout(timeout):
+        while not condition():
+            gevent.sleep(0.01)
+
+
+def test_channels_share_proxy(proxies):
+    channels = [
+        TangoChannel("chan%d" % index, name, tangoname="bl/mot/1")
+        for index, name in enumerate(["State", "position", "Status"] * 5)
+    ]
+
+    assert len(proxies) == 1
+    assert all(channel.device is proxies[0] for channel in channels)
+    # one ping and one attribute query for the 15 channels
+    assert proxies[0].calls == ["ping", "attribute_list_query"]
+    assert proxies[0].timeout == 10000
+    assert channels[1].get_value() == 1.5
+
+    # commands use the PyTango default timeout
+    command = TangoCommand("on", "on", tangoname="BL/MOT/1")
+    command.init_device()
+    assert command() is True
+    assert len(proxies) == 2
+    assert proxies[1].timeout == 3000
+
+    command.set_device_timeout(10000)
+    assert command.device is proxies[0]
+
+
+def test_missing_attribute(proxies):
+    channel = TangoChannel("chan", "Velocity", tangoname="bl/mot/1")
+    assert channel.device is None
+    assert not channel.is_connected()
+
+    # the attributes are queried once per device
+    channel = TangoChannel("chan", "State", tangoname="bl/mot/1")
+    assert channel.is_connected()
+    assert proxies[0].calls.count("attribute_list_query") == 1
+
+
+def test_device_not_running(proxies):
+    FakeDeviceProxy.running = False
+    with pytest.raises(ConnectionError):
+        TangoChannel("chan", "State", tangoname="bl/mot/1")
+
+    # not kept in the pool: the device is pinged again
+    FakeDeviceProxy.running = True
+    channel = TangoChannel("chan", "State", tangoname="bl/mot/1")
+    assert channel.device is proxies[-1]
+    assert len(proxies) == 2
+
+
+def test_polling_grouped_by_device(proxies):
+    updates = []
+    channels = [
+        TangoChannel(name, name, tangoname="bl/mot/1", polling=20)
+        for name in ["State", "Position", "Status"]
+    ]
+    connect_updates(channels, updates)
+    # another period, another poller
+    slow = TangoChannel("slow", "Position", tangoname="bl/mot/1", polling=10000)
+
+    wait_until(lambda: len(updates) == 3)
+    polling_proxy = channels[0].raw_device
+    assert polling_proxy is slow.raw_device
+    assert polling_proxy is not channels[0].device
+    reads = [call for call in polling_proxy.calls if call[0] == "read_attributes"]
+    # one read per period and device
+    assert ("read_attributes", ("position",)) in reads
+    assert ("read_attributes", ("state", "position", "status")) in reads
+    assert not [call for call in polling_proxy.calls if call[0] == "read_attribute"]
+
+    # only the changed values are emitted
+    polling_proxy.attributes["Position"] = 2.5
+    wait_until(lambda: len(updates) == 4)
+    gevent.sleep(0.1)
+    assert updates[3:] == [("Position", 2.5)]
+
+
+def test_polling_failed_attribute(proxies):
+    updates = []
+    channels = [
+        TangoChannel(name, name, tangoname="bl/mot/1", polling=20)
+        for name in ["State", "Position"]
+    ]
+    connect_updates(channels, updates)
+    wait_until(lambda: len(updates) == 2)
+
+    polling_proxy = channels[0].raw_device
+    del polling_proxy.attributes["Position"]
+    wait_until(lambda: ("Position", None) in updates)
+    polling_proxy.calls.clear()
+    gevent.sleep(0.1)
+
+    # the failed channel is no more polled, the others are
+    assert polling_proxy.calls[-1] == ("read_attributes", ("state",))
+
+
+def test_polling_missing_attribute(proxies):
+    updates = []
+    channels = [
+        TangoChannel(name, name, tangoname="bl/mot/1", polling=20)
+        for name in ["State", "Velocity", "Position"]
+    ]
+    connect_updates(channels, updates)
+
+    # the channel of the missing attribute is not polled with the others
+    assert channels[1].device is None
+    wait_until(lambda: len(updates) == 2)
+    polling_proxy = channels[0].raw_device
+    assert ("read_attributes", ("state", "position")) in polling_proxy.calls
+    assert not [call for call in polling_proxy.calls if "velocity" in call[1]]
+
+
+def test_polling_stopped_without_channels(proxies):
+    channels = [
+        TangoChannel(name, name, tangoname="bl/mot/1", polling=20)
+        for name in ["State", "Position"]
+    ]
+    (device_poller,) = Tango._DevicePoller._device_pollers.values()
+    wait_until(lambda: channels[0].value_time is not None)
+
+    del channels[:]
+    gc.collect()
+    wait_until(lambda: device_poller.poller.is_stopped())
+    assert not Tango._DevicePoller._device_pollers
+
+
+def test_arrays_kept_as_numpy(proxies):
+    updates = []
+    channel = TangoChannel("spectrum", "Spectrum", tangoname="bl/mca/1")
+    list_channel = TangoChannel(
+        "spectrum_list", "Spectrum", tangoname="bl/mca/1", as_list=True
+    )
+    connect_updates([channel, list_channel], updates)
+
+    spectrum = proxies[0].attributes["Spectrum"]
+    channel.update(spectrum)
+    list_channel.update(spectrum)
+    assert updates[0][1] is spectrum
+    assert updates[1][1] == spectrum.tolist()
+    assert channel.get_value(as_list=True) == spectrum.tolist()
+
+
+def test_cached_value(proxies):
+    channel = TangoChannel("position", "Position", tangoname="bl/mot/1", max_age=50)
+    device = proxies[0]
+
+    def reads():
+        return device.calls.count(("read_attribute", "Position"))
+
+    # no value yet: read from the device
+    assert channel.get_value() == 1.5
+    assert reads() == 1
+
+    # an event or polled value is served while it is recent
+    channel.update(2.5)
+    assert channel.get_value() == 2.5
+    assert reads() == 1
+    assert channel.get_value(force=True) == 1.5
+    assert reads() == 2
+
+    gevent.sleep(0.06)
+    device.attributes["Position"] = 3.5
+    assert channel.get_value() == 3.5
+    assert reads() == 3
+
+    # the device is read after a write
+    channel.set_value(4.5)
+    assert channel.get_value() == 4.5
+    assert reads() == 4
+
+    # channels neither polled nor evented read the device by default
+    unpolled = TangoChannel("state", "State", tangoname="bl/mot/1")
+    assert unpolled.max_age == 0
+    unpolled.get_value()
+    unpolled.get_value()
+    assert device.calls.count(("read_attribute", "State")) == 2
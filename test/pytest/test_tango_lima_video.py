@@ -0,0 +1,130 @@
+"""Tests for the TangoLimaVideo frames, with a fake Lima device"""
+
+import io
+import struct
+from types import SimpleNamespace
+
+import numpy
+import pytest
+from PIL import Image
+
+from mxcubecore.HardwareObjects.TangoLimaVideo import (
+    HEADER_FORMAT,
+    TangoLimaVideo,
+)
+
+
+class FakeLimaDevice:
+    def __init__(self, width=8, height=6):
+        self.width = width
+        self.height = height
+        self.frame_number = 0
+        self.image_reads = 0
+        self.calls = 0
+        self.counter_error = False
+
+    def read_attributes(self, names):
+        self.calls += 1
+        return [SimpleNamespace(value=getattr(self, name)) for name in names]
+
+    @property
+    def video_last_image_counter(self):
+        if self.counter_error:
+            raise RuntimeError("video_last_image_counter")
+        return self.frame_number + 100
+
+    @property
+    def video_last_image(self):
+        self.image_reads += 1
+        header = struct.pack(
+            HEADER_FORMAT,
+            0,
+            0,
+            6,
+            self.frame_number,
+            self.width,
+            self.height,
+            0,
+            0,
+            0,
+            0,
+        )
+        pixels = numpy.full(
+            (self.height, self.width, 3), self.frame_number, numpy.uint8
+        )
+        return "VIDEO_IMAGE", header + pixels.tobytes()
+
+
+@pytest.fixture
+def video():
+    video = TangoLimaVideo("video")
+    video.device = FakeLimaDevice()
+    video.video_mode = "RGB24"
+    video._image_counter_exists = True
+    return video
+
+
+def test_get_frame(video):
+    frame = video.get_frame()
+
+    assert (frame.frame_number, frame.width, frame.height) == (0, 8, 6)
+    assert frame.array().shape == (6, 8, 3)
+    # the array shares the device data
+    assert frame.array().base is not None
+    assert video.get_last_image() == (bytes(8 * 6 * 3), 8, 6)
+
+    # unchanged image counter, the image is not read again
+    assert video.get_frame() is frame
+    assert video.get_frame() is frame
+    assert video.device.image_reads == 2
+
+    video.device.frame_number = 1
+    new_frame = video.get_frame()
+    assert new_frame is not frame
+    assert new_frame.array()[0, 0].tolist() == [1, 1, 1]
+
+
+def test_get_frame_round_trips(video):
+    # changing images, the counter and the image are read in one call
+    for frame_number in range(3):
+        video.device.frame_number = frame_number
+        video.get_frame()
+    assert (video.device.calls, video.device.image_reads) == (3, 3)
+
+    # once the image is unchanged, only the counter is read
+    video.get_frame()
+    video.get_frame()
+    video.get_frame()
+    assert (video.device.calls, video.device.image_reads) == (4, 4)
+
+
+def test_get_frame_counter_error(video):
+    frame = video.get_frame()
+    video.device.counter_error = True
+    video.device.frame_number = 1
+    assert video.get_frame().frame_number == 1
+
+    # a failed read does not disable the counter
+    video.device.counter_error = False
+    assert video._image_counter_exists
+    assert video.get_frame().frame_number == 1
+    assert video.get_frame() is not frame
+
+
+def test_get_frame_without_counter(video):
+    video._image_counter_exists = False
+    frame = video.get_frame()
+
+    # same frame number, the frame is not decoded again
+    assert video.get_frame() is frame
+    assert video.device.image_reads == 2
+
+
+def test_encode_once_per_frame(video):
+    frame = video.get_frame()
+    jpeg = video.get_jpeg(quality=70)
+
+    assert video.get_jpeg(quality=70) is jpeg
+    assert video.get_jpeg(quality=90) is not jpeg
+    assert Image.open(io.BytesIO(jpeg)).size == (8, 6)
+    assert frame.encode("PNG") is frame.encode("PNG")